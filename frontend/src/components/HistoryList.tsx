@@ -11,8 +11,11 @@ interface HistoryListProps {
 }
 
 const HistoryList = ({ refreshTrigger }: HistoryListProps) => {
-  const { history, total, isLoading, error, refresh, loadMore } = useHistory(10);
   const [filter, setFilter] = useState<SentimentFilter>('all');
+  const { history, total, totalIsEstimate, hasMore, isLoading, error, refresh, loadMore } = useHistory(
+    10,
+    filter === 'all' ? undefined : filter
+  );
   const [expandedId, setExpandedId] = useState<number | null>(null);
 
   // Refresh when trigger changes
@@ -22,10 +25,6 @@ const HistoryList = ({ refreshTrigger }: HistoryListProps) => {
     }
   }, [refreshTrigger, refresh]);
 
-  const filteredHistory = filter === 'all'
-    ? history
-    : history.filter(item => item.sentiment === filter);
-
   const handleItemClick = (id: number) => {
     setExpandedId(expandedId === id ? null : id);
   };
@@ -55,7 +54,7 @@ const HistoryList = ({ refreshTrigger }: HistoryListProps) => {
           <h3 className="font-semibold text-gray-900">Recent Analyses</h3>
           {total > 0 && (
             <span className="px-2 py-0.5 text-xs bg-gray-100 text-gray-600 rounded-full">
-              {total}
+              {totalIsEstimate ? '~' : ''}{total}
             </span>
           )}
         </div>
@@ -87,7 +86,7 @@ const HistoryList = ({ refreshTrigger }: HistoryListProps) => {
 
       {/* List */}
       <div className="divide-y divide-gray-100">
-        {filteredHistory.length === 0 ? (
+        {history.length === 0 ? (
           <div className="text-center py-12 px-4">
             <History className="w-12 h-12 text-gray-300 mx-auto mb-4" />
             <p className="text-gray-500 mb-2">No analysis history yet</p>
@@ -96,7 +95,7 @@ const HistoryList = ({ refreshTrigger }: HistoryListProps) => {
             </p>
           </div>
         ) : (
-          filteredHistory.map((item: HistoryItem) => (
+          history.map((item: HistoryItem) => (
             <HistoryItemRow
               key={item.id}
               item={item}
@@ -108,7 +107,7 @@ const HistoryList = ({ refreshTrigger }: HistoryListProps) => {
       </div>
 
       {/* Load More */}
-      {history.length < total && (
+      {hasMore && (
         <div className="p-4 border-t border-gray-100">
           <button
             onClick={loadMore}
@@ -116,7 +115,8 @@ const HistoryList = ({ refreshTrigger }: HistoryListProps) => {
             className="w-full flex items-center justify-center gap-2 py-2 text-sm text-blue-600 hover:bg-blue-50 rounded-lg transition-colors disabled:opacity-50"
           >
             <ChevronDown className="w-4 h-4" />
-            Load More ({total - history.length} remaining)
+            Load More
+            {!totalIsEstimate && total > history.length && ` (${total - history.length} remaining)`}
           </button>
         </div>
       )}
@@ -1,56 +1,67 @@
 import { useState, useCallback, useEffect } from 'react';
 import { getHistory } from '../services/api';
-import type { HistoryItem } from '../types';
+import type { HistoryItem, HistoryQuery } from '../types';
 
 interface UseHistoryReturn {
   history: HistoryItem[];
   total: number;
+  totalIsEstimate: boolean;
+  hasMore: boolean;
   isLoading: boolean;
   error: string | null;
   refresh: () => Promise<void>;
   loadMore: () => Promise<void>;
 }
 
-export const useHistory = (initialLimit: number = 10): UseHistoryReturn => {
+export const useHistory = (
+  pageSize: number = 10,
+  sentiment?: HistoryQuery['sentiment']
+): UseHistoryReturn => {
   const [history, setHistory] = useState<HistoryItem[]>([]);
   const [total, setTotal] = useState(0);
-  const [limit, setLimit] = useState(initialLimit);
+  const [totalIsEstimate, setTotalIsEstimate] = useState(false);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
   const [isLoading, setIsLoading] = useState(false);
   const [error, setError] = useState<string | null>(null);
 
-  const fetchHistory = useCallback(async (fetchLimit: number) => {
+  // Fetch one page; without a cursor it starts over from the newest analysis
+  const fetchPage = useCallback(async (before: string | null) => {
     setIsLoading(true);
     setError(null);
 
     try {
-      const response = await getHistory(fetchLimit);
-      setHistory(response.analyses);
+      const response = await getHistory({ limit: pageSize, before, sentiment });
+      setHistory(prev => (before ? [...prev, ...response.analyses] : response.analyses));
       setTotal(response.total);
+      setTotalIsEstimate(response.total_is_estimate);
+      setNextCursor(response.next_cursor);
     } catch (err) {
       const errorMessage = err instanceof Error ? err.message : 'Failed to load history';
       setError(errorMessage);
     } finally {
       setIsLoading(false);
     }
-  }, []);
+  }, [pageSize, sentiment]);
 
   const refresh = useCallback(async () => {
-    await fetchHistory(limit);
-  }, [fetchHistory, limit]);
+    await fetchPage(null);
+  }, [fetchPage]);
 
   const loadMore = useCallback(async () => {
-    const newLimit = limit + 10;
-    setLimit(newLimit);
-    await fetchHistory(newLimit);
-  }, [fetchHistory, limit]);
+    if (nextCursor) {
+      await fetchPage(nextCursor);
+    }
+  }, [fetchPage, nextCursor]);
 
   useEffect(() => {
-    fetchHistory(initialLimit);
-  }, [fetchHistory, initialLimit]);
+    fetchPage(null);
+  }, [fetchPage]);
 
   return {
     history,
     total,
+    totalIsEstimate,
+    hasMore: nextCursor !== null,
     isLoading,
     error,
     refresh,
@@ -1,5 +1,5 @@
 import axios, { type AxiosError } from 'axios';
-import type { SentimentResult, HistoryResponse, CacheStats, ApiError } from '../types';
+import type { SentimentResult, HistoryResponse, HistoryQuery, CacheStats, ApiError } from '../types';
 
 // API base URL - configurable via environment variable
 const API_BASE_URL = import.meta.env.VITE_API_BASE_URL || 'http://localhost:8000';
@@ -38,9 +38,18 @@ export const analyzeSentiment = async (text: string): Promise<SentimentResult> =
   }
 };
 
-export const getHistory = async (limit: number = 10): Promise<HistoryResponse> => {
+export const getHistory = async ({
+  limit = 10,
+  before,
+  sentiment,
+  since,
+  until,
+}: HistoryQuery = {}): Promise<HistoryResponse> => {
   try {
-    const response = await api.get<HistoryResponse>(`/history?limit=${limit}`);
+    // Pass the previous page's next_cursor as `before` to get the next page
+    const response = await api.get<HistoryResponse>('/history', {
+      params: { limit, before: before ?? undefined, sentiment, since, until },
+    });
     return response.data;
   } catch (error) {
     return handleApiError(error as AxiosError<ApiError>);
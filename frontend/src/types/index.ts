@@ -19,9 +19,19 @@ export interface HistoryItem {
 
 export interface HistoryResponse {
   total: number;
+  total_is_estimate: boolean;
+  next_cursor: string | null;
   analyses: HistoryItem[];
 }
 
+export interface HistoryQuery {
+  limit?: number;
+  before?: string | null;
+  sentiment?: 'POSITIVE' | 'NEGATIVE';
+  since?: string;
+  until?: string;
+}
+
 export interface CacheStats {
   status: string;
   total_keys: number;
@@ -0,0 +1,295 @@
+"""
+Admission control and load shedding for model inference
+
+Cache misses wait for the model. When they arrive faster than it can score
+them, the queue keeps growing until answers arrive after the client gave up
+(the frontend waits 10s). Admission control refuses that work up front:
+
+    in flight      - texts admitted and not scored yet
+    predicted wait - texts in flight x recent inference time per text,
+                     or the recent micro-batcher queue wait if longer
+
+Inference time per text comes from every path that runs the model (the
+micro-batcher, batch / stream scoring, long documents and cache warming),
+all recorded in one LatencyRecorder
+
+A new miss is shed (503 + Retry-After) when the predicted wait is above
+ADMISSION_LATENCY_TARGET_MS or ADMISSION_MAX_IN_FLIGHT texts are already in
+flight. Batch / background callers are shed earlier, at ADMISSION_BATCH_SHARE
+of both limits, so interactive requests keep the remaining headroom.
+
+Every request has a deadline (its own deadline_ms, or
+ADMISSION_DEFAULT_DEADLINE_MS). A miss the model can't get to before its
+deadline is refused right away, and one whose deadline passes while it
+waits in the micro-batcher is dropped before the forward pass
+"""
+
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional, Tuple
+
+from . import metrics
+
+# Shed new cache misses when inference is saturated (deadlines are always honored)
+ADMISSION_CONTROL_ENABLED = os.getenv("ADMISSION_CONTROL_ENABLED", "false").lower() == "true"
+
+# Longest predicted wait for the model before new interactive misses are shed
+ADMISSION_LATENCY_TARGET_MS = float(os.getenv("ADMISSION_LATENCY_TARGET_MS", "1000"))
+
+# Most texts waiting for or in inference at once in this worker
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "256"))
+
+# Share of both limits batch-priority callers may use
+ADMISSION_BATCH_SHARE = float(os.getenv("ADMISSION_BATCH_SHARE", "0.5"))
+
+# Deadline of requests that don't send deadline_ms (0 = none); matches the frontend's timeout
+ADMISSION_DEFAULT_DEADLINE_MS = float(os.getenv("ADMISSION_DEFAULT_DEADLINE_MS", "10000"))
+
+# Answer a shed /analyze miss with the text's stored result when the same model analyzed it before
+ADMISSION_DEGRADE = os.getenv("ADMISSION_DEGRADE", "true").lower() == "true"
+
+PRIORITIES = ("interactive", "batch")
+
+# How often a waiting caller retries admission
+_WAIT_POLL_SECONDS = 0.05
+
+# Weight of the latest observation in the recent queue-wait / per-text averages
+_RECENT_WEIGHT = 0.2
+
+
+class OverloadedError(Exception):
+    """Raised when new inference work is shed"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class LatencyRecorder:
+    """
+    Recent queue wait and inference time per text, exponentially weighted
+
+    Shared by everything that runs the model, so the predicted wait sees
+    batch and background inference as well as /analyze
+
+    Usage:
+        started = time.perf_counter()
+        predictions = backend.predict(texts)
+        latency.record_inference(len(texts), time.perf_counter() - started)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wait: Optional[float] = None
+        self._per_text: Optional[float] = None
+
+    @staticmethod
+    def _update(recent: Optional[float], sample: float) -> float:
+        # The first sample is taken as is, instead of ramping up from 0
+        return sample if recent is None else recent + _RECENT_WEIGHT * (sample - recent)
+
+    def record_wait(self, seconds: float):
+        """Record how long a text waited in a queue before its forward pass"""
+        with self._lock:
+            self._wait = self._update(self._wait, seconds)
+
+    def record_inference(self, texts: int, seconds: float):
+        """Record a forward pass (or several) over texts"""
+        if texts <= 0:
+            return
+        with self._lock:
+            self._per_text = self._update(self._per_text, seconds / texts)
+
+    def recent(self) -> Tuple[float, float]:
+        """
+        Recent queue wait and inference time per text
+
+        Returns:
+            (queue wait seconds, seconds per text), 0 before any observation
+        """
+        with self._lock:
+            return self._wait or 0.0, self._per_text or 0.0
+
+
+def deadline_from(deadline_ms: Optional[float] = None) -> Optional[float]:
+    """
+    Absolute deadline for a request that starts now
+
+    Args:
+        deadline_ms: Client budget (default: ADMISSION_DEFAULT_DEADLINE_MS)
+
+    Returns:
+        time.perf_counter() value, or None for no deadline
+    """
+    budget_ms = deadline_ms or ADMISSION_DEFAULT_DEADLINE_MS
+    return time.perf_counter() + budget_ms / 1000 if budget_ms > 0 else None
+
+
+class AdmissionController:
+    """
+    Counts texts in flight and decides whether new ones may run the model
+
+    Usage:
+        admission = AdmissionController(latency)
+        with admission.slot(len(misses), "batch", deadline, timed=True):
+            predictions = backend.predict(misses)
+    """
+
+    def __init__(
+        self,
+        latency: Optional[LatencyRecorder] = None,
+        enabled: bool = ADMISSION_CONTROL_ENABLED,
+        latency_target_ms: float = ADMISSION_LATENCY_TARGET_MS,
+        max_in_flight: int = ADMISSION_MAX_IN_FLIGHT,
+        batch_share: float = ADMISSION_BATCH_SHARE
+    ):
+        self.latency = latency or LatencyRecorder()
+        self.enabled = enabled
+        self.latency_target = latency_target_ms / 1000
+        self.max_in_flight = max(1, max_in_flight)
+        self.batch_share = min(max(batch_share, 0.0), 1.0)
+
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._decisions: Dict[str, Dict[str, int]] = {
+            priority: {"admitted": 0, "shed": 0, "degraded": 0, "expired": 0} for priority in PRIORITIES
+        }
+        self._depth_gauge = metrics.QUEUE_DEPTH.labels("admission")
+
+    def _predicted_wait(self, in_flight: int) -> float:
+        """Seconds a text admitted now would wait for the texts ahead of it"""
+        if in_flight == 0:
+            # Nothing queued: a stale average must not keep shedding
+            return 0.0
+        queue_wait, per_text = self.latency.recent()
+        return max(in_flight * per_text, queue_wait)
+
+    def _refusal(self, texts: int, priority: str, deadline: Optional[float], in_flight: int) -> Optional[str]:
+        """Why texts can't be admitted now, or None"""
+        wait = self._predicted_wait(in_flight)
+        if deadline is not None and time.perf_counter() + wait > deadline:
+            return "deadline would pass before the model gets to this request"
+        if not self.enabled:
+            return None
+
+        share = self.batch_share if priority == "batch" else 1.0
+        if in_flight and in_flight + texts > self.max_in_flight * share:
+            return f"{in_flight} texts already waiting for inference"
+        if wait > self.latency_target * share:
+            return f"predicted inference wait {wait * 1000:.0f} ms is above target"
+        return None
+
+    def admit(self, texts: int = 1, priority: str = "interactive", deadline: Optional[float] = None):
+        """
+        Count texts as in flight, or refuse them
+
+        Every successful admit must be paired with release (see slot)
+
+        Args:
+            texts: Texts about to run through the model
+            priority: "interactive" or "batch"
+            deadline: time.perf_counter() after which the result is useless
+
+        Raises:
+            OverloadedError: If they should not run now
+        """
+        with self._lock:
+            reason = self._refusal(texts, priority, deadline, self._in_flight)
+            if reason is None:
+                self._in_flight += texts
+                self._decisions[priority]["admitted"] += 1
+            else:
+                self._decisions[priority]["shed"] += 1
+            in_flight = self._in_flight
+
+        metrics.count_admission(priority, "admitted" if reason is None else "shed")
+        if reason is not None:
+            raise OverloadedError(f"Overloaded: {reason}", self.retry_after())
+        self._depth_gauge.set(in_flight)
+
+    def release(self, texts: int = 1):
+        """Mark admitted texts as scored (or failed)"""
+        with self._lock:
+            self._in_flight = max(0, self._in_flight - texts)
+            in_flight = self._in_flight
+        self._depth_gauge.set(in_flight)
+
+    @contextmanager
+    def slot(
+        self,
+        texts: int = 1,
+        priority: str = "interactive",
+        deadline: Optional[float] = None,
+        wait: bool = False,
+        timed: bool = False
+    ):
+        """
+        Hold texts in flight for the duration of a block
+
+        Args:
+            texts: Texts about to run through the model
+            priority: "interactive" or "batch"
+            deadline: time.perf_counter() after which the result is useless
+            wait: Block until admitted instead of raising (background jobs
+                without a deadline)
+            timed: The block is the forward pass itself - record its time
+                per text (not for blocks that also wait in the micro-batcher,
+                which records its own)
+
+        Raises:
+            OverloadedError: If they should not run now (and wait is False)
+        """
+        while True:
+            try:
+                self.admit(texts, priority, deadline)
+                break
+            except OverloadedError:
+                if not wait or deadline is not None:
+                    raise
+                time.sleep(_WAIT_POLL_SECONDS)
+        started = time.perf_counter()
+        try:
+            yield
+            if timed:
+                self.latency.record_inference(texts, time.perf_counter() - started)
+        finally:
+            self.release(texts)
+
+    def record(self, priority: str, decision: str):
+        """Count a request answered from stored results ("degraded") or dropped at its deadline ("expired")"""
+        with self._lock:
+            self._decisions[priority][decision] += 1
+        metrics.count_admission(priority, decision)
+
+    def retry_after(self) -> int:
+        """Whole seconds until the texts in flight should have drained"""
+        with self._lock:
+            in_flight = self._in_flight
+        return max(1, math.ceil(self._predicted_wait(in_flight)))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get admission statistics
+
+        Returns:
+            Dict with limits, texts in flight, predicted wait and decisions per priority
+        """
+        queue_wait, per_text = self.latency.recent()
+        with self._lock:
+            in_flight = self._in_flight
+            decisions = {priority: dict(counts) for priority, counts in self._decisions.items()}
+        return {
+            "enabled": self.enabled,
+            "latency_target_ms": self.latency_target * 1000,
+            "max_in_flight": self.max_in_flight,
+            "batch_share": self.batch_share,
+            "default_deadline_ms": ADMISSION_DEFAULT_DEADLINE_MS,
+            "in_flight": in_flight,
+            "predicted_wait_ms": round(self._predicted_wait(in_flight) * 1000, 3),
+            "recent_queue_wait_ms": round(queue_wait * 1000, 3),
+            "recent_per_text_ms": round(per_text * 1000, 3),
+            "decisions": decisions
+        }
@@ -0,0 +1,208 @@
+"""
+Sentiment analytics served from the rollup table
+
+Range queries read sentiment_rollups (one row per bucket and label) instead
+of scanning sentiment_analyses, so their cost depends on the number of
+buckets asked for, not on how many analyses fall in the range
+
+The rollups are maintained by database.save_analyses / copy_analyses;
+rebuild them from the raw table after importing data another way:
+
+Usage:
+    python -m src.analytics --rebuild                      # everything
+    python -m src.analytics --rebuild --since 2025-01-01   # from a date on
+"""
+
+import argparse
+import json
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from sqlalchemy import delete, func, insert, literal, select, text
+from sqlalchemy.orm import Session
+
+from .database import (
+    ROLLUP_GRANULARITIES, SentimentAnalysis, SentimentRollup, bucket_delta, bucket_start, to_utc_naive
+)
+
+# Most buckets one /analytics response may contain
+ANALYTICS_MAX_BUCKETS = int(os.getenv("ANALYTICS_MAX_BUCKETS", "1000"))
+
+# Bucket truncation for the rebuild query (SQLite has no date_trunc)
+# Same text layout SQLAlchemy uses for SQLite DateTime columns
+_SQLITE_BUCKET_FORMATS = {
+    "minute": "%Y-%m-%d %H:%M:00.000000",
+    "hour": "%Y-%m-%d %H:00:00.000000",
+    "day": "%Y-%m-%d 00:00:00.000000"
+}
+
+
+def pick_granularity(since: datetime, until: datetime) -> str:
+    """Finest granularity that covers the range in at most ANALYTICS_MAX_BUCKETS buckets"""
+    for granularity in ROLLUP_GRANULARITIES:
+        if (until - since) / bucket_delta(granularity) <= ANALYTICS_MAX_BUCKETS:
+            return granularity
+    return ROLLUP_GRANULARITIES[-1]
+
+
+def get_analytics(
+    db: Session,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    granularity: Optional[str] = None,
+    sentiment: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Sentiment volume and average confidence per time bucket
+
+    Args:
+        db: Open database session
+        since: Range start (default: 24 hours before until), rounded down to its bucket
+        until: Range end, exclusive (default: now)
+        granularity: "minute", "hour" or "day" (default: finest that fits ANALYTICS_MAX_BUCKETS)
+        sentiment: Only this label
+
+    Returns:
+        Dict with the resolved range and one entry per bucket (empty buckets included)
+
+    Raises:
+        ValueError: If the range is empty or needs too many buckets
+    """
+    until = to_utc_naive(until) if until else datetime.utcnow()
+    since = to_utc_naive(since) if since else until - timedelta(hours=24)
+    if since >= until:
+        raise ValueError("since must be before until")
+
+    granularity = granularity or pick_granularity(since, until)
+    if granularity not in ROLLUP_GRANULARITIES:
+        raise ValueError(f"granularity must be one of {', '.join(ROLLUP_GRANULARITIES)}")
+
+    step = bucket_delta(granularity)
+    first = bucket_start(since, granularity)
+    if (until - first) / step > ANALYTICS_MAX_BUCKETS:
+        raise ValueError(
+            f"Range needs more than {ANALYTICS_MAX_BUCKETS} {granularity} buckets; use a coarser granularity"
+        )
+
+    query = select(
+        SentimentRollup.bucket_start, SentimentRollup.sentiment,
+        SentimentRollup.count, SentimentRollup.confidence_sum
+    ).where(
+        SentimentRollup.granularity == granularity,
+        SentimentRollup.bucket_start >= first,
+        SentimentRollup.bucket_start < until
+    )
+    if sentiment:
+        query = query.where(SentimentRollup.sentiment == sentiment)
+
+    buckets: Dict[datetime, Dict[str, Any]] = {}
+    start = first
+    while start < until:
+        buckets[start] = {"start": start.isoformat(), "count": 0, "avg_confidence": None, "sentiments": {}}
+        start += step
+
+    totals: Dict[str, list] = {}
+    for start, label, count, confidence_sum in db.execute(query):
+        bucket = buckets[start]
+        bucket["sentiments"][label] = {"count": count, "avg_confidence": round(confidence_sum / count, 4)}
+        total = totals.setdefault(label, [0, 0.0])
+        total[0] += count
+        total[1] += confidence_sum
+
+    for bucket in buckets.values():
+        count = sum(s["count"] for s in bucket["sentiments"].values())
+        if count:
+            confidence_sum = sum(s["count"] * s["avg_confidence"] for s in bucket["sentiments"].values())
+            bucket.update({"count": count, "avg_confidence": round(confidence_sum / count, 4)})
+
+    return {
+        "granularity": granularity,
+        "since": first.isoformat(),
+        "until": until.isoformat(),
+        "totals": {
+            label: {"count": count, "avg_confidence": round(confidence_sum / count, 4)}
+            for label, (count, confidence_sum) in sorted(totals.items())
+        },
+        "buckets": list(buckets.values())
+    }
+
+
+def rebuild_rollups(db: Session, since: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    Recompute the rollups from sentiment_analyses with one GROUP BY per granularity
+
+    Args:
+        db: Open database session
+        since: Only rebuild buckets from this day on (default: everything)
+
+    Returns:
+        Dict with rollup rows written per granularity and the time taken
+    """
+    started = time.perf_counter()
+    dialect = db.get_bind().dialect.name
+    if since:
+        since = bucket_start(to_utc_naive(since), "day")
+
+    if dialect == "postgresql":
+        # Writers upsert rollups in the same transaction as their raw rows, so
+        # blocking them here means every raw row is counted exactly once: either
+        # it committed before the lock (and the GROUP BY sees it) or its upsert
+        # runs after the rebuild commits
+        db.execute(text("LOCK TABLE sentiment_rollups IN EXCLUSIVE MODE"))
+
+    clear = delete(SentimentRollup)
+    if since:
+        clear = clear.where(SentimentRollup.bucket_start >= since)
+    db.execute(clear)
+
+    written = {}
+    for granularity in ROLLUP_GRANULARITIES:
+        if dialect == "postgresql":
+            bucket = func.date_trunc(granularity, SentimentAnalysis.created_at)
+        else:
+            bucket = func.strftime(_SQLITE_BUCKET_FORMATS[granularity], SentimentAnalysis.created_at)
+
+        grouped = select(
+            literal(granularity), bucket, SentimentAnalysis.sentiment,
+            func.count(), func.sum(SentimentAnalysis.confidence)
+        ).group_by(bucket, SentimentAnalysis.sentiment)
+        if since:
+            grouped = grouped.where(SentimentAnalysis.created_at >= since)
+
+        result = db.execute(insert(SentimentRollup).from_select(
+            ["granularity", "bucket_start", "sentiment", "count", "confidence_sum"], grouped
+        ))
+        written[granularity] = result.rowcount
+
+    db.commit()
+    return {
+        "since": since.isoformat() if since else None,
+        "rollup_rows": written,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sentiment analytics rollup utilities")
+    parser.add_argument("--rebuild", action="store_true", help="recompute rollups from sentiment_analyses")
+    parser.add_argument("--since", type=datetime.fromisoformat, help="only rebuild from this date on (ISO 8601)")
+    args = parser.parse_args()
+
+    if not args.rebuild:
+        parser.print_help()
+        return
+
+    from .database import SessionLocal, init_db
+
+    init_db()
+    db = SessionLocal()
+    try:
+        print(json.dumps(rebuild_rollups(db, args.since), indent=2))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+"""
+Dynamic micro-batching for model inference
+
+Queues texts from concurrent requests and runs them through the model together
+One padded forward pass per batch instead of one per request
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional
+
+from . import metrics
+from .admission import LatencyRecorder
+
+# Flush a batch once it holds this many texts...
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "16"))
+
+# ...or once the oldest queued text has waited this long
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "5"))
+
+# Max texts waiting for inference before new submissions are rejected
+BATCH_MAX_QUEUE = int(os.getenv("BATCH_MAX_QUEUE", "1024"))
+
+
+class QueueFullError(Exception):
+    """Raised when the inference queue is at capacity"""
+
+
+class DeadlineExceededError(Exception):
+    """Raised for a text whose deadline passed before its batch ran"""
+
+
+def _histogram_bucket(size: int) -> str:
+    """
+    Map a batch size to a power-of-two histogram bucket
+
+    Args:
+        size: Number of texts in the batch
+
+    Returns:
+        Bucket label (e.g., "1", "2", "3-4", "5-8")
+    """
+    if size <= 2:
+        return str(size)
+    upper = 1 << (size - 1).bit_length()
+    return f"{upper // 2 + 1}-{upper}"
+
+
+class _PendingText:
+    """A queued text waiting for its batch to be flushed"""
+
+    __slots__ = ("text", "model", "deadline", "future", "enqueued_at")
+
+    def __init__(self, text: str, model: Optional[str] = None, deadline: Optional[float] = None):
+        self.text = text
+        self.model = model
+        self.deadline = deadline
+        self.future: Future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class MicroBatcher:
+    """
+    Collects texts into batches for a single background inference thread
+
+    A batch is flushed when it reaches max_size ("full") or when the
+    oldest text in it has waited max_wait_ms ("deadline")
+
+    Texts submitted for a specific model run as their own forward pass
+    (predict_fn(texts, model=...)) within the batch. Texts whose deadline
+    passed while queued are dropped before the forward pass
+
+    Usage:
+        batcher = MicroBatcher(run_model)
+        result = batcher.predict("I love this product!")
+    """
+
+    def __init__(
+        self,
+        predict_fn: Callable[[List[str]], List[Dict[str, Any]]],
+        max_size: int = BATCH_MAX_SIZE,
+        max_wait_ms: float = BATCH_MAX_WAIT_MS,
+        max_queue: int = BATCH_MAX_QUEUE,
+        latency: Optional[LatencyRecorder] = None
+    ):
+        self.predict_fn = predict_fn
+        # Queue waits and per-text inference times (shared with admission control)
+        self.latency = latency or LatencyRecorder()
+        self.max_size = max(1, max_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+
+        # Bounded so overload surfaces as QueueFullError instead of unbounded latency
+        self._queue: "queue.Queue[Optional[_PendingText]]" = queue.Queue(max(0, max_queue))
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+
+        self._batches = 0
+        self._items = 0
+        self._errors = 0
+        self._rejected = 0
+        self._expired = 0
+        self._wait_seconds_total = 0.0
+        self._batch_sizes: Dict[str, int] = {}
+        self._flush_reasons: Dict[str, int] = {"full": 0, "deadline": 0}
+        self._depth_gauge = metrics.QUEUE_DEPTH.labels("batcher")
+
+    def start(self):
+        """Start the background batching thread (safe to call multiple times)"""
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="micro-batcher", daemon=True
+                )
+                self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """
+        Stop the background thread after flushing queued texts
+
+        Args:
+            timeout: Seconds to wait for the thread to finish
+        """
+        with self._start_lock:
+            if self._thread is None:
+                return
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def submit(self, text: str, model: Optional[str] = None, deadline: Optional[float] = None) -> Future:
+        """
+        Queue a text for the next batch
+
+        Never blocks, so it is safe to call from the event loop
+        (wrap the returned future with asyncio.wrap_future to await it)
+
+        Args:
+            text: Input text to analyze
+            model: Model id to run it on (None: whatever predict_fn uses by default)
+            deadline: time.perf_counter() after which nobody wants the result
+
+        Returns:
+            Future resolved with this text's result dict (or DeadlineExceededError)
+
+        Raises:
+            QueueFullError: If max_queue texts are already waiting
+        """
+        self.start()
+        pending = _PendingText(text, model, deadline)
+        try:
+            self._queue.put_nowait(pending)
+        except queue.Full:
+            with self._stats_lock:
+                self._rejected += 1
+            raise QueueFullError(f"Inference queue is full ({self._queue.maxsize} texts waiting)")
+        self._depth_gauge.set(self._queue.qsize())
+        return pending.future
+
+    def predict(self, text: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Queue a text and block until its batch has run
+
+        Args:
+            text: Input text to analyze
+            timeout: Max seconds to wait (None waits forever)
+
+        Returns:
+            Model result dict (e.g., {"label": "POSITIVE", "score": 0.99})
+        """
+        return self.submit(text).result(timeout)
+
+    def _collect(self, first: _PendingText) -> tuple:
+        """Gather texts behind `first` until the batch is full or its deadline passes"""
+        batch = [first]
+        deadline = first.enqueued_at + self.max_wait
+
+        while len(batch) < self.max_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining <= 0:
+                    # Deadline passed - still take anything already queued
+                    item = self._queue.get_nowait()
+                else:
+                    item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                return batch, "deadline", False
+
+            if item is None:
+                return batch, "deadline", True
+            batch.append(item)
+
+        return batch, "full", False
+
+    def _run(self):
+        """Background loop: wait for a text, build a batch, run the model"""
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+
+            batch, reason, stopping = self._collect(first)
+            self._flush(batch, reason)
+
+            if stopping:
+                return
+
+    def _flush(self, batch: List[_PendingText], reason: str):
+        """Run one forward pass and resolve every waiting future"""
+        started = time.perf_counter()
+        self._depth_gauge.set(self._queue.qsize())
+        for item in batch:
+            metrics.observe_stage("queue_wait", started - item.enqueued_at)
+
+        # Don't spend the model on answers the client stopped waiting for
+        live = []
+        for item in batch:
+            if item.deadline is not None and item.deadline <= started:
+                item.future.set_exception(DeadlineExceededError("Deadline passed while waiting for inference"))
+            else:
+                live.append(item)
+
+        # One forward pass per model (pinned requests, or a swap in progress)
+        groups: Dict[Optional[str], List[_PendingText]] = {}
+        for item in live:
+            groups.setdefault(item.model, []).append(item)
+
+        failed = False
+        for model, items in groups.items():
+            texts = [item.text for item in items]
+            try:
+                results = self.predict_fn(texts) if model is None else self.predict_fn(texts, model=model)
+                if len(results) != len(items):
+                    # zip would leave the remaining futures unresolved forever
+                    raise RuntimeError(f"Model returned {len(results)} results for {len(items)} texts")
+                for item, result in zip(items, results):
+                    item.future.set_result(result)
+            except Exception as e:
+                for item in items:
+                    item.future.set_exception(e)
+                metrics.count_error("inference")
+                failed = True
+        wait_seconds = sum(started - item.enqueued_at for item in batch)
+        self.latency.record_wait(wait_seconds / len(batch))
+        self.latency.record_inference(len(live), time.perf_counter() - started)
+
+        with self._stats_lock:
+            self._batches += 1
+            self._items += len(batch)
+            self._expired += len(batch) - len(live)
+            self._errors += int(failed)
+            self._wait_seconds_total += wait_seconds
+            bucket = _histogram_bucket(len(batch))
+            self._batch_sizes[bucket] = self._batch_sizes.get(bucket, 0) + 1
+            self._flush_reasons[reason] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get batching statistics for tuning max_size / max_wait_ms
+
+        Returns:
+            Dict with queue depth, batch-size histogram and flush reasons
+        """
+        recent_wait, recent_per_text = self.latency.recent()
+        with self._stats_lock:
+            return {
+                "max_batch_size": self.max_size,
+                "max_wait_ms": self.max_wait * 1000,
+                "queue_depth": self._queue.qsize(),
+                "max_queue": self._queue.maxsize,
+                "rejected": self._rejected,
+                "expired": self._expired,
+                "batches": self._batches,
+                "items": self._items,
+                "errors": self._errors,
+                "avg_batch_size": round(self._items / max(self._batches, 1), 2),
+                "avg_queue_wait_ms": round(
+                    self._wait_seconds_total / max(self._items, 1) * 1000, 3
+                ),
+                "recent_queue_wait_ms": round(recent_wait * 1000, 3),
+                "recent_per_text_ms": round(recent_per_text * 1000, 3),
+                "batch_size_histogram": dict(self._batch_sizes),
+                "flush_reasons": dict(self._flush_reasons)
+            }
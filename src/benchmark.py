@@ -0,0 +1,426 @@
+"""
+Benchmark suite for the model and the API
+
+    model   - inference throughput over a grid of batch sizes and sequence lengths
+              (tokenization and forward pass timed separately)
+    api     - end-to-end /analyze latency percentiles over a grid of concurrency
+              levels and cache-hit ratios. Runs the app in-process against
+              fakeredis and a throwaway SQLite database, so it needs no services;
+              --url benchmarks a running deployment over HTTP instead
+    compare - flag regressions between two result files
+
+Every run writes a JSON result file (environment, configuration, one row
+per case) so runs can be compared; pass --baseline to compare right away.
+The exit status is 1 when a regression beyond the tolerance is found
+
+Usage:
+    python -m src.benchmark model --batch-sizes 1,8,32 --seq-lengths 16,128,512
+    python -m src.benchmark api --concurrency 1,16,64 --hit-ratios 0,0.9 --requests 500
+    python -m src.benchmark api --url http://localhost:8000 --baseline benchmarks/api-baseline.json
+    python -m src.benchmark compare benchmarks/api-baseline.json benchmarks/api-20250101-120000.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from . import inference
+
+# Where result files are written
+BENCHMARK_RESULTS_DIR = os.getenv("BENCHMARK_RESULTS_DIR", "./benchmarks")
+
+# Relative change in a metric that counts as a regression (0.1 = 10% worse)
+BENCHMARK_REGRESSION_TOLERANCE = float(os.getenv("BENCHMARK_REGRESSION_TOLERANCE", "0.1"))
+
+# Texts every cache-hit request is drawn from (warmed before measuring)
+HOT_SET_SIZE = 50
+
+# Fields that identify a case (the rest of a result row are metrics)
+CASE_FIELDS = ("batch_size", "seq_length", "concurrency", "hit_ratio")
+
+# Plain words, one token each for the uncased WordPiece vocabulary
+_WORDS = (
+    "good bad great terrible movie product service staff food price quality "
+    "love hate really very not quite slow fast delivery friendly rude cheap "
+    "broken works fine amazing awful would buy again never recommend"
+).split()
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """
+    Nearest-rank percentile
+
+    Args:
+        values: Samples (need not be sorted)
+        pct: Percentile in 0-100
+
+    Returns:
+        The smallest sample with at least pct% of samples at or below it
+    """
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def _environment() -> Dict[str, Any]:
+    """Details needed to judge whether two runs are comparable"""
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "inference_backend": inference.INFERENCE_BACKEND,
+        "model_name": inference.MODEL_NAME,
+        "inference_threads": inference.INFERENCE_THREADS
+    }
+
+
+def synthetic_text(words: int, rng: random.Random) -> str:
+    """A review-like text of `words` words"""
+    return " ".join(rng.choice(_WORDS) for _ in range(words))
+
+
+def run_model_benchmark(
+    batch_sizes: List[int],
+    seq_lengths: List[int],
+    iterations: int = 10
+) -> List[Dict[str, Any]]:
+    """
+    Measure inference throughput for every batch size x sequence length
+
+    Args:
+        batch_sizes: Texts per predict call
+        seq_lengths: Target tokens per text (including [CLS] / [SEP])
+        iterations: Timed runs per case (after one warm-up run)
+
+    Returns:
+        One result row per case with median tokenize / forward times and texts per second
+    """
+    backend = inference.get_backend()
+    rng = random.Random(0)
+    rows = []
+
+    for seq_length in seq_lengths:
+        seq_length = min(seq_length, backend.max_length)
+        pool = [synthetic_text(max(seq_length - 2, 1), rng) for _ in range(max(batch_sizes))]
+        tokens = [len(ids) for ids in backend.encode(pool)]
+
+        for batch_size in batch_sizes:
+            texts = pool[:batch_size]
+            backend.predict(texts, batch_size=batch_size)
+
+            tokenize_times, forward_times = [], []
+            for _ in range(iterations):
+                started = time.perf_counter()
+                token_ids = backend.encode(texts)
+                encoded = time.perf_counter()
+                backend.predict_token_ids(token_ids, batch_size)
+                tokenize_times.append(encoded - started)
+                forward_times.append(time.perf_counter() - encoded)
+
+            tokenize_s = statistics.median(tokenize_times)
+            forward_s = statistics.median(forward_times)
+            rows.append({
+                "batch_size": batch_size,
+                "seq_length": seq_length,
+                "avg_tokens": round(statistics.mean(tokens[:batch_size]), 1),
+                "tokenize_ms": round(tokenize_s * 1000, 3),
+                "forward_ms": round(forward_s * 1000, 3),
+                "texts_per_second": round(batch_size / (tokenize_s + forward_s), 1)
+            })
+            print(f"batch={batch_size:<4} seq={seq_length:<4} {rows[-1]['texts_per_second']:>9.1f} texts/s "
+                  f"(tokenize {rows[-1]['tokenize_ms']} ms, forward {rows[-1]['forward_ms']} ms)")
+
+    return rows
+
+
+def _use_offline_services() -> str:
+    """
+    Point the app at a throwaway SQLite file and fakeredis
+
+    Must run before src.main / src.database are imported
+
+    Returns:
+        Path of the SQLite database
+    """
+    db_path = os.path.join(tempfile.mkdtemp(prefix="sentiment-bench-"), "benchmark.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ.pop("ASYNC_DATABASE_URL", None)
+
+    import fakeredis
+    from . import cache
+
+    server = fakeredis.FakeServer()
+    cache.redis_client = fakeredis.FakeRedis(server=server)
+    cache.async_redis_client = fakeredis.FakeAsyncRedis(server=server)
+    return db_path
+
+
+def _request_texts(requests: int, hit_ratio: float, hot_set: List[str], rng: random.Random) -> List[str]:
+    """Request bodies with exactly round(requests * hit_ratio) drawn from the (pre-warmed) hot set"""
+    hits = round(requests * hit_ratio)
+    run_id = uuid.uuid4().hex[:8]
+    texts = [rng.choice(hot_set) for _ in range(hits)]
+    texts += [f"{synthetic_text(12, rng)} {run_id}-{i}" for i in range(requests - hits)]
+    rng.shuffle(texts)
+    return texts
+
+
+async def _run_case(client, texts: List[str], concurrency: int) -> Dict[str, Any]:
+    """Send texts with `concurrency` requests in flight and collect latency stats"""
+    latencies: List[float] = []
+    errors = 0
+    cached = 0
+    next_index = 0
+
+    async def worker():
+        nonlocal errors, cached, next_index
+        while next_index < len(texts):
+            text = texts[next_index]
+            next_index += 1
+            started = time.perf_counter()
+            try:
+                response = await client.post("/analyze", json={"text": text})
+                ok = response.status_code == 200
+            except Exception:
+                ok = False
+            latencies.append(time.perf_counter() - started)
+            if ok:
+                cached += response.json()["cached"]
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies_ms = [latency * 1000 for latency in latencies]
+    return {
+        "requests": len(texts),
+        "errors": errors,
+        "observed_hit_ratio": round(cached / max(len(texts) - errors, 1), 3),
+        "p50_ms": round(percentile(latencies_ms, 50), 3),
+        "p90_ms": round(percentile(latencies_ms, 90), 3),
+        "p95_ms": round(percentile(latencies_ms, 95), 3),
+        "p99_ms": round(percentile(latencies_ms, 99), 3),
+        "max_ms": round(max(latencies_ms), 3),
+        "requests_per_second": round(len(texts) / elapsed, 1)
+    }
+
+
+async def run_api_benchmark(
+    concurrency_levels: List[int],
+    hit_ratios: List[float],
+    requests: int = 200,
+    url: Optional[str] = None,
+    ready_timeout: float = 300.0
+) -> List[Dict[str, Any]]:
+    """
+    Measure /analyze latency for every concurrency level x cache-hit ratio
+
+    Args:
+        concurrency_levels: Requests kept in flight
+        hit_ratios: Share of requests (0-1) for texts that are already cached
+        requests: Requests per case
+        url: Benchmark a running server instead of the in-process app
+        ready_timeout: Seconds to wait for the model to load
+
+    Returns:
+        One result row per case with latency percentiles and throughput
+    """
+    import httpx
+
+    app = None
+    if url:
+        client = httpx.AsyncClient(base_url=url, timeout=60.0)
+    else:
+        _use_offline_services()
+        from .main import app
+
+        await app.router.startup()
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark", timeout=60.0)
+
+    rng = random.Random(0)
+    rows = []
+    try:
+        deadline = time.monotonic() + ready_timeout
+        while (await client.get("/ready")).status_code != 200:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"API not ready after {ready_timeout}s")
+            await asyncio.sleep(0.5)
+
+        hot_set = [f"{synthetic_text(12, rng)} hot-{i}" for i in range(HOT_SET_SIZE)]
+        for text in hot_set:
+            await client.post("/analyze", json={"text": text})
+
+        for concurrency in concurrency_levels:
+            for hit_ratio in hit_ratios:
+                texts = _request_texts(requests, hit_ratio, hot_set, rng)
+                row = {"concurrency": concurrency, "hit_ratio": hit_ratio, **await _run_case(client, texts, concurrency)}
+                rows.append(row)
+                print(f"concurrency={concurrency:<4} hit_ratio={hit_ratio:<4} p50 {row['p50_ms']} ms  "
+                      f"p99 {row['p99_ms']} ms  {row['requests_per_second']} req/s  errors {row['errors']}")
+    finally:
+        await client.aclose()
+        if app is not None:
+            await app.router.shutdown()
+
+    return rows
+
+
+def _metric_direction(name: str) -> Optional[int]:
+    """+1 if higher is better, -1 if lower is better, None if not compared"""
+    if name.endswith("_per_second"):
+        return 1
+    if name.endswith("_ms") or name == "errors":
+        return -1
+    return None
+
+
+def compare_results(
+    baseline: Dict[str, Any],
+    current: Dict[str, Any],
+    tolerance: float = BENCHMARK_REGRESSION_TOLERANCE
+) -> Dict[str, Any]:
+    """
+    Compare two result files case by case
+
+    Args:
+        baseline: Earlier result file contents
+        current: New result file contents
+        tolerance: Relative change allowed before a metric counts as regressed
+
+    Returns:
+        Dict with every compared metric's change and the list of regressions
+    """
+    def case_key(row):
+        return tuple((field, row[field]) for field in CASE_FIELDS if field in row)
+
+    baseline_rows = {case_key(row): row for row in baseline["results"]}
+    changes, regressions = [], []
+
+    for row in current["results"]:
+        key = case_key(row)
+        before = baseline_rows.get(key)
+        if before is None:
+            continue
+
+        for metric, value in row.items():
+            direction = _metric_direction(metric)
+            if direction is None or metric not in before:
+                continue
+            old = before[metric]
+            # Relative change, signed so that positive always means "worse"
+            worse_by = (old - value) / old * direction if old else float(value > 0) * -direction
+            change = {"case": dict(key), "metric": metric, "baseline": old, "current": value,
+                      "worse_by": round(worse_by, 4)}
+            changes.append(change)
+            if worse_by > tolerance:
+                regressions.append(change)
+
+    return {"tolerance": tolerance, "compared": len(changes), "regressions": regressions, "changes": changes}
+
+
+def write_results(kind: str, config: Dict[str, Any], rows: List[Dict[str, Any]], output: Optional[str]) -> Dict[str, Any]:
+    """
+    Save a run as JSON
+
+    Args:
+        kind: "model" or "api"
+        config: Arguments the run used
+        rows: Result rows
+        output: File path (default: BENCHMARK_RESULTS_DIR/<kind>-<timestamp>.json)
+
+    Returns:
+        The saved document
+    """
+    document = {
+        "kind": kind,
+        "created_at": datetime.utcnow().isoformat(),
+        "environment": _environment(),
+        "config": config,
+        "results": rows
+    }
+    path = Path(output or Path(BENCHMARK_RESULTS_DIR) / f"{kind}-{datetime.utcnow():%Y%m%d-%H%M%S}.json")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(document, indent=2))
+    print(f"Results written to {path}")
+    return document
+
+
+def _report(comparison: Dict[str, Any]) -> int:
+    """Print regressions and return the exit status"""
+    for change in comparison["regressions"]:
+        print(f"REGRESSION {change['case']} {change['metric']}: "
+              f"{change['baseline']} -> {change['current']} ({change['worse_by']:+.1%})")
+    print(f"{comparison['compared']} metrics compared, {len(comparison['regressions'])} regressed "
+          f"beyond {comparison['tolerance']:.0%}")
+    return 1 if comparison["regressions"] else 0
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(",")]
+
+
+def _float_list(value: str) -> List[float]:
+    return [float(item) for item in value.split(",")]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Model and API benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    model = commands.add_parser("model", help="inference throughput by batch size and sequence length")
+    model.add_argument("--batch-sizes", type=_int_list, default=[1, 8, 32])
+    model.add_argument("--seq-lengths", type=_int_list, default=[16, 64, 128, 512])
+    model.add_argument("--iterations", type=int, default=10, help="timed runs per case")
+
+    api = commands.add_parser("api", help="/analyze latency by concurrency and cache-hit ratio")
+    api.add_argument("--concurrency", type=_int_list, default=[1, 8, 32])
+    api.add_argument("--hit-ratios", type=_float_list, default=[0.0, 0.5, 0.9])
+    api.add_argument("--requests", type=int, default=200, help="requests per case")
+    api.add_argument("--url", help="benchmark a running server instead of the in-process app")
+
+    for command in (model, api):
+        command.add_argument("--output", help="result file (default: BENCHMARK_RESULTS_DIR/<kind>-<timestamp>.json)")
+        command.add_argument("--baseline", help="result file to compare against")
+        command.add_argument("--tolerance", type=float, default=BENCHMARK_REGRESSION_TOLERANCE)
+
+    compare = commands.add_parser("compare", help="flag regressions between two result files")
+    compare.add_argument("baseline")
+    compare.add_argument("current")
+    compare.add_argument("--tolerance", type=float, default=BENCHMARK_REGRESSION_TOLERANCE)
+
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        baseline = json.loads(Path(args.baseline).read_text())
+        current = json.loads(Path(args.current).read_text())
+        return _report(compare_results(baseline, current, args.tolerance))
+
+    if args.command == "model":
+        config = {"batch_sizes": args.batch_sizes, "seq_lengths": args.seq_lengths, "iterations": args.iterations}
+        rows = run_model_benchmark(args.batch_sizes, args.seq_lengths, args.iterations)
+    else:
+        config = {"concurrency": args.concurrency, "hit_ratios": args.hit_ratios,
+                  "requests": args.requests, "url": args.url}
+        rows = asyncio.run(run_api_benchmark(args.concurrency, args.hit_ratios, args.requests, args.url))
+
+    document = write_results(args.command, config, rows, args.output)
+    if args.baseline:
+        return _report(compare_results(json.loads(Path(args.baseline).read_text()), document, args.tolerance))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,98 +3,507 @@ Redis cache layer for sentiment analysis API
 
 Caches ML inference results to avoid redundant model calls
 Uses Redis for sub-millisecond lookup times
+
+Two tiers:
+    L1 - small in-process LRU of parsed result dicts (no network, no decoding)
+    L2 - Redis, shared by every worker
+
+Redis values use a compact binary format (see encode_result)
 """
 
 import redis
+import redis.asyncio
 import hashlib
 import json
+import logging
 import os
-from typing import Optional, Dict, Any
+import struct
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List, Tuple
+
+from . import metrics
+from .logs import get_logger, log_event
+from .registry import active_model_id
 
 # Get Redis URL from environment variable
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
 
 # Create Redis client
-# decode_responses=True converts bytes to strings automatically
-redis_client = redis.from_url(REDIS_URL, decode_responses=True)
+# decode_responses=False: cached values are binary, so we get raw bytes back
+redis_client = redis.from_url(REDIS_URL, decode_responses=False)
+
+# Async client for the request hot path (runs on the event loop, no threads)
+async_redis_client = redis.asyncio.from_url(REDIS_URL, decode_responses=False)
 
 # Cache TTL (Time To Live) - how long to keep cached results
 CACHE_TTL_SECONDS = 3600  # 1 hour
 
+# In-process L1 cache size and TTL (kept short to bound staleness across workers)
+L1_CACHE_MAX_ENTRIES = int(os.getenv("L1_CACHE_MAX_ENTRIES", "10000"))
+L1_CACHE_TTL_SECONDS = float(os.getenv("L1_CACHE_TTL_SECONDS", "60"))
+
+# Pub/sub channel used to tell every worker to drop its L1 cache
+INVALIDATION_CHANNEL = "sentiment:invalidate"
+
+# Cache generation: every key embeds it, so bumping it empties the cache in O(1)
+GENERATION_KEY = "sentiment:generation"
+
+# How often each worker re-reads the generation (clears also push it via pub/sub)
+GENERATION_REFRESH_SECONDS = 5.0
+
+# Entry counts are kept in per-minute write buckets that expire with the entries
+COUNT_BUCKET_SECONDS = 60
+
+# Old-generation keys are removed in the background with SCAN + UNLINK in chunks
+SWEEP_CHUNK_SIZE = 500
+
+# Compact value format v1:
+#   version (u8) | label id (u8) | confidence (float32) | model tag length (u8) | model tag
+# 7 bytes + tag, versus ~150-700 bytes for the JSON of the full response
+VALUE_FORMAT_V1 = 1
+_VALUE_HEADER = struct.Struct("<BBfB")
+
+# Label <-> byte mapping (labels outside it fall back to JSON)
+LABEL_IDS = {"NEGATIVE": 0, "POSITIVE": 1}
+LABELS_BY_ID = {label_id: label for label, label_id in LABEL_IDS.items()}
+
+
+logger = get_logger("cache")
+
+
+def _report_error(operation: str, error: Exception):
+    """Count and log a Redis failure (the caller degrades to a cache miss)"""
+    metrics.count_error("cache")
+    log_event(logger, "cache_error", logging.WARNING, operation=operation, error=str(error))
+
+
+def encode_result(result: Dict[str, Any]) -> bytes:
+    """
+    Encode a result into the compact cache format
+
+    Only label, confidence and model tag are stored - the text is
+    identified by the key, and processing_time_ms / cached are
+    recomputed on every hit
+
+    Args:
+        result: Response dict with sentiment, confidence and optional model
+
+    Returns:
+        Encoded bytes
+    """
+    label_id = LABEL_IDS.get(result["sentiment"])
+    model_tag = str(result.get("model", "")).encode()
+
+    if label_id is None or len(model_tag) > 255:
+        # Label without a byte id (or an oversized tag) - store the JSON of the result
+        return json.dumps(result).encode()
+
+    return _VALUE_HEADER.pack(VALUE_FORMAT_V1, label_id, result["confidence"], len(model_tag)) + model_tag
+
+
+def decode_result(data: bytes, text: str) -> Dict[str, Any]:
+    """
+    Decode a cached value (compact, or the JSON encode_result falls back to) into a response dict
+
+    Args:
+        data: Raw value from Redis
+        text: Input text the key was generated from
+
+    Returns:
+        Result dict with text, sentiment, confidence, model,
+        processing_time_ms and cached
+    """
+    if data[:1] == b"{":
+        # encode_result's fallback for labels outside LABEL_IDS
+        result = json.loads(data)
+        result.setdefault("text", text)
+        return result
+
+    version, label_id, confidence, tag_length = _VALUE_HEADER.unpack_from(data)
+    if version != VALUE_FORMAT_V1:
+        raise ValueError(f"Unknown cache value format: {version}")
+
+    return {
+        "text": text,
+        "sentiment": LABELS_BY_ID[label_id],
+        # float32 -> back to the 4 decimals the API returns
+        "confidence": round(confidence, 4),
+        "model": data[_VALUE_HEADER.size:_VALUE_HEADER.size + tag_length].decode(),
+        "processing_time_ms": 0,
+        "cached": True
+    }
+
+
+class LocalCache:
+    """
+    Thread-safe LRU cache with a per-entry TTL
+
+    Stores parsed result dicts keyed by generate_cache_key(text)
+    Returns copies so callers can modify results freely
+    """
+
+    def __init__(self, max_entries: int = L1_CACHE_MAX_ENTRIES, ttl_seconds: float = L1_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return a copy of the cached dict, or None if missing or expired"""
+        if self.max_entries <= 0:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return dict(value)
+
+    def set(self, key: str, value: Dict[str, Any]):
+        """Store a copy of value, evicting the least recently used entry if full"""
+        if self.max_entries <= 0:
+            return
+
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, dict(value))
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Drop every entry"""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
 
-def generate_cache_key(text: str) -> str:
+
+local_cache = LocalCache()
+
+# Per-tier hit/miss counters for this worker
+_tier_stats = {"l1_hits": 0, "l1_misses": 0, "redis_hits": 0, "redis_misses": 0}
+_tier_stats_lock = threading.Lock()
+
+
+def _count(**deltas: int):
+    """Add to the per-tier counters"""
+    with _tier_stats_lock:
+        for name, delta in deltas.items():
+            _tier_stats[name] += delta
+
+
+_generation: Optional[int] = None
+_generation_loaded_at = 0.0
+
+
+def _set_generation(generation: int):
+    """Remember the current generation (drops L1 if it changed)"""
+    global _generation, _generation_loaded_at
+
+    if _generation is not None and generation != _generation:
+        local_cache.clear()
+    _generation = generation
+    _generation_loaded_at = time.monotonic()
+
+
+def refresh_generation() -> int:
+    """
+    Re-read the cache generation from Redis
+
+    Returns:
+        Current generation (0 if never cleared or Redis is unavailable)
+    """
+    try:
+        _set_generation(int(redis_client.get(GENERATION_KEY) or 0))
+    except Exception as e:
+        _report_error("generation", e)
+        if _generation is None:
+            _set_generation(0)
+    return _generation
+
+
+def current_generation() -> int:
+    """
+    Get the cache generation without a Redis round trip
+
+    Loaded once on first use, then kept fresh by the listener thread
+    """
+    if _generation is None:
+        return refresh_generation()
+    return _generation
+
+
+def generate_cache_key(text: str, model: Optional[str] = None) -> str:
     """
     Generate a unique cache key for the input text
     
     Uses SHA-256 hash to create consistent keys
-    Same text always generates same key
+    Same text always generates same key (within a cache generation and model)
     
     Args:
         text: Input text to analyze
+        model: Model id whose result the key holds (default: the active model)
         
     Returns:
-        Cache key string (e.g., "sentiment:abc123...")
+        Cache key string (e.g., "sentiment:0:distilbert-sst2:abc123...")
     """
     # Create hash of the text (consistent for same input)
     text_hash = hashlib.sha256(text.encode()).hexdigest()[:16]
-    return f"sentiment:{text_hash}"
+    return f"sentiment:{current_generation()}:{model or active_model_id()}:{text_hash}"
+
+
+def _count_bucket_key(generation: int, bucket: int) -> str:
+    return f"sentiment:{generation}:count:{bucket}"
 
 
-def get_cached_result(text: str) -> Optional[Dict[str, Any]]:
+def _add_write_count(pipe, count: int):
+    """
+    Queue an increment of this minute's write counter on a pipeline
+
+    Entries are only written on cache misses, so the writes in the last
+    CACHE_TTL_SECONDS approximate the live entry count without scanning
+    """
+    bucket_key = _count_bucket_key(current_generation(), int(time.time() // COUNT_BUCKET_SECONDS))
+    pipe.incrby(bucket_key, count)
+    pipe.expire(bucket_key, CACHE_TTL_SECONDS + COUNT_BUCKET_SECONDS)
+
+
+def get_cached_result(text: str, model: Optional[str] = None) -> Optional[Dict[str, Any]]:
     """
     Retrieve cached sentiment analysis result
     
     Args:
         text: Input text to look up
+        model: Model id namespace (default: the active model)
         
     Returns:
         Cached result dict if found, None if cache miss
     """
     try:
-        cache_key = generate_cache_key(text)
+        cache_key = generate_cache_key(text, model)
+
+        # L1: already-parsed dict in this process
+        local_result = local_cache.get(cache_key)
+        if local_result:
+            _count(l1_hits=1)
+            return local_result
+
         cached_data = redis_client.get(cache_key)
         
         if cached_data:
-            # Parse JSON string back to dict
-            return json.loads(cached_data)
+            # Decode bytes back to dict
+            result = decode_result(cached_data, text)
+            local_cache.set(cache_key, result)
+            _count(l1_misses=1, redis_hits=1)
+            return result
         
+        _count(l1_misses=1, redis_misses=1)
         return None
     except Exception as e:
         # If Redis fails, log but don't crash
-        print(f"Cache retrieval error: {e}")
+        _report_error("get", e)
         return None
 
 
-def cache_result(text: str, result: Dict[str, Any]) -> bool:
+def cache_result(text: str, result: Dict[str, Any], model: Optional[str] = None) -> bool:
     """
     Store sentiment analysis result in cache
     
     Args:
         text: Input text that was analyzed
         result: Analysis result to cache
+        model: Model id that produced it (default: the active model)
         
     Returns:
         True if cached successfully, False otherwise
     """
     try:
-        cache_key = generate_cache_key(text)
+        cache_key = generate_cache_key(text, model)
         
-        # Convert dict to JSON string
-        result_json = json.dumps(result)
+        # Convert dict to compact bytes
+        result_bytes = encode_result(result)
         
-        # Store in Redis with TTL
-        redis_client.setex(
+        # Store in Redis with TTL (plus the entry counter, same round trip)
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.setex(
             cache_key,
             CACHE_TTL_SECONDS,
-            result_json
+            result_bytes
         )
+        _add_write_count(pipe, 1)
+        pipe.execute()
+        local_cache.set(cache_key, result)
         
         return True
     except Exception as e:
-        print(f"Cache storage error: {e}")
+        _report_error("set", e)
         return False
 
 
+async def get_cached_result_async(text: str, model: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Async version of get_cached_result for use on the event loop
+
+    Args:
+        text: Input text to look up
+        model: Model id namespace (default: the active model)
+
+    Returns:
+        Cached result dict if found, None if cache miss
+    """
+    try:
+        cache_key = generate_cache_key(text, model)
+
+        local_result = local_cache.get(cache_key)
+        if local_result:
+            _count(l1_hits=1)
+            return local_result
+
+        cached_data = await async_redis_client.get(cache_key)
+
+        if cached_data:
+            result = decode_result(cached_data, text)
+            local_cache.set(cache_key, result)
+            _count(l1_misses=1, redis_hits=1)
+            return result
+
+        _count(l1_misses=1, redis_misses=1)
+        return None
+    except Exception as e:
+        _report_error("get", e)
+        return None
+
+
+async def cache_result_async(text: str, result: Dict[str, Any], model: Optional[str] = None) -> bool:
+    """
+    Async version of cache_result for use on the event loop
+
+    Args:
+        text: Input text that was analyzed
+        result: Analysis result to cache
+        model: Model id that produced it (default: the active model)
+
+    Returns:
+        True if cached successfully, False otherwise
+    """
+    try:
+        cache_key = generate_cache_key(text, model)
+        pipe = async_redis_client.pipeline(transaction=False)
+        pipe.setex(
+            cache_key,
+            CACHE_TTL_SECONDS,
+            encode_result(result)
+        )
+        _add_write_count(pipe, 1)
+        await pipe.execute()
+        local_cache.set(cache_key, result)
+
+        return True
+    except Exception as e:
+        _report_error("set", e)
+        return False
+
+
+def get_cached_results(texts: List[str], model: Optional[str] = None) -> List[Optional[Dict[str, Any]]]:
+    """
+    Retrieve cached results for many texts with a single MGET
+
+    Args:
+        texts: Input texts to look up
+        model: Model id namespace (default: the active model)
+
+    Returns:
+        List aligned with texts: cached result dict, or None on a miss
+    """
+    if not texts:
+        return []
+
+    try:
+        cache_keys = [generate_cache_key(text, model) for text in texts]
+        results = [local_cache.get(key) for key in cache_keys]
+
+        # Only go to Redis for keys L1 doesn't have
+        missing = [i for i, result in enumerate(results) if result is None]
+        _count(l1_hits=len(texts) - len(missing), l1_misses=len(missing))
+
+        if missing:
+            cached_data = redis_client.mget([cache_keys[i] for i in missing])
+            for i, data in zip(missing, cached_data):
+                if data:
+                    results[i] = decode_result(data, texts[i])
+                    local_cache.set(cache_keys[i], results[i])
+            redis_hits = sum(1 for i in missing if results[i] is not None)
+            _count(redis_hits=redis_hits, redis_misses=len(missing) - redis_hits)
+
+        return results
+    except Exception as e:
+        _report_error("get_many", e)
+        return [None] * len(texts)
+
+
+def cache_results(items: List[Tuple[str, Dict[str, Any]]], model: Optional[str] = None) -> bool:
+    """
+    Store many results in one round trip using a pipelined SETEX
+
+    Args:
+        items: (text, result) pairs to cache
+        model: Model id that produced them (default: the active model)
+
+    Returns:
+        True if cached successfully, False otherwise
+    """
+    if not items:
+        return True
+
+    try:
+        # transaction=False: plain pipelining, no MULTI/EXEC overhead
+        pipe = redis_client.pipeline(transaction=False)
+        for text, result in items:
+            cache_key = generate_cache_key(text, model)
+            pipe.setex(cache_key, CACHE_TTL_SECONDS, encode_result(result))
+            local_cache.set(cache_key, result)
+        _add_write_count(pipe, len(items))
+        pipe.execute()
+
+        return True
+    except Exception as e:
+        _report_error("set_many", e)
+        return False
+
+
+def get_tier_stats() -> Dict[str, Any]:
+    """
+    Get per-tier hit/miss counters for this worker
+
+    Returns:
+        Dict with L1 and Redis hits/misses, L1 size and hit rate
+    """
+    with _tier_stats_lock:
+        stats = dict(_tier_stats)
+
+    lookups = stats["l1_hits"] + stats["l1_misses"]
+    stats.update({
+        "l1_entries": len(local_cache),
+        "l1_max_entries": local_cache.max_entries,
+        "l1_evictions": local_cache.evictions,
+        "l1_hit_rate": round(stats["l1_hits"] / max(lookups, 1) * 100, 2)
+    })
+    return stats
+
+
 def get_cache_stats() -> Dict[str, Any]:
     """
     Get Redis cache statistics
@@ -106,8 +515,9 @@ def get_cache_stats() -> Dict[str, Any]:
         info = redis_client.info("stats")
         memory = redis_client.info("memory")
         
-        # Count sentiment-related keys
-        sentiment_keys = len(redis_client.keys("sentiment:*"))
+        # Approximate live entries from the per-minute write counters
+        # (constant cost - never scans the keyspace)
+        sentiment_keys = count_cached_entries()
         
         return {
             "status": "connected",
@@ -120,7 +530,9 @@ def get_cache_stats() -> Dict[str, Any]:
                 info.get("keyspace_hits", 0) / 
                 max(info.get("keyspace_hits", 0) + info.get("keyspace_misses", 0), 1) * 100,
                 2
-            )
+            ),
+            "generation": current_generation(),
+            "tiers": get_tier_stats()
         }
     except Exception as e:
         return {
@@ -129,23 +541,155 @@ def get_cache_stats() -> Dict[str, Any]:
         }
 
 
+def count_cached_entries() -> int:
+    """
+    Approximate number of live entries in the current generation
+
+    Sums the per-minute write counters covering the last CACHE_TTL_SECONDS
+    One MGET of ~60 small keys, regardless of cache size
+
+    Returns:
+        Approximate entry count (ignores early LRU evictions)
+    """
+    generation = current_generation()
+    now_bucket = int(time.time() // COUNT_BUCKET_SECONDS)
+    window = CACHE_TTL_SECONDS // COUNT_BUCKET_SECONDS + 1
+    bucket_keys = [_count_bucket_key(generation, now_bucket - i) for i in range(window)]
+
+    return sum(int(count) for count in redis_client.mget(bucket_keys) if count)
+
+
 def clear_cache() -> bool:
     """
     Clear all sentiment cache entries
     
     WARNING: This removes all cached results
+
+    Constant cost: bumps the cache generation so every existing key is
+    instantly unreachable, then removes the old keys in the background
+    with SCAN + UNLINK in small chunks
     
     Returns:
         True if cleared successfully
     """
     try:
-        # Get all sentiment keys
-        keys = redis_client.keys("sentiment:*")
-        
-        if keys:
-            redis_client.delete(*keys)
+        new_generation = int(redis_client.incr(GENERATION_KEY))
+        _set_generation(new_generation)
+
+        # Drop L1 here and tell every other worker to drop theirs
+        local_cache.clear()
+        redis_client.publish(INVALIDATION_CHANNEL, str(new_generation))
+
+        threading.Thread(
+            target=sweep_old_generations,
+            args=(new_generation,),
+            name="cache-sweep",
+            daemon=True
+        ).start()
         
         return True
     except Exception as e:
-        print(f"Cache clear error: {e}")
-        return False
\ No newline at end of file
+        _report_error("clear", e)
+        return False
+
+
+def _is_stale_key(key: str, generation: int) -> bool:
+    """True for entries/counters from an older generation (or pre-generation keys)"""
+    parts = key.split(":")
+    if key == GENERATION_KEY or len(parts) < 2:
+        return False
+    if len(parts) == 2:
+        # Legacy "sentiment:<hash>" key from before generations
+        return len(parts[1]) == 16 and all(c in "0123456789abcdef" for c in parts[1])
+    return parts[1].isdigit() and int(parts[1]) < generation
+
+
+def sweep_old_generations(generation: int) -> int:
+    """
+    Remove keys from generations older than `generation`
+
+    Uses incremental SCAN and non-blocking UNLINK in chunks, so Redis
+    stays responsive however many keys there are
+
+    Args:
+        generation: The current generation (its keys are kept)
+
+    Returns:
+        Number of keys unlinked
+    """
+    removed = 0
+    chunk = []
+
+    try:
+        for key in redis_client.scan_iter(match="sentiment:*", count=SWEEP_CHUNK_SIZE):
+            if _is_stale_key(key.decode(), generation):
+                chunk.append(key)
+            if len(chunk) >= SWEEP_CHUNK_SIZE:
+                removed += redis_client.unlink(*chunk)
+                chunk = []
+        if chunk:
+            removed += redis_client.unlink(*chunk)
+    except Exception as e:
+        _report_error("sweep", e)
+
+    return removed
+
+
+# L1 invalidation listener (one background thread per worker)
+_listener_thread: Optional[threading.Thread] = None
+_listener_stop = threading.Event()
+
+
+def _listen_for_invalidations():
+    """Clear L1 whenever any worker publishes on INVALIDATION_CHANNEL"""
+    while not _listener_stop.is_set():
+        try:
+            pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(INVALIDATION_CHANNEL)
+            try:
+                while not _listener_stop.is_set():
+                    # Short timeout so stop requests are noticed promptly
+                    message = pubsub.get_message(timeout=1.0)
+                    if message and message.get("type") == "message":
+                        local_cache.clear()
+                        data = message.get("data", b"")
+                        if isinstance(data, bytes) and data.isdigit():
+                            _set_generation(int(data))
+
+                    # Fallback in case a generation bump was missed
+                    if time.monotonic() - _generation_loaded_at > GENERATION_REFRESH_SECONDS:
+                        refresh_generation()
+            finally:
+                pubsub.close()
+        except Exception as e:
+            _report_error("invalidation_listener", e)
+            # Invalidations may have been missed while disconnected
+            local_cache.clear()
+            _listener_stop.wait(1.0)
+
+
+def start_invalidation_listener():
+    """
+    Load the cache generation and start the listener thread
+
+    The thread clears L1 and tracks generation bumps (safe to call multiple times)
+    """
+    global _listener_thread
+
+    refresh_generation()
+    if _listener_thread is None or not _listener_thread.is_alive():
+        _listener_stop.clear()
+        _listener_thread = threading.Thread(
+            target=_listen_for_invalidations, name="cache-invalidation", daemon=True
+        )
+        _listener_thread.start()
+
+
+def stop_invalidation_listener():
+    """Stop the listener thread"""
+    global _listener_thread
+
+    _listener_stop.set()
+    if _listener_thread is not None:
+        _listener_thread.join(timeout=2.0)
+        _listener_thread = None
@@ -0,0 +1,186 @@
+"""
+Request coalescing (single-flight) for identical in-flight texts
+
+When many identical requests miss the cache at once, only one runs the model
+The others wait for its result instead of repeating the inference and DB insert
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, Type
+
+from . import cache, metrics
+from .logs import get_logger, log_event
+
+# Also coalesce across worker processes with a short-lived Redis lock
+COALESCE_DISTRIBUTED = os.getenv("COALESCE_DISTRIBUTED", "false").lower() == "true"
+
+# Lock lifetime - a worker that dies mid-inference only blocks others this long
+COALESCE_LOCK_TTL_MS = int(os.getenv("COALESCE_LOCK_TTL_MS", "5000"))
+
+# How often waiting workers check the cache for the lock holder's result
+COALESCE_POLL_MS = int(os.getenv("COALESCE_POLL_MS", "20"))
+
+# Delete the lock only if we still own it (it may have expired and been re-taken)
+_RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+logger = get_logger("coalescing")
+
+_stats = {"leaders": 0, "coalesced_local": 0, "follower_retries": 0, "coalesced_distributed": 0, "lock_timeouts": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(name: str):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+class SingleFlight:
+    """
+    Shares one in-flight coroutine among concurrent callers with the same key
+
+    The work runs as its own task, so a leader whose client disconnects
+    does not cancel the result the other callers are waiting for
+
+    Usage:
+        result, shared = await single_flight.do(cache_key, lambda: run(text))
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    async def do(
+        self, key: str, fn: Callable[[], Awaitable[Any]], retry_on: Tuple[Type[BaseException], ...] = ()
+    ) -> Tuple[Any, bool]:
+        """
+        Run fn() unless an identical call is already in flight
+
+        Args:
+            key: Identity of the work (the text's cache key)
+            fn: Zero-argument coroutine factory doing the work
+            retry_on: Errors that only reflect the leader's own limits (its
+                priority or deadline): a follower seeing one runs its own fn()
+                once instead of failing with it
+
+        Returns:
+            (result, shared) - shared is True if another caller did the work
+        """
+        task = self._inflight.get(key)
+        shared = task is not None
+
+        if shared:
+            _count("coalesced_local")
+            try:
+                return await asyncio.shield(task), shared
+            except retry_on:
+                _count("follower_retries")
+                # The failed task is gone: lead a new attempt (or join another follower's)
+                return await self.do(key, fn)
+        else:
+            _count("leaders")
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+
+        return await asyncio.shield(task), shared
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+
+single_flight = SingleFlight()
+
+
+def _lock_key(text: str, model: Optional[str]) -> str:
+    """Redis key for the cross-worker inference lock on a text"""
+    return f"lock:{cache.generate_cache_key(text, model)}"
+
+
+async def acquire_lock(text: str, model: Optional[str] = None) -> Optional[str]:
+    """
+    Try to become the one worker running inference for this text
+
+    Args:
+        text: Input text about to be analyzed
+        model: Model id it runs on (default: the active model)
+
+    Returns:
+        Lock token if acquired (or if Redis is unavailable), None if another worker holds it
+    """
+    token = uuid.uuid4().hex
+    try:
+        acquired = await cache.async_redis_client.set(
+            _lock_key(text, model), token, nx=True, px=COALESCE_LOCK_TTL_MS
+        )
+    except Exception as e:
+        # Without Redis we can't coordinate - just run the model
+        metrics.count_error("cache")
+        log_event(logger, "coalescing_error", logging.WARNING, operation="lock", error=str(e))
+        return token
+
+    return token if acquired else None
+
+
+async def release_lock(text: str, token: str, model: Optional[str] = None):
+    """Release a lock taken by acquire_lock"""
+    try:
+        await cache.async_redis_client.eval(_RELEASE_SCRIPT, 1, _lock_key(text, model), token)
+    except Exception as e:
+        metrics.count_error("cache")
+        log_event(logger, "coalescing_error", logging.WARNING, operation="unlock", error=str(e))
+
+
+async def wait_for_result(
+    text: str, model: Optional[str] = None, deadline: Optional[float] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Poll the cache while another worker holds the lock
+
+    Args:
+        text: Input text being analyzed elsewhere
+        model: Model id it runs on (default: the active model)
+        deadline: time.perf_counter() after which the caller stops waiting
+
+    Returns:
+        Cached result once written, None if the lock TTL or the caller's deadline passed without one
+    """
+    wait_seconds = COALESCE_LOCK_TTL_MS / 1000
+    if deadline is not None:
+        wait_seconds = min(wait_seconds, max(0.0, deadline - time.perf_counter()))
+    deadline = asyncio.get_running_loop().time() + wait_seconds
+
+    while asyncio.get_running_loop().time() < deadline:
+        await asyncio.sleep(COALESCE_POLL_MS / 1000)
+        result = await cache.get_cached_result_async(text, model)
+        if result:
+            _count("coalesced_distributed")
+            return result
+
+    _count("lock_timeouts")
+    return None
+
+
+def get_coalescing_stats() -> Dict[str, Any]:
+    """
+    Get request coalescing counters for this worker
+
+    Returns:
+        Dict with leader / coalesced counts and in-flight keys
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+
+    stats.update({
+        "distributed": COALESCE_DISTRIBUTED,
+        "in_flight": len(single_flight)
+    })
+    return stats
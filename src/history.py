@@ -0,0 +1,166 @@
+"""
+Analysis history queries
+
+Pages through sentiment_analyses newest-first with keyset (cursor)
+pagination on (created_at, id), so every page is an index range scan no
+matter how deep the caller has paged, and avoids an exact COUNT(*) per
+request by estimating the unfiltered total and caching filtered counts
+"""
+
+import base64
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import func, select, text, tuple_
+from sqlalchemy.orm import Session
+
+from .database import SentimentAnalysis, to_utc_naive
+
+# Largest page /history returns
+HISTORY_MAX_LIMIT = int(os.getenv("HISTORY_MAX_LIMIT", "100"))
+
+# How long a counted total is reused before counting again
+HISTORY_COUNT_TTL_SECONDS = float(os.getenv("HISTORY_COUNT_TTL_SECONDS", "30"))
+
+_count_cache: Dict[Tuple, Tuple[int, float]] = {}
+_count_lock = threading.Lock()
+
+
+class InvalidCursorError(ValueError):
+    """Raised when a `before` cursor can't be decoded"""
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    """
+    Build the opaque cursor for "rows older than this one"
+
+    Args:
+        created_at: Timestamp of the last row on the page
+        row_id: Its id (breaks ties between rows with the same timestamp)
+
+    Returns:
+        URL-safe cursor string
+    """
+    raw = f"{created_at.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """
+    Reverse encode_cursor
+
+    Raises:
+        InvalidCursorError: If the cursor is malformed
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, row_id = raw.split("|")
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise InvalidCursorError(f"Invalid cursor: {cursor!r}") from e
+
+
+def _filters(sentiment: Optional[str], since: Optional[datetime], until: Optional[datetime]) -> List[Any]:
+    """WHERE clauses for the optional filters (each served by a composite index)"""
+    clauses = []
+    if sentiment:
+        clauses.append(SentimentAnalysis.sentiment == sentiment)
+    if since:
+        clauses.append(SentimentAnalysis.created_at >= to_utc_naive(since))
+    if until:
+        clauses.append(SentimentAnalysis.created_at < to_utc_naive(until))
+    return clauses
+
+
+def get_page(
+    db: Session,
+    limit: int,
+    before: Optional[str] = None,
+    sentiment: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None
+) -> Tuple[List[SentimentAnalysis], Optional[str]]:
+    """
+    Fetch one page of analyses, newest first
+
+    Args:
+        db: Open database session
+        limit: Rows per page
+        before: Cursor from the previous page's next_cursor
+        sentiment: Only this label
+        since: Only rows created at or after this time
+        until: Only rows created before this time
+
+    Returns:
+        (rows, next_cursor) - next_cursor is None on the last page
+    """
+    query = select(SentimentAnalysis).where(*_filters(sentiment, since, until))
+
+    if before:
+        created_at, row_id = decode_cursor(before)
+        query = query.where(
+            tuple_(SentimentAnalysis.created_at, SentimentAnalysis.id) < tuple_(created_at, row_id)
+        )
+
+    # One extra row tells us whether there is a next page without counting
+    rows = db.scalars(
+        query.order_by(SentimentAnalysis.created_at.desc(), SentimentAnalysis.id.desc()).limit(limit + 1)
+    ).all()
+
+    if len(rows) <= limit:
+        return list(rows), None
+    rows = rows[:limit]
+    return list(rows), encode_cursor(rows[-1].created_at, rows[-1].id)
+
+
+def _estimated_row_count(db: Session) -> Optional[int]:
+    """Planner's row estimate for the table (PostgreSQL only, None if never analyzed)"""
+    if db.get_bind().dialect.name != "postgresql":
+        return None
+
+    estimate = db.execute(
+        text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:table)"),
+        {"table": SentimentAnalysis.__tablename__}
+    ).scalar()
+    # -1 (PG 14+) or 0 until the table has been vacuumed / analyzed
+    return estimate if estimate and estimate > 0 else None
+
+
+def get_total(
+    db: Session,
+    sentiment: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None
+) -> Tuple[int, bool]:
+    """
+    Total rows matching the filters, without an exact COUNT(*) per request
+
+    Unfiltered totals come from pg_class.reltuples on PostgreSQL; filtered
+    totals (and the unfiltered total elsewhere) are counted at most once per
+    HISTORY_COUNT_TTL_SECONDS per filter combination
+
+    Returns:
+        (total, is_estimate)
+    """
+    if not (sentiment or since or until):
+        estimate = _estimated_row_count(db)
+        if estimate is not None:
+            return estimate, True
+
+    key = (sentiment, since, until)
+    now = time.monotonic()
+    with _count_lock:
+        cached = _count_cache.get(key)
+    if cached and cached[1] > now:
+        return cached[0], True
+
+    total = db.scalar(select(func.count()).select_from(SentimentAnalysis).where(*_filters(sentiment, since, until)))
+    with _count_lock:
+        # Bounded: drop everything rather than track per-key age
+        if len(_count_cache) >= 1000:
+            _count_cache.clear()
+        _count_cache[key] = (total, now + HISTORY_COUNT_TTL_SECONDS)
+    return total, False
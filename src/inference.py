@@ -0,0 +1,597 @@
+"""
+Inference backends for sentiment analysis
+
+One interface, several ways to run the same DistilBERT checkpoint:
+    transformers - PyTorch float32 (the original pipeline behaviour)
+    onnx         - ONNX Runtime, optionally with dynamic int8 quantization
+
+Chosen at startup with INFERENCE_BACKEND
+
+torch / transformers are only imported when a backend is first loaded
+(get_backend), so importing this module - and src.main - stays fast
+
+Usage:
+    python -m src.inference --download          # pre-bake weights into MODEL_CACHE_DIR
+    python -m src.inference --parity            # compare onnx vs transformers
+    python -m src.inference --parity --quantize # compare onnx int8 vs transformers
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from . import metrics
+
+# Which backend to load: "transformers", "onnx" or "pool" (see worker_pool.py)
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "transformers")
+
+# Hugging Face checkpoint shared by every backend
+MODEL_NAME = os.getenv("MODEL_NAME", "distilbert-base-uncased-finetuned-sst-2-english")
+
+# Short version tag stored with cached results
+MODEL_TAG = os.getenv("MODEL_TAG", "distilbert-sst2")
+
+# "background": load + warm up in a thread after startup (the API starts instantly)
+# "eager": load + warm up before the app accepts traffic
+MODEL_LOAD_MODE = os.getenv("MODEL_LOAD_MODE", "background")
+
+# Pre-baked local weights directory (e.g. filled at image build time);
+# when it exists, loads never touch the network
+MODEL_CACHE_DIR = os.getenv("MODEL_CACHE_DIR")
+
+# Where the exported ONNX model is cached between runs
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "./models/onnx")
+
+# Apply dynamic int8 quantization to the ONNX model
+ONNX_QUANTIZE = os.getenv("ONNX_QUANTIZE", "false").lower() == "true"
+
+# Threads per forward pass (0 lets the runtime decide)
+INFERENCE_THREADS = int(os.getenv("INFERENCE_THREADS", "0"))
+
+# Hard cap on tokens per sequence - DistilBERT's position embeddings stop at 512
+MAX_SEQUENCE_LENGTH = 512
+
+# Token-length bucket boundaries: sequences are grouped by the smallest
+# boundary that fits them and each group is padded only to its own longest member
+LENGTH_BUCKETS = sorted(
+    int(boundary) for boundary in os.getenv("INFERENCE_LENGTH_BUCKETS", "16,32,64,128,256,512").split(",")
+)
+
+# Fixed corpus for backend parity checks
+PARITY_CORPUS = [
+    "I absolutely love this product! It's amazing and wonderful!",
+    "This is terrible, horrible, and awful. I hate it.",
+    "The item is blue.",
+    "Great product!",
+    "Excellent!",
+    "Test text",
+    "Wow!!! This is #amazing @company",
+    "Hola mundo",
+    "Good",
+    "Not bad at all, actually pretty decent.",
+    "I wouldn't recommend this to my worst enemy.",
+    "Shipping was slow but the quality made up for it.",
+    "It broke after two days.",
+    "Meh.",
+    "Best purchase I've made all year, five stars.",
+    "The customer service team never answered my emails.",
+    "Does exactly what it says on the box.",
+    "I'm not sure how I feel about this yet.",
+    "Absolutely disgusting, returned it immediately.",
+    "Five stars would buy again",
+]
+
+
+def _hub_kwargs() -> Dict[str, Any]:
+    """
+    Extra from_pretrained arguments for loading weights
+
+    use_safetensors: weights are memory-mapped from the .safetensors file
+    instead of unpickled, which is much faster on cold start
+    """
+    kwargs: Dict[str, Any] = {}
+    if MODEL_CACHE_DIR:
+        kwargs["cache_dir"] = MODEL_CACHE_DIR
+        kwargs["local_files_only"] = os.path.isdir(MODEL_CACHE_DIR) and any(Path(MODEL_CACHE_DIR).iterdir())
+    return kwargs
+
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    shifted = logits - logits.max(axis=-1, keepdims=True)
+    exp = np.exp(shifted)
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+class InferenceBackend:
+    """
+    Base class: tokenization, length bucketing and post-processing shared by all backends
+
+    Subclasses only implement _forward (token ids -> logits)
+    """
+
+    name = "base"
+
+    def __init__(self, model_name: str = MODEL_NAME, model_id: str = MODEL_TAG):
+        from transformers import AutoConfig, AutoTokenizer
+
+        self.model_name = model_name
+        # Registry id: namespaces cache keys and stored rows (see registry.py)
+        self.model_id = model_id
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name, **_hub_kwargs())
+        self.id2label = AutoConfig.from_pretrained(model_name, **_hub_kwargs()).id2label
+        self.tag = model_id if self.name == "transformers" else f"{model_id}-{self.name}"
+
+        # Explicit token cap (tokenizers without a configured limit report a huge number)
+        self.max_length = min(MAX_SEQUENCE_LENGTH, self.tokenizer.model_max_length)
+        self.pad_token_id = self.tokenizer.pad_token_id or 0
+
+        # The Rust tokenizer changes its truncation settings per call, so calls
+        # with different settings from two threads fail with "Already borrowed"
+        self._tokenizer_lock = threading.Lock()
+
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "texts": 0,
+            "forward_passes": 0,
+            # Sequences that hit max_length (and were truncated if longer)
+            "at_max_length": 0,
+            "real_tokens": 0,
+            "padded_tokens": 0,
+            # What padding the whole batch to its longest text would have cost
+            "unbucketed_padded_tokens": 0
+        }
+        self._bucket_counts: Dict[int, int] = {}
+
+    def _forward(self, input_ids: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        """Run the model on one padded batch and return logits [batch, labels]"""
+        raise NotImplementedError
+
+    def encode(self, texts: List[str]) -> List[List[int]]:
+        """
+        Tokenize texts once with the fast tokenizer, capped at max_length tokens
+
+        Args:
+            texts: Input texts
+
+        Returns:
+            Token id list per text (unpadded)
+        """
+        with self._tokenizer_lock:
+            encoded = self.tokenizer(texts, truncation=True, max_length=self.max_length)
+        return encoded["input_ids"]
+
+    def predict(self, texts: List[str], batch_size: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Classify texts
+
+        Args:
+            texts: Input texts
+            batch_size: Max texts per forward pass (default: no limit)
+
+        Returns:
+            One {"label": ..., "score": ...} dict per text, in input order
+        """
+        if not texts:
+            return []
+
+        with metrics.stage("tokenize"):
+            token_ids = self.encode(texts)
+        return self.predict_token_ids(token_ids, batch_size)
+
+    def encode_windows(self, text: str, window: int, overlap: int) -> Tuple[List[List[int]], List[Tuple[int, int]]]:
+        """
+        Tokenize a text once, without truncation, and split it into overlapping windows
+
+        Args:
+            text: Input text of any length
+            window: Max tokens per window, special tokens included (capped at max_length)
+            overlap: Tokens each window shares with the previous one
+
+        Returns:
+            (token ids per window with special tokens added,
+             (start, end) content-token span of each window)
+        """
+        with self._tokenizer_lock:
+            content = self.tokenizer(text, add_special_tokens=False, truncation=False, verbose=False)["input_ids"]
+        body = min(window, self.max_length) - self.tokenizer.num_special_tokens_to_add()
+        step = max(body - overlap, 1)
+
+        windows, spans = [], []
+        start = 0
+        while True:
+            end = min(start + body, len(content))
+            windows.append(self.tokenizer.build_inputs_with_special_tokens(content[start:end]))
+            spans.append((start, end))
+            if end >= len(content):
+                return windows, spans
+            start += step
+
+    def predict_token_ids(self, token_ids: List[List[int]], batch_size: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Classify pre-tokenized sequences using length buckets
+
+        Args:
+            token_ids: Token id list per sequence (each at most max_length long)
+            batch_size: Max sequences per forward pass (default: no limit)
+
+        Returns:
+            One {"label": ..., "score": ...} dict per sequence, in input order
+        """
+        results = []
+        for row in self.predict_probabilities(token_ids, batch_size):
+            label_id = int(row.argmax())
+            results.append({"label": self.id2label[label_id], "score": float(row[label_id])})
+        return results
+
+    def predict_probabilities(self, token_ids: List[List[int]], batch_size: Optional[int] = None) -> np.ndarray:
+        """
+        Class probabilities for pre-tokenized sequences using length buckets
+
+        Sequences are grouped by token length, each group is padded only to
+        its own longest member and run as separate forward passes, so short
+        texts don't pay for attention over a long neighbour's padding
+
+        Args:
+            token_ids: Token id list per sequence (each at most max_length long)
+            batch_size: Max sequences per forward pass (default: no limit)
+
+        Returns:
+            float array [sequences, labels] in input order (columns follow id2label)
+        """
+        probabilities = np.zeros((len(token_ids), len(self.id2label)), dtype=np.float32)
+        if not token_ids:
+            return probabilities
+
+        buckets: Dict[int, List[int]] = {}
+        for index, ids in enumerate(token_ids):
+            boundary = next((b for b in LENGTH_BUCKETS if len(ids) <= b), self.max_length)
+            buckets.setdefault(boundary, []).append(index)
+
+        real_tokens = padded_tokens = forward_passes = 0
+
+        for boundary, indices in sorted(buckets.items()):
+            step = batch_size or len(indices)
+            for start in range(0, len(indices), step):
+                chunk = indices[start:start + step]
+                forward_started = time.perf_counter()
+                width = max(len(token_ids[i]) for i in chunk)
+
+                input_ids = np.full((len(chunk), width), self.pad_token_id, dtype=np.int64)
+                attention_mask = np.zeros((len(chunk), width), dtype=np.int64)
+                for row, i in enumerate(chunk):
+                    input_ids[row, :len(token_ids[i])] = token_ids[i]
+                    attention_mask[row, :len(token_ids[i])] = 1
+
+                probabilities[chunk] = _softmax(self._forward(input_ids, attention_mask))
+                metrics.observe_stage("forward", time.perf_counter() - forward_started)
+
+                real_tokens += int(attention_mask.sum())
+                padded_tokens += attention_mask.size
+                forward_passes += 1
+
+        longest = max(len(ids) for ids in token_ids)
+        with self._stats_lock:
+            self._stats["texts"] += len(token_ids)
+            self._stats["forward_passes"] += forward_passes
+            self._stats["real_tokens"] += real_tokens
+            self._stats["padded_tokens"] += padded_tokens
+            self._stats["unbucketed_padded_tokens"] += longest * len(token_ids)
+            self._stats["at_max_length"] += sum(1 for ids in token_ids if len(ids) >= self.max_length)
+            for boundary, indices in buckets.items():
+                self._bucket_counts[boundary] = self._bucket_counts.get(boundary, 0) + len(indices)
+
+        return probabilities
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get tokenization and padding statistics
+
+        Returns:
+            Dict with texts per length bucket and padding-waste ratios
+        """
+        with self._stats_lock:
+            stats = dict(self._stats)
+            buckets = {f"<={b}": n for b, n in sorted(self._bucket_counts.items())}
+
+        padded = max(stats["padded_tokens"], 1)
+        unbucketed = max(stats["unbucketed_padded_tokens"], 1)
+        stats.update({
+            "backend": self.name,
+            "model_tag": self.tag,
+            "max_length": self.max_length,
+            "length_buckets": buckets,
+            # Share of computed positions that were padding
+            "padding_waste_ratio": round(1 - stats["real_tokens"] / padded, 4),
+            "unbucketed_padding_waste_ratio": round(1 - stats["real_tokens"] / unbucketed, 4)
+        })
+        return stats
+
+
+class TransformersBackend(InferenceBackend):
+    """PyTorch float32 - same numerics as the original transformers pipeline"""
+
+    name = "transformers"
+
+    def __init__(self, model_name: str = MODEL_NAME, model_id: str = MODEL_TAG):
+        super().__init__(model_name, model_id)
+        import torch
+        from transformers import AutoModelForSequenceClassification
+
+        if INFERENCE_THREADS > 0:
+            torch.set_num_threads(INFERENCE_THREADS)
+
+        self._torch = torch
+        self.model = AutoModelForSequenceClassification.from_pretrained(
+            model_name, use_safetensors=True, **_hub_kwargs()
+        )
+        self.model.eval()
+
+    def _forward(self, input_ids: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        with self._torch.inference_mode():
+            outputs = self.model(
+                input_ids=self._torch.from_numpy(input_ids),
+                attention_mask=self._torch.from_numpy(attention_mask)
+            )
+        return outputs.logits.float().numpy()
+
+
+def export_onnx(model_name: str = MODEL_NAME, output_dir: str = ONNX_MODEL_DIR, quantize: bool = ONNX_QUANTIZE) -> Path:
+    """
+    Export the checkpoint to ONNX (and optionally quantize it), reusing files from earlier runs
+
+    Args:
+        model_name: Hugging Face checkpoint to export
+        output_dir: Directory the .onnx files are cached in (one subdirectory per checkpoint)
+        quantize: Also produce a dynamic int8 quantized copy
+
+    Returns:
+        Path of the model file to load
+    """
+    output_dir = Path(output_dir) / model_name.strip("/").replace("/", "--")
+    output_dir.mkdir(parents=True, exist_ok=True)
+    fp32_path = output_dir / "model.onnx"
+    int8_path = output_dir / "model.int8.onnx"
+
+    if not fp32_path.exists():
+        import torch
+        from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+        print(f"Exporting {model_name} to ONNX...")
+        model = AutoModelForSequenceClassification.from_pretrained(
+            model_name, use_safetensors=True, **_hub_kwargs()
+        )
+        model.eval()
+        dummy = AutoTokenizer.from_pretrained(model_name, **_hub_kwargs())(["export"], return_tensors="pt")
+
+        torch.onnx.export(
+            model,
+            (dummy["input_ids"], dummy["attention_mask"]),
+            str(fp32_path),
+            input_names=["input_ids", "attention_mask"],
+            output_names=["logits"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "logits": {0: "batch"}
+            },
+            opset_version=14
+        )
+
+    if not quantize:
+        return fp32_path
+
+    if not int8_path.exists():
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        print("Quantizing ONNX model to int8...")
+        quantize_dynamic(str(fp32_path), str(int8_path), weight_type=QuantType.QInt8)
+
+    return int8_path
+
+
+class OnnxBackend(InferenceBackend):
+    """ONNX Runtime on CPU, optionally int8 quantized"""
+
+    name = "onnx"
+
+    def __init__(self, model_name: str = MODEL_NAME, quantize: bool = ONNX_QUANTIZE, model_id: str = MODEL_TAG):
+        self.name = "onnx-int8" if quantize else "onnx"
+        super().__init__(model_name, model_id)
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if INFERENCE_THREADS > 0:
+            options.intra_op_num_threads = INFERENCE_THREADS
+
+        model_path = export_onnx(model_name, quantize=quantize)
+        self.session = ort.InferenceSession(
+            str(model_path), options, providers=["CPUExecutionProvider"]
+        )
+
+    def _forward(self, input_ids: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        return self.session.run(
+            ["logits"],
+            {
+                "input_ids": input_ids.astype(np.int64),
+                "attention_mask": attention_mask.astype(np.int64)
+            }
+        )[0]
+
+
+def load_backend(name: str = INFERENCE_BACKEND, model_name: str = MODEL_NAME, model_id: str = MODEL_TAG) -> InferenceBackend:
+    """
+    Create the configured inference backend
+
+    Args:
+        name: "transformers", "onnx", or "pool" to use the worker pool server
+        model_name: Hugging Face checkpoint to load (ignored for "pool")
+        model_id: Registry id / version tag of the checkpoint (ignored for "pool")
+
+    Returns:
+        Ready-to-use backend
+    """
+    if name == "transformers":
+        return TransformersBackend(model_name, model_id)
+    if name == "onnx":
+        return OnnxBackend(model_name, model_id=model_id)
+    if name == "pool":
+        from .worker_pool import PoolClient
+        return PoolClient()
+    raise ValueError(f"Unknown INFERENCE_BACKEND: {name!r} (expected 'transformers', 'onnx' or 'pool')")
+
+
+# The process-wide backend, loaded on first use or by the warm-up task
+_backend: Optional[InferenceBackend] = None
+_backend_lock = threading.Lock()
+_ready = threading.Event()
+
+# Cold-start phase timings reported by /diagnostics/startup
+startup_diagnostics: Dict[str, Any] = {
+    "state": "not_loaded",
+    "backend": INFERENCE_BACKEND,
+    "import_ms": None,
+    "weight_load_ms": None,
+    "first_forward_ms": None,
+    "error": None
+}
+
+
+def get_backend() -> InferenceBackend:
+    """
+    Get the process-wide backend, loading it on first use
+
+    Concurrent callers block on the same load instead of loading twice
+
+    Returns:
+        Loaded backend
+    """
+    global _backend
+
+    if _backend is not None:
+        return _backend
+
+    with _backend_lock:
+        if _backend is None:
+            startup_diagnostics.update({"state": "loading", "error": None})
+            try:
+                started = time.perf_counter()
+                if INFERENCE_BACKEND != "pool":
+                    import torch  # noqa: F401
+                    import transformers  # noqa: F401
+                imported = time.perf_counter()
+
+                print(f"Loading sentiment analysis model ({INFERENCE_BACKEND} backend)...")
+                backend = load_backend()
+                print("Model loaded!")
+
+                startup_diagnostics.update({
+                    "state": "loaded",
+                    "import_ms": round((imported - started) * 1000, 1),
+                    "weight_load_ms": round((time.perf_counter() - imported) * 1000, 1)
+                })
+                _backend = backend
+            except Exception as e:
+                startup_diagnostics.update({"state": "failed", "error": repr(e)})
+                raise
+
+    return _backend
+
+
+def warm_up():
+    """
+    Load the backend and run one inference so the first request is fast
+
+    Run from a background thread at startup; readiness turns green when it finishes
+    """
+    try:
+        backend = get_backend()
+
+        startup_diagnostics["state"] = "warming_up"
+        started = time.perf_counter()
+        backend.predict(["Warm-up inference"])
+        startup_diagnostics.update({
+            "state": "ready",
+            "first_forward_ms": round((time.perf_counter() - started) * 1000, 1)
+        })
+        _ready.set()
+    except Exception as e:
+        startup_diagnostics.update({"state": "failed", "error": repr(e)})
+        print(f"Model warm-up failed: {e}")
+
+
+def is_ready() -> bool:
+    """True once warm_up has completed a first inference"""
+    return _ready.is_set()
+
+
+def parity_check(
+    reference: InferenceBackend,
+    candidate: InferenceBackend,
+    corpus: List[str] = PARITY_CORPUS
+) -> Dict[str, Any]:
+    """
+    Compare two backends on a fixed corpus
+
+    Args:
+        reference: Backend treated as ground truth (usually transformers)
+        candidate: Backend being validated
+        corpus: Texts to score with both
+
+    Returns:
+        Dict with label agreement, confidence deltas and timings
+    """
+    started = time.perf_counter()
+    expected = reference.predict(corpus)
+    reference_ms = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    actual = candidate.predict(corpus)
+    candidate_ms = (time.perf_counter() - started) * 1000
+
+    agree = [e["label"] == a["label"] for e, a in zip(expected, actual)]
+    deltas = [abs(e["score"] - a["score"]) for e, a in zip(expected, actual)]
+
+    return {
+        "reference": reference.name,
+        "candidate": candidate.name,
+        "texts": len(corpus),
+        "label_agreement": round(sum(agree) / len(corpus), 4),
+        "disagreements": [text for text, same in zip(corpus, agree) if not same],
+        "max_confidence_delta": round(max(deltas), 6),
+        "mean_confidence_delta": round(sum(deltas) / len(deltas), 6),
+        "reference_ms": round(reference_ms, 2),
+        "candidate_ms": round(candidate_ms, 2)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inference backend utilities")
+    parser.add_argument("--parity", action="store_true", help="compare the ONNX backend against transformers")
+    parser.add_argument("--quantize", action="store_true", help="use the int8 quantized ONNX model")
+    parser.add_argument("--export", action="store_true", help="export (and cache) the ONNX model, then exit")
+    parser.add_argument("--download", action="store_true", help="download weights into MODEL_CACHE_DIR, then exit")
+    args = parser.parse_args()
+
+    if args.download:
+        from transformers import AutoConfig, AutoModelForSequenceClassification, AutoTokenizer
+
+        for loader in (AutoConfig, AutoTokenizer, AutoModelForSequenceClassification):
+            loader.from_pretrained(MODEL_NAME, cache_dir=MODEL_CACHE_DIR)
+        print(f"Model {MODEL_NAME} cached in {MODEL_CACHE_DIR or 'the default Hugging Face cache'}")
+
+    if args.export:
+        print(f"ONNX model ready: {export_onnx(quantize=args.quantize)}")
+    if args.parity:
+        report = parity_check(TransformersBackend(), OnnxBackend(quantize=args.quantize))
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Structured, sampled logging
+
+Records are emitted as one JSON object per line. Request handlers only
+put records on a bounded in-memory queue; a background listener thread
+formats them and writes to stdout, so a slow or contended stdout never
+stalls the event loop. If the queue is full, records are dropped and
+counted rather than blocking
+
+High-volume hot-path events (cache hits / misses) go through log_sampled,
+which keeps only LOG_SAMPLE_RATE of them
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+# Minimum level written to stdout
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+# Share of hot-path events that are logged (0 disables them, 1 logs all)
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.01"))
+
+# Records buffered for the writer thread before new ones are dropped
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+# Parent of every logger handed out by get_logger
+ROOT_LOGGER = "sentiment"
+
+
+class JsonFormatter(logging.Formatter):
+    """Format a record as a single JSON line (extra fields come from `fields`)"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "event": record.getMessage(),
+            **getattr(record, "fields", {})
+        }
+        return json.dumps(entry, default=str)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops (and counts) records when the queue is full instead of blocking"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_handler: Optional[DroppingQueueHandler] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+_setup_lock = threading.Lock()
+
+
+def setup_logging():
+    """Attach the queue handler and start the stdout writer thread (idempotent)"""
+    global _handler, _listener
+    with _setup_lock:
+        if _listener is not None:
+            return
+
+        log_queue: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        stream = logging.StreamHandler(sys.stdout)
+        stream.setFormatter(JsonFormatter())
+
+        _handler = DroppingQueueHandler(log_queue)
+        root = logging.getLogger(ROOT_LOGGER)
+        root.addHandler(_handler)
+        root.setLevel(LOG_LEVEL)
+        # Don't also hand records to uvicorn's / the root logger's handlers
+        root.propagate = False
+
+        _listener = logging.handlers.QueueListener(log_queue, stream)
+        _listener.start()
+        atexit.register(_listener.stop)
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    Get a module logger under the "sentiment" hierarchy
+
+    Args:
+        name: Short component name (e.g., "cache")
+    """
+    setup_logging()
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+def log_event(logger: logging.Logger, event: str, level: int = logging.INFO, **fields: Any):
+    """
+    Log one structured event
+
+    Args:
+        logger: Logger from get_logger
+        event: Short event name (e.g., "cache_error")
+        level: logging level
+        **fields: Extra JSON fields
+    """
+    if logger.isEnabledFor(level):
+        logger.log(level, event, extra={"fields": fields})
+
+
+def log_sampled(logger: logging.Logger, event: str, rate: float = LOG_SAMPLE_RATE, **fields: Any):
+    """
+    Log a high-volume event for only a fraction of occurrences
+
+    The rate is recorded on each entry so counts can be scaled back up
+
+    Args:
+        logger: Logger from get_logger
+        event: Short event name (e.g., "cache_hit")
+        rate: Probability of logging this occurrence
+        **fields: Extra JSON fields
+    """
+    if rate > 0 and (rate >= 1 or random.random() < rate):
+        log_event(logger, event, sample_rate=rate, **fields)
+
+
+def dropped_records() -> int:
+    """Records discarded because the log queue was full"""
+    return _handler.dropped if _handler else 0
@@ -0,0 +1,226 @@
+"""
+Long-document sentiment with sliding-window inference
+
+The model reads at most 512 tokens, so a long text is tokenized once,
+split into overlapping token windows, and every window not already cached
+is scored in one batched (length-bucketed) call. Window probabilities are
+then aggregated into a single label:
+
+    mean            - average of the window probability vectors
+    length_weighted - average weighted by each window's token count
+                      (a short final window counts for less)
+    max             - the single most confident window decides
+
+Window results are cached by their token ids, so a document that shares
+windows with an earlier one (the same document again, a shared prefix,
+an edit near the end) only runs the windows that changed. Windows start
+at fixed offsets from the beginning of the document, so shared text in
+the middle of two otherwise different documents generally won't align
+"""
+
+import hashlib
+import logging
+import os
+from contextlib import nullcontext
+from typing import Any, Callable, ContextManager, Dict, List, Optional
+
+import numpy as np
+
+from . import cache, metrics, registry
+from .logs import get_logger, log_event
+
+# Longest document accepted, in characters
+LONG_TEXT_MAX_CHARS = int(os.getenv("LONG_TEXT_MAX_CHARS", "100000"))
+
+# Tokens per window, special tokens included (capped at the model's 512)
+LONG_TEXT_WINDOW_TOKENS = int(os.getenv("LONG_TEXT_WINDOW_TOKENS", "512"))
+
+# Tokens each window repeats from the previous one, so no sentence is only seen cut in half
+LONG_TEXT_OVERLAP_TOKENS = int(os.getenv("LONG_TEXT_OVERLAP_TOKENS", "128"))
+
+# Max windows per forward pass
+LONG_TEXT_BATCH_SIZE = int(os.getenv("LONG_TEXT_BATCH_SIZE", "16"))
+
+# Most windows one document may need (bounds the inference a single request can ask for)
+LONG_TEXT_MAX_WINDOWS = int(os.getenv("LONG_TEXT_MAX_WINDOWS", "64"))
+
+AGGREGATIONS = ("mean", "length_weighted", "max")
+
+logger = get_logger("long_text")
+
+
+class DocumentTooLongError(ValueError):
+    """Raised for a document that needs more than LONG_TEXT_MAX_WINDOWS windows"""
+
+
+def chunk_cache_key(token_ids: List[int], model: str) -> str:
+    """Cache key for one window, derived from its token ids and the model that scores it"""
+    digest = hashlib.sha256(np.asarray(token_ids, dtype=np.int32).tobytes()).hexdigest()[:16]
+    return f"sentiment:{cache.current_generation()}:{model}:chunk:{digest}"
+
+
+def get_cached_chunks(keys: List[str]) -> List[Optional[np.ndarray]]:
+    """
+    Look up window probabilities in L1, then Redis with one MGET
+
+    Args:
+        keys: Keys from chunk_cache_key
+
+    Returns:
+        Probability vector per key, or None on a miss
+    """
+    found: List[Optional[np.ndarray]] = []
+    for key in keys:
+        entry = cache.local_cache.get(key)
+        found.append(np.asarray(entry["probabilities"], dtype=np.float32) if entry else None)
+
+    missing = [i for i, entry in enumerate(found) if entry is None]
+    if missing:
+        try:
+            for i, data in zip(missing, cache.redis_client.mget([keys[i] for i in missing])):
+                if data:
+                    found[i] = np.frombuffer(data, dtype=np.float32)
+                    cache.local_cache.set(keys[i], {"probabilities": found[i].tolist()})
+        except Exception as e:
+            metrics.count_error("cache")
+            log_event(logger, "cache_error", logging.WARNING, operation="get_chunks", error=str(e))
+    return found
+
+
+def cache_chunks(items: List[tuple]) -> bool:
+    """
+    Store window probabilities with one pipelined SETEX
+
+    Args:
+        items: (key, probability vector) pairs
+
+    Returns:
+        True if cached successfully
+    """
+    if not items:
+        return True
+    try:
+        pipe = cache.redis_client.pipeline(transaction=False)
+        for key, probabilities in items:
+            # Raw float32 vector: 8 bytes for a two-label model
+            pipe.setex(key, cache.CACHE_TTL_SECONDS, np.asarray(probabilities, dtype=np.float32).tobytes())
+            cache.local_cache.set(key, {"probabilities": [float(p) for p in probabilities]})
+        pipe.execute()
+        return True
+    except Exception as e:
+        metrics.count_error("cache")
+        log_event(logger, "cache_error", logging.WARNING, operation="set_chunks", error=str(e))
+        return False
+
+
+def aggregate(probabilities: np.ndarray, lengths: List[int], method: str) -> np.ndarray:
+    """
+    Combine window probabilities into one distribution
+
+    Args:
+        probabilities: [windows, labels]
+        lengths: Content tokens per window
+        method: One of AGGREGATIONS
+
+    Returns:
+        Probability vector [labels]
+    """
+    if method == "mean":
+        return probabilities.mean(axis=0)
+    if method == "length_weighted":
+        weights = np.asarray(lengths, dtype=np.float64)
+        # A document with no content tokens has a single empty window: nothing to weight by
+        if weights.sum() <= 0:
+            return probabilities.mean(axis=0)
+        return np.average(probabilities, axis=0, weights=weights)
+    if method == "max":
+        return probabilities[int(probabilities.max(axis=1).argmax())]
+    raise ValueError(f"aggregation must be one of {', '.join(AGGREGATIONS)}")
+
+
+def analyze_long(
+    text: str,
+    aggregation: str = "mean",
+    return_chunks: bool = False,
+    model: Optional[str] = None,
+    admit: Callable[[int], ContextManager] = lambda windows: nullcontext()
+) -> Dict[str, Any]:
+    """
+    Score a document of any length with overlapping windows
+
+    Args:
+        text: Input document
+        aggregation: One of AGGREGATIONS
+        return_chunks: Include each window's span, label and confidence
+        model: Model id to score with (default: the active model)
+        admit: Called with the number of uncached windows; the forward pass
+            runs inside the returned context (the API passes an admission slot)
+
+    Returns:
+        Dict with the aggregated sentiment / confidence, window and token
+        counts, how many windows came from the cache and (optionally) chunk_results
+
+    Raises:
+        ValueError: For an unknown aggregation
+        DocumentTooLongError: If the document needs more than LONG_TEXT_MAX_WINDOWS windows
+        NotImplementedError: If the backend can't tokenize locally (INFERENCE_BACKEND=pool)
+    """
+    if aggregation not in AGGREGATIONS:
+        raise ValueError(f"aggregation must be one of {', '.join(AGGREGATIONS)}")
+
+    backend = registry.get_backend(model)
+    if not hasattr(backend, "encode_windows"):
+        raise NotImplementedError(f"Long-text mode needs a local tokenizer; the {backend.name} backend has none")
+
+    with metrics.stage("tokenize"):
+        windows, spans = backend.encode_windows(text, LONG_TEXT_WINDOW_TOKENS, LONG_TEXT_OVERLAP_TOKENS)
+    if len(windows) > LONG_TEXT_MAX_WINDOWS:
+        raise DocumentTooLongError(
+            f"Document needs {len(windows)} windows of {LONG_TEXT_WINDOW_TOKENS} tokens; the limit is {LONG_TEXT_MAX_WINDOWS}"
+        )
+
+    keys = [chunk_cache_key(window, backend.model_id) for window in windows]
+    with metrics.stage("cache_get"):
+        cached = get_cached_chunks(keys)
+    missing = [i for i, entry in enumerate(cached) if entry is None]
+    metrics.count_cache("hit", len(windows) - len(missing))
+    metrics.count_cache("miss", len(missing))
+
+    probabilities = np.zeros((len(windows), len(backend.id2label)), dtype=np.float32)
+    for i, entry in enumerate(cached):
+        if entry is not None:
+            probabilities[i] = entry
+    if missing:
+        # Every uncached window in one batched call
+        with admit(len(missing)):
+            probabilities[missing] = backend.predict_probabilities([windows[i] for i in missing], LONG_TEXT_BATCH_SIZE)
+        with metrics.stage("cache_set"):
+            cache_chunks([(keys[i], probabilities[i]) for i in missing])
+
+    lengths = [end - start for start, end in spans]
+    combined = aggregate(probabilities, lengths, aggregation)
+    label_id = int(combined.argmax())
+
+    result: Dict[str, Any] = {
+        "sentiment": backend.id2label[label_id],
+        "confidence": round(float(combined[label_id]), 4),
+        "aggregation": aggregation,
+        "chunks": len(windows),
+        "cached_chunks": len(windows) - len(missing),
+        "tokens": spans[-1][1],
+        "characters": len(text),
+        "model": backend.tag
+    }
+    if return_chunks:
+        result["chunk_results"] = [
+            {
+                "index": i,
+                "start_token": start,
+                "end_token": end,
+                "sentiment": backend.id2label[int(row.argmax())],
+                "confidence": round(float(row.max()), 4),
+                "cached": cached[i] is not None
+            }
+            for i, ((start, end), row) in enumerate(zip(spans, probabilities))
+        ]
+    return result
@@ -1,37 +1,149 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel, Field
-from transformers import pipeline
+from typing import Annotated, Literal, Optional
+from datetime import datetime
 from sqlalchemy.orm import Session
 from fastapi import Depends
-from .database import init_db, get_db, SentimentAnalysis
+from .database import (
+    init_db, get_db, save_analyses, get_stored_result, get_pool_stats, async_engine, SessionLocal, AsyncSessionLocal
+)
+import asyncio
+import logging
+import threading
 import time
-from . import cache
+from . import cache, coalescing
+from .coalescing import COALESCE_DISTRIBUTED
+from .batching import MicroBatcher, DeadlineExceededError, QueueFullError, BATCH_MAX_SIZE
+from .write_behind import WriteBehindQueue, WRITE_BEHIND_ENABLED
+from . import analytics, history, inference, long_text, metrics, streaming
+from .logs import get_logger, log_event, log_sampled
+from .history import HISTORY_MAX_LIMIT
+from .inference import MODEL_LOAD_MODE
+from . import near_duplicates
+from .near_duplicates import NEAR_DUPLICATE_ENABLED
+from . import warming
+from .warming import CACHE_WARM_ON_STARTUP, CACHE_WARM_AFTER_CLEAR
+from . import registry
+from .registry import ModelNotLoadedError, UnknownModelError
+from . import admission
+from .admission import ADMISSION_DEGRADE, OverloadedError
 
 app = FastAPI(
     title="Sentiment Analysis API",
     description="Analyze text sentiment using transformers",
     version="1.0.0"
 )
+app.add_middleware(metrics.MetricsMiddleware)
+
+logger = get_logger("api")
 
 # Initialize database on startup
 @app.on_event("startup")
 def startup_event():
-    """Create database tables if they don't exist"""
+    """Create database tables if they don't exist and start loading the model"""
     print("Initializing database...")
     init_db()
     print("Database ready!")
 
-# Load model once at startup
-print("Loading sentiment analysis model...")
-sentiment_analyzer = pipeline(
-    "sentiment-analysis",
-    model="distilbert-base-uncased-finetuned-sst-2-english"
+    # The model is not loaded at import time: warm it up in the background
+    # (or before accepting traffic with MODEL_LOAD_MODE=eager) and gate /ready on it
+    if MODEL_LOAD_MODE == "eager":
+        inference.warm_up()
+    else:
+        threading.Thread(target=inference.warm_up, name="model-warm-up", daemon=True).start()
+    batcher.start()
+    if write_behind:
+        write_behind.start()
+    cache.start_invalidation_listener()
+    registry.model_registry.start_sync(cache.redis_client)
+    if CACHE_WARM_ON_STARTUP:
+        warmer.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Flush queued texts and rows, stop background threads and close async clients"""
+    await asyncio.to_thread(batcher.stop)
+    if write_behind:
+        await asyncio.to_thread(write_behind.stop)
+    await asyncio.to_thread(cache.stop_invalidation_listener)
+    await asyncio.to_thread(registry.model_registry.stop_sync)
+    await cache.async_redis_client.aclose()
+    await async_engine.dispose()
+    metrics.mark_process_dead()
+
+def run_model(texts: list[str], batch_size: int = None, model: str = None) -> list[dict]:
+    """Run padded forward passes over a list of texts (the active model unless one is given)"""
+    return registry.get_backend(model).predict(texts, batch_size=batch_size)
+
+# Recent queue wait and per-text inference time of every path that runs the model
+inference_latency = admission.LatencyRecorder()
+
+# Concurrent requests share forward passes through the micro-batcher
+# Its background thread is the only place /analyze runs the model
+batcher = MicroBatcher(run_model, latency=inference_latency)
+
+# Sheds new misses once texts in flight would wait past the latency target
+admission_controller = admission.AdmissionController(inference_latency)
+
+# Optional write-behind: rows are persisted in background batches
+write_behind = WriteBehindQueue(SessionLocal) if WRITE_BEHIND_ENABLED else None
+
+# Re-fills Redis from past traffic, stepping aside while live requests wait for the model
+warmer = warming.CacheWarmer(
+    SessionLocal, busy=lambda: batcher.get_stats()["queue_depth"] > 0, latency=inference_latency
 )
-print("Model loaded!")
+
+def verify_second_chance(text: str, match: str, reused_label: str, model: str):
+    """
+    Re-run a normalized / near-duplicate cache hit through the model in the
+    background and record whether the reused label agrees with a fresh one
+
+    Skipped when batch-priority work is being shed
+    """
+    try:
+        admission_controller.admit(1, "batch")
+    except OverloadedError:
+        return
+    try:
+        future = batcher.submit(text, model)
+    except QueueFullError:
+        admission_controller.release()
+        return
+
+    def record(done):
+        admission_controller.release()
+        if done.exception() is None:
+            near_duplicates.record_verification(match, reused_label, done.result()["label"])
+
+    future.add_done_callback(record)
+
+def queue_rows(rows: list[dict]) -> list[dict]:
+    """
+    Hand rows to the write-behind queue when it is enabled
+
+    Returns:
+        Rows the caller still has to persist itself
+    """
+    if not write_behind:
+        return rows
+    return [row for row in rows if not write_behind.enqueue(row)]
+
+# Optional model pin on analyze requests (default: the active model)
+ModelId = Optional[Annotated[str, Field(min_length=1, max_length=64, example="distilbert-sst2")]]
+
+# Batch / background callers are shed before interactive ones under load
+Priority = Literal["interactive", "batch"]
+
+# How long the client will wait, from when the request arrives (default: ADMISSION_DEFAULT_DEADLINE_MS)
+DeadlineMs = Optional[Annotated[int, Field(ge=1, le=600000, example=10000)]]
 
 class TextRequest(BaseModel):
     text: str = Field(..., min_length=1, max_length=512,
                      example="I love this product!")
+    model: ModelId = None
+    priority: Priority = "interactive"
+    deadline_ms: DeadlineMs = None
 
 class SentimentResponse(BaseModel):
     text: str
@@ -39,6 +151,63 @@ class SentimentResponse(BaseModel):
     confidence: float
     processing_time_ms: int
     cached: bool = False
+    model: Optional[str] = None
+    degraded: bool = False
+
+# Max texts accepted by one /analyze/batch call
+BATCH_REQUEST_MAX_TEXTS = 1000
+
+class BatchRequest(BaseModel):
+    texts: list[Annotated[str, Field(min_length=1, max_length=512)]] = Field(
+        ..., min_length=1, max_length=BATCH_REQUEST_MAX_TEXTS,
+        example=["I love this product!", "This is terrible."]
+    )
+    model: ModelId = None
+    priority: Priority = "batch"
+    deadline_ms: DeadlineMs = None
+
+class BatchResultItem(BaseModel):
+    text: str
+    sentiment: str
+    confidence: float
+    cached: bool
+
+class BatchResponse(BaseModel):
+    results: list[BatchResultItem]
+    total: int
+    cache_hits: int
+    processing_time_ms: int
+    model: str
+
+class LongTextRequest(BaseModel):
+    text: str = Field(..., min_length=1, max_length=long_text.LONG_TEXT_MAX_CHARS,
+                     example="A review several thousand words long...")
+    aggregation: Literal["mean", "length_weighted", "max"] = "mean"
+    return_chunks: bool = False
+    model: ModelId = None
+    priority: Priority = "interactive"
+    deadline_ms: DeadlineMs = None
+
+class ChunkResult(BaseModel):
+    index: int
+    start_token: int
+    end_token: int
+    sentiment: str
+    confidence: float
+    cached: bool
+
+class LongTextResponse(BaseModel):
+    sentiment: str
+    confidence: float
+    aggregation: str
+    chunks: int
+    cached_chunks: int
+    tokens: int
+    characters: int
+    processing_time_ms: int
+    cached: bool
+    model: str
+    chunk_results: Optional[list[ChunkResult]] = None
 
 class HistoryItem(BaseModel):
     id: int
@@ -47,9 +216,12 @@ class HistoryItem(BaseModel):
     confidence: float
     processing_time_ms: int
     created_at: str
+    model: Optional[str] = None
 
 class HistoryResponse(BaseModel):
     total: int
+    total_is_estimate: bool = False
+    next_cursor: Optional[str] = None
     analyses: list[HistoryItem]
 
 @app.get("/")
@@ -61,25 +233,127 @@ def root():
         "version": "1.0.0"
     }
 
+async def analyze_miss(text: str, start_time: float, model: str, priority: str, deadline: Optional[float]) -> dict:
+    """
+    Cache MISS path: run the model, store the row and cache the result
+
+    With distributed coalescing, a worker that finds another worker
+    already analyzing this text waits for that result instead. Only the
+    model call itself goes through admission control
+    """
+    lock_token = None
+    if COALESCE_DISTRIBUTED:
+        lock_token = await coalescing.acquire_lock(text, model)
+        if lock_token is None:
+            shared_result = await coalescing.wait_for_result(text, model, deadline)
+            if shared_result:
+                shared_result["cached"] = True
+                return shared_result
+
+    try:
+        with admission_controller.slot(1, priority, deadline):
+            result = await asyncio.wrap_future(batcher.submit(text, model, deadline))
+        
+        processing_time = int((time.time() - start_time) * 1000)
+        
+        # Create response
+        response_data = {
+            "text": text,
+            "sentiment": result['label'],
+            "confidence": round(result['score'], 4),
+            "processing_time_ms": processing_time,
+            "cached": False,  # NEW: indicate this wasn't cached
+            "model": registry.get_backend(model).tag
+        }
+        
+        # Store in database (queued when write-behind is enabled)
+        unsaved_rows = queue_rows([{
+            "text": text,
+            "sentiment": result['label'],
+            "confidence": round(result['score'], 4),
+            "model": model,
+            "processing_time_ms": processing_time
+        }])
+        if unsaved_rows:
+            # Only now take a session (and a pooled connection)
+            with metrics.stage("db_write"):
+                async with AsyncSessionLocal() as db:
+                    await db.run_sync(save_analyses, unsaved_rows)
+        
+        # ===== NEW: Store in cache =====
+        with metrics.stage("cache_set"):
+            await cache.cache_result_async(text, response_data, model)
+            if NEAR_DUPLICATE_ENABLED:
+                await near_duplicates.remember_async(text, response_data, model)
+        # ===============================
+
+        return response_data
+    finally:
+        if lock_token:
+            await coalescing.release_lock(text, lock_token, model)
+
+async def degraded_result(text: str, model: str, start_time: float) -> Optional[dict]:
+    """
+    Cache-only answer for a shed miss: the latest stored result of this
+    exact text from the requested model
+
+    Returns:
+        Response data, or None if that model never analyzed the text
+    """
+    try:
+        async with AsyncSessionLocal() as db:
+            stored = await db.run_sync(get_stored_result, text, model)
+    except Exception as e:
+        metrics.count_error("database")
+        log_event(logger, "degraded_lookup_error", logging.WARNING, error=str(e))
+        return None
+    if stored is None:
+        return None
+    return {
+        "text": text,
+        **stored,
+        "processing_time_ms": int((time.time() - start_time) * 1000),
+        "cached": True,
+        "degraded": True
+    }
+
 @app.post("/analyze", response_model=SentimentResponse)
-def analyze_sentiment(
-    request: TextRequest,
-    db: Session = Depends(get_db)
-):
+async def analyze_sentiment(request: TextRequest):
     """
     Analyze sentiment of input text with caching.
     
     Returns sentiment (POSITIVE/NEGATIVE) with confidence score.
     Stores result in PostgreSQL database and Redis cache.
+
+    Runs entirely on the event loop: cache hits never touch a thread,
+    and misses await the micro-batcher's inference thread. Identical
+    texts already being analyzed share that in-flight result.
+
+    Under overload new misses are shed: answered from the text's stored
+    result when there is one (degraded), else 503 with Retry-After. A miss
+    still queued when deadline_ms runs out gets 504.
     """
     start_time = time.time()
+    deadline = admission.deadline_from(request.deadline_ms)
+    metrics.handler_started()
     
     try:
-        cached_result = cache.get_cached_result(request.text)
+        # Resolved once: a model swap mid-request doesn't mix cache namespaces
+        model = registry.model_registry.resolve(request.model)
+
+        with metrics.stage("cache_get"):
+            cached_result = await cache.get_cached_result_async(request.text, model)
+            match = "hit"
+            if cached_result is None and NEAR_DUPLICATE_ENABLED:
+                # Second chance: same text modulo case/punctuation, or a near-duplicate
+                cached_result, match = await near_duplicates.lookup_async(request.text, model)
         
         if cached_result:
             # Cache HIT - return cached result
-            print(f"Cache HIT for: {request.text[:50]}")
+            metrics.count_cache(match)
+            log_sampled(logger, "cache_hit", match=match, text_length=len(request.text))
+            if match != "hit" and near_duplicates.should_verify():
+                verify_second_chance(request.text, match, cached_result["sentiment"], model)
             
             # Add cache indicator
             cached_result["cached"] = True
@@ -87,66 +361,382 @@ def analyze_sentiment(
             
             return SentimentResponse(**cached_result)
         
-        # Cache MISS - run ML model
-        print(f"Cache MISS for: {request.text[:50]}")
-        
-        result = sentiment_analyzer(request.text)[0]
+        # Cache MISS - run ML model (once per text across concurrent requests)
+        metrics.count_cache("miss")
+        cache_key = cache.generate_cache_key(request.text, model)
+        log_sampled(logger, "cache_miss", cache_key=cache_key, text_length=len(request.text))
         
-        processing_time = int((time.time() - start_time) * 1000)
-        
-        # Create response
-        response_data = {
-            "text": request.text,
-            "sentiment": result['label'],
-            "confidence": round(result['score'], 4),
-            "processing_time_ms": processing_time,
-            "cached": False  # NEW: indicate this wasn't cached
-        }
-        
-        # Store in database
-        db_analysis = SentimentAnalysis(
-            text=request.text,
-            sentiment=result['label'],
-            confidence=round(result['score'], 4),
-            processing_time_ms=processing_time
+        response_data, shared = await coalescing.single_flight.do(
+            cache_key,
+            lambda: analyze_miss(request.text, start_time, model, request.priority, deadline),
+            # A leader shed for its own priority / deadline doesn't fail followers with more budget
+            retry_on=(OverloadedError, DeadlineExceededError)
         )
-        db.add(db_analysis)
-        db.commit()
-        db.refresh(db_analysis)
-        
-        # ===== NEW: Store in cache =====
-        cache.cache_result(request.text, response_data)
-        # ===============================
+
+        if shared:
+            metrics.count_cache("coalesced")
+            # Another in-flight request ran the model - answer like a cache hit
+            response_data = {
+                **response_data,
+                "cached": True,
+                "processing_time_ms": int((time.time() - start_time) * 1000)
+            }
         
         return SentimentResponse(**response_data)
-        
+
+    except UnknownModelError:
+        raise HTTPException(status_code=404, detail=f"Unknown model: {request.model}")
+    except ModelNotLoadedError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except OverloadedError as e:
+        degraded = await degraded_result(request.text, model, start_time) if ADMISSION_DEGRADE else None
+        if degraded:
+            admission_controller.record(request.priority, "degraded")
+            return SentimentResponse(**degraded)
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except DeadlineExceededError as e:
+        admission_controller.record(request.priority, "expired")
+        raise HTTPException(status_code=504, detail=str(e))
+    except QueueFullError as e:
+        metrics.count_error("rejected")
+        raise HTTPException(
+            status_code=503, detail=str(e), headers={"Retry-After": str(admission_controller.retry_after())}
+        )
     except Exception as e:
+        metrics.count_error("request")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        metrics.handler_finished()
+
+def score_texts(
+    texts: list[str], model: str, priority: str = "batch", deadline: Optional[float] = None, wait: bool = False
+) -> dict:
+    """
+    Score many texts with one cache round trip and one batched model call
+
+    Duplicate texts are analyzed once. Cache hits come from a single
+    Redis MGET, misses run through the model in one batched call and
+    are written back with one pipelined SETEX and one bulk INSERT.
+
+    A database session is only opened when there are new rows to store.
+
+    Args:
+        texts: Input texts (may contain duplicates)
+        model: Model id to score with (from registry resolve)
+        priority: Admission priority of the misses
+        deadline: time.perf_counter() after which the caller stops waiting
+        wait: Wait for admission instead of raising OverloadedError
+
+    Returns:
+        Dict of text -> (response_data, cached)
+
+    Raises:
+        OverloadedError: If the misses are shed
+    """
+    # Dedup while keeping first-seen order
+    unique_texts = list(dict.fromkeys(texts))
+    with metrics.stage("cache_get"):
+        cached_results = cache.get_cached_results(unique_texts, model)
+
+    results = {}
+    misses = []
+    for text, cached_result in zip(unique_texts, cached_results):
+        if cached_result:
+            results[text] = (cached_result, True)
+        else:
+            misses.append(text)
+    metrics.count_cache("hit", len(unique_texts) - len(misses))
+
+    if misses and NEAR_DUPLICATE_ENABLED:
+        with metrics.stage("cache_get"):
+            second_chance = near_duplicates.lookup_many(misses, model)
+        remaining = []
+        for text, (cached_result, match) in zip(misses, second_chance):
+            if cached_result is None:
+                remaining.append(text)
+                continue
+            results[text] = (cached_result, True)
+            metrics.count_cache(match)
+            if near_duplicates.should_verify():
+                verify_second_chance(text, match, cached_result["sentiment"], model)
+        misses = remaining
+    metrics.count_cache("miss", len(misses))
+
+    if misses:
+        backend = registry.get_backend(model)
+        with admission_controller.slot(len(misses), priority, deadline, wait, timed=True):
+            model_start = time.time()
+            predictions = backend.predict(misses, batch_size=BATCH_MAX_SIZE)
+        # Amortize the batched inference time across its texts
+        per_text_ms = int((time.time() - model_start) * 1000 / len(misses))
+
+        new_rows = []
+        for text, prediction in zip(misses, predictions):
+            response_data = {
+                "text": text,
+                "sentiment": prediction['label'],
+                "confidence": round(prediction['score'], 4),
+                "processing_time_ms": per_text_ms,
+                "cached": False,
+                "model": backend.tag
+            }
+            results[text] = (response_data, False)
+            new_rows.append({
+                "text": text,
+                "sentiment": response_data["sentiment"],
+                "confidence": response_data["confidence"],
+                "model": model,
+                "processing_time_ms": per_text_ms
+            })
+
+        unsaved_rows = queue_rows(new_rows)
+        if unsaved_rows:
+            db = SessionLocal()
+            try:
+                with metrics.stage("db_write"):
+                    save_analyses(db, unsaved_rows)
+            finally:
+                db.close()
+        with metrics.stage("cache_set"):
+            cache.cache_results([(text, results[text][0]) for text in misses], model)
+            if NEAR_DUPLICATE_ENABLED:
+                near_duplicates.remember_many([(text, results[text][0]) for text in misses], model)
+
+    return results
+
+@app.post("/analyze/batch", response_model=BatchResponse)
+def analyze_batch(request: BatchRequest):
+    """
+    Analyze sentiment of many texts in one call.
+
+    Duplicate texts are analyzed once (see score_texts).
+    Results are returned in input order.
+
+    Runs at batch priority unless the request says otherwise; shed
+    requests get 503 with Retry-After.
+    """
+    start_time = time.time()
+    deadline = admission.deadline_from(request.deadline_ms)
+    metrics.handler_started()
+
+    try:
+        model = registry.model_registry.resolve(request.model)
+        results = score_texts(request.texts, model, request.priority, deadline)
+
+        items = [
+            BatchResultItem(
+                text=text,
+                sentiment=results[text][0]["sentiment"],
+                confidence=results[text][0]["confidence"],
+                cached=results[text][1]
+            )
+            for text in request.texts
+        ]
+
+        return BatchResponse(
+            results=items,
+            total=len(items),
+            cache_hits=sum(item.cached for item in items),
+            processing_time_ms=int((time.time() - start_time) * 1000),
+            model=registry.get_backend(model).tag
+        )
+
+    except UnknownModelError:
+        raise HTTPException(status_code=404, detail=f"Unknown model: {request.model}")
+    except ModelNotLoadedError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except OverloadedError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except Exception as e:
+        metrics.count_error("request")
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        metrics.handler_finished()
+
+class NDJSONStreamingResponse(StreamingResponse):
+    """
+    Streaming response whose body generator also reads the request body
+
+    StreamingResponse normally listens for client disconnects on receive(),
+    which would swallow the request body messages the generator is reading;
+    a disconnect still ends the stream through request.stream()
+    """
+
+    media_type = "application/x-ndjson"
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+
+async def stream_results(request: Request, plain_text: bool, model: str):
+    """
+    Generator pipeline behind /analyze/stream
+
+    Reads one chunk of lines, scores it (cache MGET -> batched inference ->
+    cache writeback + bulk INSERT) in a worker thread, yields its results,
+    then reads the next. Only one chunk is held at a time, and the body is
+    not read faster than the client consumes results. The whole stream is
+    scored by one model, even if another one is activated meanwhile.
+    """
+    start_time = time.time()
+    lines = scored = cache_hits = errors = 0
+    aborted = None
+
+    async def parsed_lines():
+        nonlocal lines
+        async for line in streaming.iter_lines(request.stream()):
+            lines += 1
+            yield streaming.parse_line(line, lines, plain_text)
+
+    try:
+        async for chunk in streaming.iter_chunks(parsed_lines()):
+            texts = [item["text"] for item in chunk if "text" in item]
+            # Background job: wait for batch-priority admission instead of failing
+            results = await asyncio.to_thread(score_texts, texts, model, "batch", None, True) if texts else {}
+
+            output = bytearray()
+            for item in chunk:
+                if "text" not in item:
+                    errors += 1
+                    output += streaming.encode_record(item)
+                    continue
+
+                response_data, cached = results[item["text"]]
+                scored += 1
+                cache_hits += cached
+                output += streaming.encode_record({
+                    "line": item["line"],
+                    "id": item["id"],
+                    "sentiment": response_data["sentiment"],
+                    "confidence": response_data["confidence"],
+                    "cached": cached
+                })
+            yield bytes(output)
+    except streaming.LineTooLongError as e:
+        aborted = str(e)
+    except Exception as e:
+        metrics.count_error("request")
+        log_event(logger, "stream_aborted", logging.WARNING, lines=lines, error=str(e))
+        aborted = str(e)
+
+    yield streaming.encode_record(streaming.summary_record(
+        lines, scored, cache_hits, errors, time.time() - start_time, aborted
+    ))
+
+@app.post("/analyze/long", response_model=LongTextResponse, response_model_exclude_none=True)
+def analyze_long_text(request: LongTextRequest):
+    """
+    Analyze a document longer than the model's 512-token window.
+
+    The text is tokenized once and split into overlapping windows; every
+    window not already cached is scored in one batched call and the
+    window probabilities are aggregated (mean, length_weighted or max).
+    Set return_chunks to get each window's result. Long documents are
+    not stored in /history. The uncached windows go through admission
+    control as one request; shed requests get 503 with Retry-After.
+    """
+    start_time = time.time()
+    deadline = admission.deadline_from(request.deadline_ms)
+    metrics.handler_started()
+
+    try:
+        result = long_text.analyze_long(
+            request.text, request.aggregation, request.return_chunks,
+            registry.model_registry.resolve(request.model),
+            lambda windows: admission_controller.slot(windows, request.priority, deadline, timed=True)
+        )
+        return LongTextResponse(
+            **result,
+            processing_time_ms=int((time.time() - start_time) * 1000),
+            cached=result["cached_chunks"] == result["chunks"]
+        )
+    except UnknownModelError:
+        raise HTTPException(status_code=404, detail=f"Unknown model: {request.model}")
+    except ModelNotLoadedError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except long_text.DocumentTooLongError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except OverloadedError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except NotImplementedError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    except Exception as e:
+        metrics.count_error("request")
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        metrics.handler_finished()
+
+@app.post("/analyze/stream")
+async def analyze_stream(request: Request, model: Optional[str] = Query(None, max_length=64)):
+    """
+    Analyze a large corpus as a stream.
+
+    The body is newline-delimited JSON - one {"id": ..., "text": ...}
+    object (or JSON string) per line - or, with Content-Type text/plain,
+    one raw text per line. Results stream back as NDJSON in input order,
+    one {"line", "id", "sentiment", "confidence", "cached"} record per line
+    (or {"line", "id", "error"} for invalid lines), followed by a final
+    {"summary": {...}} record with counts and throughput.
+    Pass ?model= to pin a loaded model.
+    """
+    try:
+        model_id = registry.model_registry.resolve(model)
+    except UnknownModelError:
+        raise HTTPException(status_code=404, detail=f"Unknown model: {model}")
+    except ModelNotLoadedError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    plain_text = request.headers.get("content-type", "").startswith("text/plain")
+    return NDJSONStreamingResponse(stream_results(request, plain_text, model_id))
 
 @app.get("/health")
 def health():
-    """Kubernetes-style health check"""
+    """Kubernetes-style health check (liveness - the process is up)"""
     return {"status": "ok"}
 
+@app.get("/ready")
+def ready():
+    """
+    Readiness check
+
+    Returns 503 until the model has loaded and completed a warm-up inference
+    """
+    if inference.is_ready():
+        return {"status": "ready"}
+    return JSONResponse(
+        status_code=503,
+        content={"status": inference.startup_diagnostics["state"]}
+    )
+
+@app.get("/diagnostics/startup")
+def get_startup_diagnostics():
+    """
+    Cold-start phase timings
+
+    Shows how long importing torch/transformers, loading weights
+    and the first forward pass took
+    """
+    return inference.startup_diagnostics
+
 @app.get("/history", response_model=HistoryResponse)
 def get_history(
-    limit: int = 10,
+    limit: int = Query(10, ge=1, le=HISTORY_MAX_LIMIT),
+    before: Optional[str] = None,
+    sentiment: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
     db: Session = Depends(get_db)
 ):
     """
     Get sentiment analysis history from database
 
-    Returns recent analyses ordered by creation date (newest first)
+    Returns analyses newest first, one page at a time. Pass the response's
+    next_cursor as `before` to get the next page. Optional filters:
+    sentiment label and a [since, until) created_at range.
+    total is estimated or cached (see total_is_estimate), not counted per call.
     """
     try:
-        # Get total count
-        total = db.query(SentimentAnalysis).count()
-
-        # Get recent analyses
-        analyses = db.query(SentimentAnalysis)\
-            .order_by(SentimentAnalysis.created_at.desc())\
-            .limit(limit)\
-            .all()
+        analyses, next_cursor = history.get_page(db, limit, before, sentiment, since, until)
+        total, total_is_estimate = history.get_total(db, sentiment, since, until)
 
         # Convert to response format
         history_items = [
@@ -156,23 +746,222 @@ def get_history(
                 sentiment=a.sentiment,
                 confidence=a.confidence,
                 processing_time_ms=a.processing_time_ms,
-                created_at=a.created_at.isoformat()
+                created_at=a.created_at.isoformat(),
+                model=a.model
             )
             for a in analyses
         ]
 
-        return HistoryResponse(total=total, analyses=history_items)
+        return HistoryResponse(
+            total=total,
+            total_is_estimate=total_is_estimate,
+            next_cursor=next_cursor,
+            analyses=history_items
+        )
+    except history.InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/analytics")
+def get_sentiment_analytics(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    granularity: Optional[Literal["minute", "hour", "day"]] = None,
+    sentiment: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Sentiment volume and average confidence over time
+
+    Answered from the pre-aggregated rollup table, so the cost depends on
+    the number of buckets, not the number of analyses in the range
+    """
+    try:
+        return analytics.get_analytics(db, since, until, granularity, sentiment)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.get("/cache/stats")
 def get_cache_statistics():
     """
     Get Redis cache statistics
     
-    Shows cache hit rate, memory usage, and key counts
+    Shows cache hit rate, memory usage, and key counts, plus
+    normalized / near-duplicate hits and how often they disagreed
+    with a fresh model run
+    """
+    stats = cache.get_cache_stats()
+    stats["near_duplicates"] = near_duplicates.get_stats()
+    return stats
+
+
+@app.get("/batching/stats")
+def get_batching_statistics():
+    """
+    Get micro-batching statistics
+
+    Shows queue depth, batch-size histogram and flush reasons
+    """
+    return batcher.get_stats()
+
+
+@app.get("/admission/stats")
+def get_admission_statistics():
+    """
+    Get admission control statistics
+
+    Shows texts in flight, the predicted wait for the model and how many
+    requests were admitted, shed, degraded or dropped at their deadline per priority
+    """
+    return admission_controller.get_stats()
+
+
+@app.get("/persistence/stats")
+def get_persistence_statistics():
+    """
+    Get write-behind persistence statistics
+
+    Shows queue depth, rows written and backpressure/drop counters
+    """
+    if not write_behind:
+        return {"enabled": False}
+    return write_behind.get_stats()
+
+
+@app.get("/database/stats")
+def get_database_statistics():
+    """
+    Get database connection pool statistics
+
+    Shows pool saturation and how long checkouts waited for a connection
+    """
+    return get_pool_stats()
+
+
+@app.get("/metrics")
+def get_metrics():
+    """
+    Prometheus metrics
+
+    Per-stage latency histograms, cache hit/miss and error counters,
+    in-flight requests and queue depths (aggregated across workers
+    when PROMETHEUS_MULTIPROC_DIR is set)
+    """
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
+
+@app.get("/inference/stats")
+def get_inference_statistics():
+    """
+    Get inference backend statistics
+
+    Shows texts per token-length bucket and padding-waste ratio
+    """
+    return registry.get_backend().get_stats()
+
+
+@app.get("/models")
+def list_models():
+    """
+    List registered models
+
+    Shows which are loaded, which one unpinned requests use, and the
+    progress / report of the last load or swap
+    """
+    return registry.model_registry.get_models()
+
+
+def start_model_load(model_id: str, activate: bool, prepare=None) -> dict:
+    """Start a background load / swap and map registry errors to HTTP errors"""
+    try:
+        started = registry.model_registry.load(model_id, activate=activate, prepare=prepare)
+    except UnknownModelError:
+        raise HTTPException(status_code=404, detail=f"Unknown model: {model_id}")
+    except NotImplementedError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    if not started:
+        raise HTTPException(status_code=409, detail="A model load is already running")
+    return registry.model_registry.get_swap_report()
+
+
+@app.post("/models/{model_id}/load", status_code=202)
+def load_model(model_id: str):
+    """
+    Load a model next to the active one without switching to it
+
+    Requests can then pin it (e.g. to compare versions on live traffic).
+    Poll GET /models for progress
+    """
+    return start_model_load(model_id, activate=False)
+
+
+@app.post("/models/{model_id}/activate", status_code=202)
+def activate_model(
+    model_id: str,
+    warm_limit: int = Query(warming.CACHE_WARM_LIMIT, ge=0, le=1000000),
+    warm_strategy: Literal["frequent", "recent", "mixed"] = warming.CACHE_WARM_STRATEGY
+):
+    """
+    Hot-swap the model unpinned requests use, without downtime
+
+    In the background: load the model (unless already loaded), run a
+    warm-up forward pass, pre-fill its cache namespace with up to
+    warm_limit texts from past traffic (0 skips this), then switch.
+    Other workers follow within MODEL_SYNC_SECONDS. Poll GET /models for progress
+    """
+    prepare = None
+    if warm_limit > 0:
+        prepare = lambda backend: warmer.run(warm_limit, warm_strategy, backend.model_id)
+    return start_model_load(model_id, activate=True, prepare=prepare)
+
+
+@app.delete("/models/{model_id}")
+def unload_model(model_id: str):
+    """Unload a model that is not active (requests pinned to it then get 409)"""
+    try:
+        unloaded = registry.model_registry.unload(model_id)
+    except UnknownModelError:
+        raise HTTPException(status_code=404, detail=f"Unknown model: {model_id}")
+    if not unloaded:
+        raise HTTPException(status_code=409, detail=f"Model {model_id} is active or not loaded")
+    return {"message": f"Model {model_id} unloaded"}
+
+
+@app.get("/coalescing/stats")
+def get_coalescing_statistics():
+    """
+    Get request coalescing statistics
+
+    Shows how many requests shared another request's inference
+    """
+    return coalescing.get_coalescing_stats()
+
+
+@app.post("/cache/warm", status_code=202)
+def warm_cache_endpoint(
+    limit: int = Query(warming.CACHE_WARM_LIMIT, ge=1, le=1000000),
+    strategy: Literal["frequent", "recent", "mixed"] = warming.CACHE_WARM_STRATEGY
+):
+    """
+    Start re-filling the cache from historical traffic in the background
+
+    Poll GET /cache/warm for progress and the final report
+    """
+    if not warmer.start(limit, strategy):
+        raise HTTPException(status_code=409, detail="A cache warm-up is already running")
+    return warmer.get_report()
+
+
+@app.get("/cache/warm")
+def get_cache_warm_status():
+    """
+    Get the running cache warm-up's progress, or the last one's report
+
+    Includes texts selected, already cached and warmed, and the time taken
     """
-    return cache.get_cache_stats()
+    return warmer.get_report()
 
 
 @app.delete("/cache/clear")
@@ -185,6 +974,8 @@ def clear_cache_endpoint():
     success = cache.clear_cache()
     
     if success:
+        if CACHE_WARM_AFTER_CLEAR:
+            warmer.start()
         return {"message": "Cache cleared successfully"}
     else:
         return {"message": "Failed to clear cache"}
\ No newline at end of file
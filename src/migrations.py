@@ -0,0 +1,160 @@
+"""
+One-off schema migrations
+
+--text-store moves texts out of sentiment_analyses: each distinct text is
+stored once in sentiment_texts and every analysis row references it by id.
+It works in batches, commits as it goes and can be re-run after an
+interruption (rows that already have a text_id are skipped).
+
+Usage:
+    python -m src.migrations --text-store                 # backfill, drop the inline column
+    python -m src.migrations --text-store --vacuum-full   # also rewrite the table to return space to the OS
+"""
+
+import argparse
+import json
+import os
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from sqlalchemy import inspect, text
+
+from .database import Base, SentimentAnalysis, SessionLocal, engine, store_texts
+
+# Rows backfilled per transaction
+MIGRATION_BATCH_SIZE = int(os.getenv("MIGRATION_BATCH_SIZE", "5000"))
+
+
+def _columns(table: str) -> set:
+    return {column["name"] for column in inspect(engine).get_columns(table)}
+
+
+def storage_bytes(tables=("sentiment_analyses", "sentiment_texts")) -> Optional[int]:
+    """
+    On-disk size of the analysis tables (including indexes and TOAST)
+
+    Returns:
+        Bytes used, or None if the database can't report it
+    """
+    with engine.connect() as conn:
+        if engine.dialect.name == "postgresql":
+            return sum(
+                conn.execute(text("SELECT COALESCE(pg_total_relation_size(to_regclass(:t)), 0)"), {"t": t}).scalar()
+                for t in tables
+            )
+        if engine.dialect.name == "sqlite":
+            # Whole file minus free pages - SQLite has no per-table size without dbstat
+            page_size = conn.execute(text("PRAGMA page_size")).scalar()
+            used_pages = conn.execute(text("PRAGMA page_count")).scalar() - conn.execute(text("PRAGMA freelist_count")).scalar()
+            return page_size * used_pages
+    return None
+
+
+def migrate_text_store(batch_size: int = MIGRATION_BATCH_SIZE, vacuum_full: bool = False) -> Dict[str, Any]:
+    """
+    Backfill sentiment_texts from the inline text column, then drop the column
+
+    Args:
+        batch_size: Rows per transaction
+        vacuum_full: Rewrite the tables afterwards so freed space is returned
+            (PostgreSQL VACUUM FULL locks the table; SQLite always vacuums)
+
+    Returns:
+        Report with row / distinct text counts and bytes before and after
+    """
+    started = time.perf_counter()
+    if "text" not in _columns(SentimentAnalysis.__tablename__):
+        return {"status": "already migrated"}
+
+    bytes_before = storage_bytes()
+    Base.metadata.create_all(bind=engine)
+
+    with engine.begin() as conn:
+        if "text_id" not in _columns(SentimentAnalysis.__tablename__):
+            conn.execute(text("ALTER TABLE sentiment_analyses ADD COLUMN text_id INTEGER REFERENCES sentiment_texts(id)"))
+        inline_text_bytes = conn.execute(text("SELECT COALESCE(SUM(LENGTH(text)), 0) FROM sentiment_analyses")).scalar()
+
+    rows_done, last_id = 0, 0
+    while True:
+        db = SessionLocal()
+        try:
+            batch = db.execute(text(
+                "SELECT id, text, sentiment, confidence, created_at FROM sentiment_analyses "
+                "WHERE text_id IS NULL AND id > :last_id ORDER BY id LIMIT :limit"
+            ), {"last_id": last_id, "limit": batch_size}).mappings().all()
+            if not batch:
+                break
+
+            rows = [dict(row) for row in batch]
+            for row in rows:
+                # Raw SELECTs on SQLite return timestamps as text
+                if isinstance(row["created_at"], str):
+                    row["created_at"] = datetime.fromisoformat(row["created_at"])
+            text_ids = store_texts(db, rows)
+            db.execute(
+                text("UPDATE sentiment_analyses SET text_id = :text_id WHERE id = :id"),
+                [{"text_id": text_ids[row["text"]], "id": row["id"]} for row in batch]
+            )
+            db.commit()
+        finally:
+            db.close()
+
+        rows_done += len(batch)
+        last_id = batch[-1]["id"]
+        print(f"Backfilled {rows_done:,} rows")
+
+    with engine.begin() as conn:
+        distinct_texts = conn.execute(text("SELECT COUNT(*) FROM sentiment_texts")).scalar()
+        stored_text_bytes = conn.execute(text("SELECT COALESCE(SUM(LENGTH(text)), 0) FROM sentiment_texts")).scalar()
+        total_rows = conn.execute(text("SELECT COUNT(*) FROM sentiment_analyses")).scalar()
+
+        conn.execute(text("ALTER TABLE sentiment_analyses DROP COLUMN text"))
+        if engine.dialect.name == "postgresql":
+            # SQLite can't add NOT NULL to an existing column; the model enforces it there
+            conn.execute(text("ALTER TABLE sentiment_analyses ALTER COLUMN text_id SET NOT NULL"))
+
+    if vacuum_full or engine.dialect.name == "sqlite":
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            if engine.dialect.name == "postgresql":
+                conn.execute(text("VACUUM FULL sentiment_analyses"))
+            else:
+                conn.execute(text("VACUUM"))
+
+    bytes_after = storage_bytes()
+    report = {
+        "status": "migrated",
+        "rows": total_rows,
+        "rows_backfilled": rows_done,
+        "distinct_texts": distinct_texts,
+        "duplication_ratio": round(total_rows / distinct_texts, 2) if distinct_texts else None,
+        # Characters of text stored before vs after
+        "inline_text_chars": inline_text_bytes,
+        "stored_text_chars": stored_text_bytes,
+        "bytes_before": bytes_before,
+        "bytes_after": bytes_after,
+        "elapsed_seconds": round(time.perf_counter() - started, 1)
+    }
+    if bytes_before and bytes_after is not None:
+        report["bytes_saved"] = bytes_before - bytes_after
+    if engine.dialect.name == "postgresql" and not vacuum_full:
+        report["note"] = "Dropped-column space is reused by new rows; run with --vacuum-full to return it to the OS"
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Schema migrations")
+    parser.add_argument("--text-store", action="store_true", help="move texts into the deduplicated sentiment_texts table")
+    parser.add_argument("--batch-size", type=int, default=MIGRATION_BATCH_SIZE, help="rows per transaction")
+    parser.add_argument("--vacuum-full", action="store_true", help="rewrite tables afterwards to release space (locks them)")
+    args = parser.parse_args()
+
+    if not args.text_store:
+        parser.print_help()
+        return
+
+    print(json.dumps(migrate_text_store(args.batch_size, args.vacuum_full), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,488 @@
+"""
+Second-chance cache lookups for texts that are almost, but not exactly, cached
+
+The exact cache key hashes the raw text, so "I love this product!" and
+"i love this product !!" are different entries. When enabled, an exact
+miss gets two more chances before the model runs:
+
+    normalized     - the text with case, whitespace and runs of punctuation
+                     folded is looked up under its own key (L1, then Redis,
+                     shared by every worker)
+    near_duplicate - a MinHash LSH index over character shingles (NumPy
+                     arrays, per worker) returns the result of the most
+                     similar recently analyzed text when the estimated
+                     Jaccard similarity reaches NEAR_DUPLICATE_THRESHOLD
+
+Both tiers only apply to texts at least NEAR_DUPLICATE_MIN_CHARS long once
+normalized
+
+A sample of second-chance hits (NEAR_DUPLICATE_VERIFY_RATE) is re-run
+through the model in the background to count how often the reused result
+disagrees with a fresh one
+"""
+
+import hashlib
+import logging
+import os
+import random
+import re
+import threading
+import time
+import unicodedata
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from . import cache, metrics
+from .logs import get_logger, log_event
+from .registry import active_model_id
+
+# Off by default: a second-chance hit can differ from what the model would say
+NEAR_DUPLICATE_ENABLED = os.getenv("NEAR_DUPLICATE_ENABLED", "false").lower() == "true"
+
+# Minimum estimated Jaccard similarity (of character shingles) for a near-duplicate hit
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.9"))
+
+# Shorter normalized texts skip both second-chance tiers - one changed word or
+# mark ("good" -> "not good", ":)" -> ":(") is a large share of a short text's meaning
+NEAR_DUPLICATE_MIN_CHARS = int(os.getenv("NEAR_DUPLICATE_MIN_CHARS", "20"))
+
+# Texts kept in each worker's MinHash index (oldest are overwritten)
+NEAR_DUPLICATE_MAX_ENTRIES = int(os.getenv("NEAR_DUPLICATE_MAX_ENTRIES", "20000"))
+
+# Share of second-chance hits re-checked against a fresh model run
+NEAR_DUPLICATE_VERIFY_RATE = float(os.getenv("NEAR_DUPLICATE_VERIFY_RATE", "0.01"))
+
+# MinHash signature length and LSH banding (bands x rows must equal the length)
+# 16 bands of 4 rows: pairs at 0.9 similarity become candidates ~100% of the time, at 0.5 ~65%
+MINHASH_PERMUTATIONS = 64
+LSH_BANDS = 16
+
+# Characters per shingle
+SHINGLE_SIZE = 3
+
+# Smallest prime above 2^32: (a * x + b) mod p over 32-bit shingle hashes
+_PRIME = np.uint64(4294967311)
+_rng = np.random.RandomState(42)
+_PERM_A = _rng.randint(1, 2 ** 32 - 1, size=MINHASH_PERMUTATIONS, dtype=np.uint64)
+_PERM_B = _rng.randint(0, 2 ** 32 - 1, size=MINHASH_PERMUTATIONS, dtype=np.uint64)
+
+
+# Runs of marks (anything but letters, digits and whitespace)
+_MARK_RUN = re.compile(r"[^\w\s]+")
+
+# A character repeated within a run ("!!!" -> "!", ":))" -> ":)")
+_REPEATED = re.compile(r"(.)\1+")
+
+# Single marks that carry sentiment on their own; other lone punctuation is dropped
+_SENTIMENT_MARKS = {"!", "?"}
+
+
+def _fold_marks(match: "re.Match") -> str:
+    run = match.group()
+    if not any(unicodedata.category(ch).startswith("P") for ch in run):
+        # Symbols alone (emoji, currency) stay attached as written
+        return run
+    run = _REPEATED.sub(r"\1", run)
+    if len(run) == 1 and run not in _SENTIMENT_MARKS:
+        return " "
+    # Emoticons and !/? become tokens of their own, so "product!" matches "product !!"
+    return f" {run} "
+
+
+def normalize_text(text: str) -> str:
+    """
+    Fold case, whitespace and runs of punctuation
+
+    Repeated marks are squeezed and lone neutral punctuation (. , ' ...) is
+    dropped; emoticons, ! and ?, symbols (emoji, currency) and digits are
+    kept - they carry sentiment
+
+    Args:
+        text: Raw input text
+
+    Returns:
+        Normalized text (e.g., "I love this product!!" -> "i love this product !",
+        "Good :))" -> "good :)")
+    """
+    folded = _MARK_RUN.sub(_fold_marks, unicodedata.normalize("NFKC", text).casefold())
+    return " ".join(folded.split())
+
+
+def _long_enough(normalized: str) -> bool:
+    """Whether a normalized text may use the second-chance tiers"""
+    return len(normalized) >= max(NEAR_DUPLICATE_MIN_CHARS, 1)
+
+
+def normalized_cache_key(normalized: str, model: Optional[str] = None) -> str:
+    """Cache key for a normalized text (same generation / model scheme as exact keys)"""
+    text_hash = hashlib.sha256(normalized.encode()).hexdigest()[:16]
+    return f"sentiment:{cache.current_generation()}:{model or active_model_id()}:norm:{text_hash}"
+
+
+def minhash_signature(normalized: str) -> np.ndarray:
+    """
+    MinHash signature of a text's character shingles
+
+    Args:
+        normalized: Output of normalize_text
+
+    Returns:
+        uint32 array of MINHASH_PERMUTATIONS values
+    """
+    if len(normalized) <= SHINGLE_SIZE:
+        shingles = {normalized}
+    else:
+        shingles = {normalized[i:i + SHINGLE_SIZE] for i in range(len(normalized) - SHINGLE_SIZE + 1)}
+    hashes = np.fromiter((zlib.crc32(s.encode()) for s in shingles), dtype=np.uint64, count=len(shingles))
+
+    # One row per permutation, one column per shingle; keep each row's minimum
+    permuted = (_PERM_A[:, None] * hashes[None, :] + _PERM_B[:, None]) % _PRIME
+    return permuted.min(axis=1).astype(np.uint32)
+
+
+class MinHashIndex:
+    """
+    Fixed-size LSH index of MinHash signatures and their cached results
+
+    Signatures live in one preallocated NumPy array used as a ring buffer;
+    each band of a signature maps to the slots that share it, so a query
+    only compares against candidates that collide in at least one band
+    """
+
+    def __init__(
+        self,
+        max_entries: int = NEAR_DUPLICATE_MAX_ENTRIES,
+        ttl_seconds: float = cache.CACHE_TTL_SECONDS,
+        bands: int = LSH_BANDS
+    ):
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self.bands = bands
+        self.rows = MINHASH_PERMUTATIONS // bands
+
+        self._signatures = np.zeros((self.max_entries, MINHASH_PERMUTATIONS), dtype=np.uint32)
+        self._expires_at = np.zeros(self.max_entries, dtype=np.float64)
+        self._results: List[Optional[Dict[str, Any]]] = [None] * self.max_entries
+        self._slot_bands: List[Optional[List[bytes]]] = [None] * self.max_entries
+        self._buckets: Dict[bytes, set] = {}
+        self._next_slot = 0
+        self._lock = threading.Lock()
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [
+            band.to_bytes(1, "little") + signature[band * self.rows:(band + 1) * self.rows].tobytes()
+            for band in range(self.bands)
+        ]
+
+    def add(self, signature: np.ndarray, result: Dict[str, Any]):
+        """Index a signature with its result, overwriting the oldest slot when full"""
+        band_keys = self._band_keys(signature)
+        with self._lock:
+            slot = self._next_slot
+            self._next_slot = (slot + 1) % self.max_entries
+
+            for key in self._slot_bands[slot] or ():
+                bucket = self._buckets.get(key)
+                if bucket is not None:
+                    bucket.discard(slot)
+                    if not bucket:
+                        del self._buckets[key]
+
+            self._signatures[slot] = signature
+            self._expires_at[slot] = time.monotonic() + self.ttl_seconds
+            self._results[slot] = dict(result)
+            self._slot_bands[slot] = band_keys
+            for key in band_keys:
+                self._buckets.setdefault(key, set()).add(slot)
+
+    def query(self, signature: np.ndarray, threshold: float) -> Optional[Tuple[Dict[str, Any], float]]:
+        """
+        Find the most similar live entry at or above the threshold
+
+        Returns:
+            (copy of its result, estimated similarity), or None
+        """
+        band_keys = self._band_keys(signature)
+        with self._lock:
+            candidates = set()
+            for key in band_keys:
+                candidates.update(self._buckets.get(key, ()))
+            if not candidates:
+                return None
+
+            slots = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+            slots = slots[self._expires_at[slots] > time.monotonic()]
+            if not len(slots):
+                return None
+
+            # Share of matching MinHash values estimates the Jaccard similarity
+            similarity = (self._signatures[slots] == signature).mean(axis=1)
+            best = int(similarity.argmax())
+            if similarity[best] < threshold:
+                return None
+            return dict(self._results[slots[best]]), float(similarity[best])
+
+    def clear(self):
+        """Drop every entry"""
+        with self._lock:
+            self._expires_at[:] = 0
+            self._results = [None] * self.max_entries
+            self._slot_bands = [None] * self.max_entries
+            self._buckets.clear()
+            self._next_slot = 0
+
+    def __len__(self) -> int:
+        return int((self._expires_at > time.monotonic()).sum())
+
+
+# Holds results of the active model only
+index = MinHashIndex()
+_index_owner: Optional[Tuple[int, str]] = None
+
+logger = get_logger("near_duplicates")
+
+_stats = {
+    "lookups": 0, "normalized_hits": 0, "near_duplicate_hits": 0, "misses": 0,
+    "verified": 0, "disagreements": 0
+}
+_stats_lock = threading.Lock()
+
+
+def _count(**deltas: int):
+    with _stats_lock:
+        for name, delta in deltas.items():
+            _stats[name] += delta
+
+
+def _current_index() -> MinHashIndex:
+    """The index, emptied first if the cache was cleared or another model became active"""
+    global _index_owner
+    owner = (cache.current_generation(), active_model_id())
+    if _index_owner != owner:
+        index.clear()
+        _index_owner = owner
+    return index
+
+
+def _near_duplicate(normalized: str, text: str, model: str) -> Optional[Dict[str, Any]]:
+    """Query the MinHash index (None for other models or no match)"""
+    if model != active_model_id():
+        return None
+    match = _current_index().query(minhash_signature(normalized), NEAR_DUPLICATE_THRESHOLD)
+    if match is None:
+        return None
+    result, _ = match
+    return {**result, "text": text}
+
+
+def _report_error(operation: str, error: Exception):
+    """Count and log a Redis failure (the lookup degrades to a miss)"""
+    metrics.count_error("cache")
+    log_event(logger, "cache_error", logging.WARNING, operation=operation, error=str(error))
+
+
+def _decode(data: bytes, text: str) -> Dict[str, Any]:
+    result = cache.decode_result(data, text)
+    result["text"] = text
+    return result
+
+
+def _finish(result: Optional[Dict[str, Any]], match: Optional[str]) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    if match == "normalized":
+        _count(normalized_hits=1)
+    elif match == "near_duplicate":
+        _count(near_duplicate_hits=1)
+    else:
+        _count(misses=1)
+    return result, match
+
+
+async def lookup_async(text: str, model: Optional[str] = None) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """
+    Second-chance lookup for a text that missed the exact cache
+
+    Args:
+        text: Input text
+        model: Model id namespace (default: the active model)
+
+    Returns:
+        (result dict, "normalized" or "near_duplicate"), or (None, None) on a miss
+    """
+    _count(lookups=1)
+    model = model or active_model_id()
+    normalized = normalize_text(text)
+    if not _long_enough(normalized):
+        return _finish(None, None)
+    key = normalized_cache_key(normalized, model)
+
+    result = cache.local_cache.get(key)
+    if result is None:
+        try:
+            data = await cache.async_redis_client.get(key)
+        except Exception as e:
+            _report_error("get_normalized", e)
+            data = None
+        if data:
+            result = _decode(data, text)
+            cache.local_cache.set(key, result)
+    if result is not None:
+        result["text"] = text
+        return _finish(result, "normalized")
+
+    result = _near_duplicate(normalized, text, model)
+    return _finish(result, "near_duplicate" if result else None)
+
+
+def lookup_many(texts: List[str], model: Optional[str] = None) -> List[Tuple[Optional[Dict[str, Any]], Optional[str]]]:
+    """
+    Second-chance lookup for many exact-cache misses with one MGET
+
+    Args:
+        texts: Input texts
+        model: Model id namespace (default: the active model)
+
+    Returns:
+        (result dict, match type) per text, as in lookup_async
+    """
+    if not texts:
+        return []
+
+    _count(lookups=len(texts))
+    model = model or active_model_id()
+    normalized = [normalize_text(text) for text in texts]
+    eligible = [_long_enough(n) for n in normalized]
+    keys = [normalized_cache_key(n, model) if ok else None for n, ok in zip(normalized, eligible)]
+    results = [cache.local_cache.get(key) if key else None for key in keys]
+
+    missing = [i for i, result in enumerate(results) if result is None and eligible[i]]
+    if missing:
+        try:
+            for i, data in zip(missing, cache.redis_client.mget([keys[i] for i in missing])):
+                if data:
+                    results[i] = _decode(data, texts[i])
+                    cache.local_cache.set(keys[i], results[i])
+        except Exception as e:
+            _report_error("get_normalized", e)
+
+    matches = []
+    for text, norm, ok, result in zip(texts, normalized, eligible, results):
+        if result is not None:
+            result["text"] = text
+            matches.append(_finish(result, "normalized"))
+            continue
+        result = _near_duplicate(norm, text, model) if ok else None
+        matches.append(_finish(result, "near_duplicate" if result else None))
+    return matches
+
+
+def _prepare(items: List[Tuple[str, Dict[str, Any]]], model: Optional[str]) -> List[Tuple[str, Dict[str, Any]]]:
+    """Index each fresh result and return the (normalized key, result) pairs to store (none for short texts)"""
+    model = model or active_model_id()
+    # Results of a pinned, non-active model are only stored under their normalized keys
+    current = _current_index() if model == active_model_id() else None
+    entries = []
+    for text, result in items:
+        normalized = normalize_text(text)
+        if not _long_enough(normalized):
+            continue
+        stored = {k: result[k] for k in ("sentiment", "confidence", "model") if k in result}
+        if current is not None:
+            current.add(minhash_signature(normalized), stored)
+        key = normalized_cache_key(normalized, model)
+        cache.local_cache.set(key, stored)
+        entries.append((key, stored))
+    return entries
+
+
+async def remember_async(text: str, result: Dict[str, Any], model: Optional[str] = None) -> bool:
+    """
+    Make a fresh model result findable by later near-duplicates
+
+    Args:
+        text: Input text that was analyzed
+        result: Its response dict
+        model: Model id that produced it (default: the active model)
+
+    Returns:
+        True if the normalized entry was stored in Redis (or the text is too short to need one)
+    """
+    entries = _prepare([(text, result)], model)
+    if not entries:
+        return True
+    [(key, stored)] = entries
+    try:
+        await cache.async_redis_client.setex(key, cache.CACHE_TTL_SECONDS, cache.encode_result(stored))
+        return True
+    except Exception as e:
+        _report_error("set_normalized", e)
+        return False
+
+
+def remember_many(items: List[Tuple[str, Dict[str, Any]]], model: Optional[str] = None) -> bool:
+    """
+    remember_async for many results with one pipelined SETEX
+
+    Args:
+        items: (text, result) pairs
+        model: Model id that produced them (default: the active model)
+
+    Returns:
+        True if the normalized entries were stored in Redis
+    """
+    entries = _prepare(items, model)
+    if not entries:
+        return True
+    try:
+        pipe = cache.redis_client.pipeline(transaction=False)
+        for key, stored in entries:
+            pipe.setex(key, cache.CACHE_TTL_SECONDS, cache.encode_result(stored))
+        pipe.execute()
+        return True
+    except Exception as e:
+        _report_error("set_normalized", e)
+        return False
+
+
+def should_verify() -> bool:
+    """Whether to re-check this second-chance hit against the model"""
+    return NEAR_DUPLICATE_VERIFY_RATE > 0 and random.random() < NEAR_DUPLICATE_VERIFY_RATE
+
+
+def record_verification(match: str, reused_label: str, fresh_label: str):
+    """
+    Count the outcome of re-running a second-chance hit through the model
+
+    Args:
+        match: "normalized" or "near_duplicate"
+        reused_label: Sentiment returned from the cache
+        fresh_label: Sentiment the model gave for the actual text
+    """
+    agreed = reused_label == fresh_label
+    _count(verified=1, disagreements=int(not agreed))
+    metrics.NEAR_DUPLICATE_VERIFICATIONS.labels(match, "agree" if agreed else "disagree").inc()
+
+
+def get_stats() -> Dict[str, Any]:
+    """
+    Get second-chance lookup statistics for this worker
+
+    Returns:
+        Dict with hits per tier, inference calls saved and the disagreement
+        rate measured on verified hits
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+
+    hits = stats["normalized_hits"] + stats["near_duplicate_hits"]
+    stats.update({
+        "enabled": NEAR_DUPLICATE_ENABLED,
+        "threshold": NEAR_DUPLICATE_THRESHOLD,
+        "index_entries": len(index),
+        # Every second-chance hit is one model call not made
+        "inference_saved": hits,
+        "hit_rate": round(hits / max(stats["lookups"], 1) * 100, 2),
+        "disagreement_rate": round(stats["disagreements"] / stats["verified"], 4) if stats["verified"] else None
+    })
+    return stats
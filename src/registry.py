@@ -0,0 +1,330 @@
+"""
+Model registry: several checkpoints by id, hot swaps without downtime
+
+Every model has a short id (its version tag, e.g. "distilbert-sst2-v2").
+The id is part of every cache key and is stored with every analysis row.
+Results from different models never mix, and swapping models needs no
+clear_cache. Entries of the previous model stay valid for a rollback.
+
+A swap runs in the background:
+    loading   - the new backend is loaded next to the active one
+    warming   - one forward pass, so the first real request is fast
+    preparing - optional hook (the API re-fills the new model's cache from past traffic)
+    switching - the active id is replaced in one assignment
+
+Requests already running finish on the model they started with. Requests
+can also pin any loaded model by id.
+
+With several workers the active id is also written to Redis. Every worker
+checks it every MODEL_SYNC_SECONDS and swaps on its own when it differs
+
+Usage:
+    MODEL_REGISTRY="distilbert-sst2=distilbert-base-uncased-finetuned-sst-2-english,sst2-v2=org/new-checkpoint"
+"""
+
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+from . import inference, metrics
+from .inference import INFERENCE_BACKEND, MODEL_NAME, MODEL_TAG, InferenceBackend
+from .logs import get_logger, log_event
+
+# Models that can be loaded, as comma-separated id=checkpoint pairs
+# (MODEL_TAG=MODEL_NAME is always included and is active at startup)
+MODEL_REGISTRY = os.getenv("MODEL_REGISTRY", "")
+
+# How often each worker checks Redis for a model activated by another worker
+MODEL_SYNC_SECONDS = float(os.getenv("MODEL_SYNC_SECONDS", "5"))
+
+# Active model id shared by every worker
+ACTIVE_MODEL_KEY = "sentiment:model:active"
+
+logger = get_logger("registry")
+
+
+class UnknownModelError(KeyError):
+    """Raised for a model id that is not in the registry"""
+
+
+class ModelNotLoadedError(RuntimeError):
+    """Raised when a request pins a registered model that is not loaded"""
+
+
+def parse_registry(spec: str = MODEL_REGISTRY) -> Dict[str, str]:
+    """
+    Parse MODEL_REGISTRY
+
+    Args:
+        spec: Comma-separated id=checkpoint pairs
+
+    Returns:
+        Dict of model id -> checkpoint, the default model first
+    """
+    models = {MODEL_TAG: MODEL_NAME}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        model_id, sep, checkpoint = entry.partition("=")
+        model_id, checkpoint = model_id.strip(), checkpoint.strip()
+        if not sep or not model_id or not checkpoint:
+            raise ValueError(f"MODEL_REGISTRY entries must look like id=checkpoint, got {entry!r}")
+        if ":" in model_id:
+            # Ids are a segment of colon-separated cache keys
+            raise ValueError(f"Model id {model_id!r} must not contain ':'")
+        models[model_id] = checkpoint
+    return models
+
+
+class ModelRegistry:
+    """
+    Loaded backends by model id, plus the id unpinned requests use
+
+    Usage:
+        backend = registry.get_backend()            # active model
+        backend = registry.get_backend("sst2-v2")   # pinned
+        registry.load("sst2-v2", activate=True)     # background hot swap
+    """
+
+    def __init__(self, models: Optional[Dict[str, str]] = None, default_id: str = MODEL_TAG):
+        self.models = models if models is not None else parse_registry()
+        self.default_id = default_id
+
+        self._active_id = default_id
+        self._backends: Dict[str, InferenceBackend] = {}
+        self._lock = threading.Lock()
+        self._swap_thread: Optional[threading.Thread] = None
+        self._swap: Dict[str, Any] = {"state": "idle"}
+
+        self._redis = None
+        self._sync_thread: Optional[threading.Thread] = None
+        self._sync_stop = threading.Event()
+
+    @property
+    def active_id(self) -> str:
+        """Model id unpinned requests use"""
+        return self._active_id
+
+    def resolve(self, model_id: Optional[str] = None) -> str:
+        """
+        Model id a request runs on: the pinned one, or the active model
+
+        Read once per request, so a swap mid-request doesn't mix models
+
+        Raises:
+            UnknownModelError: If model_id is not registered
+            ModelNotLoadedError: If it is registered but not loaded
+        """
+        if model_id is None:
+            return self._active_id
+        self._check_registered(model_id)
+        if model_id != self.default_id and model_id not in self._backends:
+            raise ModelNotLoadedError(f"Model {model_id!r} is not loaded - POST /models/{model_id}/load first")
+        return model_id
+
+    def _check_registered(self, model_id: str):
+        if model_id not in self.models:
+            raise UnknownModelError(model_id)
+
+    def get_backend(self, model_id: Optional[str] = None) -> InferenceBackend:
+        """
+        Backend for a model id (default: the active model)
+
+        The default model loads on first use, like inference.get_backend;
+        other models have to be loaded first (load)
+
+        Raises:
+            UnknownModelError: If model_id is not registered
+            ModelNotLoadedError: If it is registered but not loaded
+        """
+        model_id = self.resolve(model_id)
+        backend = self._backends.get(model_id)
+        if backend is None:
+            # Only the default model gets here
+            backend = inference.get_backend()
+            with self._lock:
+                self._backends.setdefault(model_id, backend)
+        return backend
+
+    def _load_backend(self, model_id: str) -> InferenceBackend:
+        if model_id == self.default_id:
+            return inference.get_backend()
+        return inference.load_backend(INFERENCE_BACKEND, self.models[model_id], model_id)
+
+    def load(
+        self,
+        model_id: str,
+        activate: bool = False,
+        prepare: Optional[Callable[[InferenceBackend], Any]] = None,
+        publish: bool = True
+    ) -> bool:
+        """
+        Load (and optionally switch to) a model in the background
+
+        Args:
+            model_id: Registered model id
+            activate: Make it the active model once it is ready
+            prepare: Called with the warmed-up backend before switching
+                (its return value is kept in the swap report)
+            publish: Tell the other workers through Redis after switching
+
+        Returns:
+            False if a load / swap is already running in this worker
+
+        Raises:
+            UnknownModelError: If model_id is not registered
+            NotImplementedError: For a non-default model with INFERENCE_BACKEND=pool
+        """
+        self._check_registered(model_id)
+        if model_id != self.default_id and INFERENCE_BACKEND == "pool":
+            raise NotImplementedError("The inference pool serves one checkpoint; restart it to change models")
+
+        with self._lock:
+            if self._swap_thread is not None and self._swap_thread.is_alive():
+                return False
+            self._swap = {"state": "starting", "model": model_id, "activate": activate}
+            self._swap_thread = threading.Thread(
+                target=self._run_swap, args=(model_id, activate, prepare, publish),
+                name="model-swap", daemon=True
+            )
+            self._swap_thread.start()
+            return True
+
+    def _run_swap(self, model_id: str, activate: bool, prepare, publish: bool):
+        started = time.perf_counter()
+        report: Dict[str, Any] = {
+            "state": "loading", "model": model_id, "activate": activate,
+            "previous": self._active_id, "started_at": datetime.utcnow().isoformat()
+        }
+        self._swap = report
+
+        def phase_done(name: str, since: float) -> float:
+            now = time.perf_counter()
+            report[f"{name}_ms"] = round((now - since) * 1000, 1)
+            return now
+
+        try:
+            mark = time.perf_counter()
+            backend = self._backends.get(model_id) or self._load_backend(model_id)
+            mark = phase_done("load", mark)
+
+            report["state"] = "warming"
+            backend.predict(["Warm-up inference"])
+            mark = phase_done("warm_up", mark)
+            with self._lock:
+                self._backends[model_id] = backend
+
+            if activate and prepare is not None:
+                report["state"] = "preparing"
+                report["prepared"] = prepare(backend)
+                mark = phase_done("prepare", mark)
+
+            if activate:
+                report["state"] = "switching"
+                # One reference assignment: requests read the id once and keep their backend
+                self._active_id = model_id
+                if publish and self._redis is not None:
+                    try:
+                        self._redis.set(ACTIVE_MODEL_KEY, model_id)
+                    except Exception as e:
+                        # This worker switched; the others keep their model until the next swap
+                        report["publish_error"] = str(e)
+
+            report["state"] = "finished"
+        except Exception as e:
+            report["state"] = "failed"
+            report["error"] = str(e)
+            metrics.count_error("inference")
+        finally:
+            report["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            log_event(
+                logger, "model_swap", logging.WARNING if report["state"] == "failed" else logging.INFO,
+                **{k: v for k, v in report.items() if k not in ("started_at", "prepared")}
+            )
+
+    def unload(self, model_id: str) -> bool:
+        """
+        Drop a loaded model that is not active (pinned requests to it then fail)
+
+        Returns:
+            False if it is the active model or not loaded
+        """
+        self._check_registered(model_id)
+        with self._lock:
+            if model_id == self._active_id or model_id not in self._backends:
+                return False
+            del self._backends[model_id]
+            return True
+
+    def get_models(self) -> Dict[str, Any]:
+        """
+        Registered models, which are loaded / active, and the last swap
+
+        Returns:
+            Dict with active id, per-model status and the swap report
+        """
+        return {
+            "active": self._active_id,
+            "models": [
+                {
+                    "id": model_id,
+                    "checkpoint": checkpoint,
+                    "loaded": model_id in self._backends,
+                    "active": model_id == self._active_id,
+                    "tag": self._backends[model_id].tag if model_id in self._backends else None
+                }
+                for model_id, checkpoint in self.models.items()
+            ],
+            "swap": dict(self._swap)
+        }
+
+    def get_swap_report(self) -> Dict[str, Any]:
+        """Progress of the running load / swap, or the report of the last one"""
+        return dict(self._swap)
+
+    def _sync(self):
+        """Follow the active model id other workers wrote to Redis"""
+        while not self._sync_stop.is_set():
+            try:
+                value = self._redis.get(ACTIVE_MODEL_KEY)
+                model_id = value.decode() if isinstance(value, bytes) else value
+                if model_id and model_id != self._active_id and model_id in self.models:
+                    self.load(model_id, activate=True, publish=False)
+            except Exception as e:
+                log_event(logger, "model_sync_error", logging.WARNING, error=str(e))
+            self._sync_stop.wait(MODEL_SYNC_SECONDS)
+
+    def start_sync(self, redis_client):
+        """
+        Start following the active model in Redis (safe to call multiple times)
+
+        Args:
+            redis_client: Sync Redis client shared with the cache
+        """
+        self._redis = redis_client
+        if self._sync_thread is None or not self._sync_thread.is_alive():
+            self._sync_stop.clear()
+            self._sync_thread = threading.Thread(target=self._sync, name="model-sync", daemon=True)
+            self._sync_thread.start()
+
+    def stop_sync(self):
+        """Stop the sync thread"""
+        self._sync_stop.set()
+        if self._sync_thread is not None:
+            self._sync_thread.join(timeout=2.0)
+            self._sync_thread = None
+
+
+# The process-wide registry
+model_registry = ModelRegistry()
+
+
+def active_model_id() -> str:
+    """Model id unpinned requests use (never loads anything)"""
+    return model_registry.active_id
+
+
+def get_backend(model_id: Optional[str] = None) -> InferenceBackend:
+    """Backend for a model id, or the active model (see ModelRegistry.get_backend)"""
+    return model_registry.get_backend(model_id)
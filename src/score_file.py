@@ -0,0 +1,504 @@
+"""
+Offline batch scoring of CSV / Parquet / JSONL files
+
+Scores a file in chunks with the same model loading (inference) and cache
+layer (cache) as the API, runs inference on a process pool, appends results
+to an output file as it goes and optionally bulk-loads them into
+sentiment_analyses with COPY
+
+Progress is checkpointed after every chunk: a killed job rerun with the
+same arguments truncates the output back to the last checkpoint and
+resumes from the next unscored row. Rows loaded with --load-db in the chunk
+that was in flight when the job died may be loaded twice.
+
+Usage:
+    python -m src.score_file reviews.csv scores.jsonl --text-column body --id-column review_id
+    python -m src.score_file export.parquet scores.csv --workers 4 --load-db
+"""
+
+import argparse
+import csv
+import gc
+import json
+import math
+import multiprocessing
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from . import cache, inference
+from .database import SessionLocal, copy_analyses, init_db
+from .worker_pool import split_cores
+
+# Rows per chunk (one cache MGET, one round of pool inference, one checkpoint)
+SCORE_CHUNK_SIZE = int(os.getenv("SCORE_CHUNK_SIZE", "2000"))
+
+# Inference worker processes (0 runs the model in this process)
+SCORE_WORKERS = int(os.getenv("SCORE_WORKERS", "2"))
+
+# Max texts per forward pass inside a worker
+SCORE_BATCH_SIZE = int(os.getenv("SCORE_BATCH_SIZE", "32"))
+
+# Seconds between progress lines
+SCORE_PROGRESS_SECONDS = float(os.getenv("SCORE_PROGRESS_SECONDS", "5"))
+
+# Longest text accepted - matches the sentiment_analyses.text column
+MAX_TEXT_LENGTH = 512
+
+OUTPUT_FIELDS = ["row", "id", "sentiment", "confidence", "cached", "error"]
+
+
+def detect_format(path: str) -> str:
+    """Infer "csv", "jsonl" or "parquet" from a file extension"""
+    suffix = Path(path).suffix.lower()
+    if suffix in (".csv", ".tsv"):
+        return "csv"
+    if suffix in (".jsonl", ".ndjson"):
+        return "jsonl"
+    if suffix in (".parquet", ".pq"):
+        return "parquet"
+    raise ValueError(f"Unsupported file type: {path} (expected .csv, .jsonl or .parquet)")
+
+
+def count_rows(path: str, fmt: str) -> Optional[int]:
+    """
+    Count input rows for the ETA
+
+    Returns:
+        Row count (newline-based, so approximate for CSVs with multi-line fields),
+        None if it can't be determined cheaply
+    """
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(path).metadata.num_rows
+
+    lines = 0
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            lines += block.count(b"\n")
+    return max(lines - 1, 0) if fmt == "csv" else lines
+
+
+def read_rows(path: str, fmt: str, text_column: str, id_column: Optional[str], skip: int = 0) -> Iterator[Tuple[int, Any, Any]]:
+    """
+    Stream (row_number, id, text) from an input file
+
+    Args:
+        path: Input file
+        fmt: "csv", "jsonl" or "parquet"
+        text_column: Column / key holding the text
+        id_column: Column / key carried through to the output (default: none)
+        skip: Rows already scored by an earlier run
+
+    Returns:
+        Iterator of (0-based row number, id or None, text or None)
+    """
+    def records() -> Iterator[Dict[str, Any]]:
+        if fmt == "csv":
+            with open(path, newline="", encoding="utf-8") as f:
+                dialect = "excel-tab" if path.lower().endswith(".tsv") else "excel"
+                yield from csv.DictReader(f, dialect=dialect)
+        elif fmt == "jsonl":
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        yield None
+        else:
+            import pyarrow.parquet as pq
+            columns = [text_column] + ([id_column] if id_column else [])
+            for batch in pq.ParquetFile(path).iter_batches(columns=columns):
+                yield from batch.to_pylist()
+
+    for row_number, record in enumerate(records()):
+        if row_number < skip:
+            continue
+        if not isinstance(record, dict):
+            # A JSONL line that isn't valid JSON or holds a bare string / number / list:
+            # an error row, like a missing text
+            yield row_number, None, None
+            continue
+        yield row_number, record.get(id_column) if id_column else None, record.get(text_column)
+
+
+class ResultWriter:
+    """Appends result records to a .jsonl or .csv output file"""
+
+    def __init__(self, path: str, resume_at: int):
+        self.path = path
+        self.format = "csv" if Path(path).suffix.lower() == ".csv" else "jsonl"
+
+        # Drop anything written after the last checkpoint (a partially written chunk)
+        self._file = open(path, "a", newline="", encoding="utf-8")
+        self._file.truncate(resume_at)
+
+        self._csv = csv.DictWriter(self._file, OUTPUT_FIELDS) if self.format == "csv" else None
+        if self._csv and resume_at == 0:
+            self._csv.writeheader()
+
+    def write(self, records: List[Dict[str, Any]]):
+        for record in records:
+            if self._csv:
+                self._csv.writerow(record)
+            else:
+                self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def sync(self) -> int:
+        """Flush to disk and return the output size to checkpoint"""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return self._file.tell()
+
+    def close(self):
+        self._file.close()
+
+
+def load_checkpoint(path: str) -> Optional[Dict[str, Any]]:
+    """Read a checkpoint file, or None if there isn't one"""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def save_checkpoint(path: str, checkpoint: Dict[str, Any]):
+    """Write the checkpoint atomically so a kill mid-write can't corrupt it"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(checkpoint, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+# Set in each pool worker by _init_worker
+_worker_backend = None
+
+
+def _init_worker(backend, backend_name: str, core_slices: List[List[int]], counter):
+    """Pool initializer: pin to a core slice, then use the forked model or load one"""
+    global _worker_backend
+
+    with counter.get_lock():
+        worker_id = counter.value
+        counter.value += 1
+    cores = core_slices[worker_id % len(core_slices)]
+    os.sched_setaffinity(0, cores)
+
+    if backend is None:
+        inference.INFERENCE_THREADS = len(cores)
+        backend = inference.load_backend(backend_name)
+    else:
+        import torch
+        torch.set_num_threads(len(cores))
+    _worker_backend = backend
+
+
+def _predict(args: Tuple[List[str], int]) -> List[Dict[str, Any]]:
+    """Pool task: classify one slice of texts"""
+    texts, batch_size = args
+    return _worker_backend.predict(texts, batch_size)
+
+
+class Scorer:
+    """
+    Runs inference in this process or on a pool of forked workers
+
+    Like worker_pool, the transformers model is loaded once before forking so
+    workers share its pages; ONNX Runtime sessions don't survive a fork, so
+    with the onnx backend each worker loads its own
+    """
+
+    def __init__(self, workers: int, batch_size: int, backend_name: str = inference.INFERENCE_BACKEND):
+        self.workers = workers
+        self.batch_size = batch_size
+        self._pool = None
+        # Always the default checkpoint: results go to its cache namespace
+        self.model_id = inference.MODEL_TAG
+
+        if backend_name == "pool":
+            raise ValueError("INFERENCE_BACKEND=pool is for API processes; use --workers instead")
+
+        if workers == 0:
+            self.backend = inference.get_backend() if backend_name == inference.INFERENCE_BACKEND else inference.load_backend(backend_name)
+            self.tag = self.backend.tag
+            return
+
+        backend = None
+        if backend_name == "transformers":
+            backend = inference.load_backend(backend_name)
+            self.tag = backend.tag
+            gc.freeze()
+        else:
+            inference.export_onnx()
+            self.tag = f"{inference.MODEL_TAG}-{'onnx-int8' if inference.ONNX_QUANTIZE else 'onnx'}"
+
+        context = multiprocessing.get_context("fork")
+        self._pool = context.Pool(
+            workers,
+            initializer=_init_worker,
+            initargs=(backend, backend_name, split_cores(workers), context.Value("i", 0))
+        )
+
+    def predict(self, texts: List[str]) -> List[Dict[str, Any]]:
+        """Classify texts, split evenly across the workers"""
+        if not texts:
+            return []
+        if self._pool is None:
+            return self.backend.predict(texts, self.batch_size)
+
+        per_worker = math.ceil(len(texts) / self.workers)
+        slices = [(texts[i:i + per_worker], self.batch_size) for i in range(0, len(texts), per_worker)]
+        return [result for part in self._pool.map(_predict, slices) for result in part]
+
+    def close(self):
+        # Workers are idle between chunks (or the job is being aborted)
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+
+
+def score_chunk(chunk: List[Tuple[int, Any, Any]], scorer: Scorer, use_cache: bool) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], int]:
+    """
+    Score one chunk: cache MGET -> pool inference on the misses -> cache writeback
+
+    Args:
+        chunk: (row_number, id, text) tuples
+        scorer: Inference runner
+        use_cache: Look up and write back results in Redis
+
+    Returns:
+        (output records, database rows, cache hits)
+    """
+    valid = {}
+    for row_number, _, text in chunk:
+        if isinstance(text, str) and text.strip() and len(text) <= MAX_TEXT_LENGTH:
+            valid.setdefault(text, None)
+
+    unique_texts = list(valid)
+    cached_results = cache.get_cached_results(unique_texts, scorer.model_id) if use_cache else [None] * len(unique_texts)
+
+    results: Dict[str, Tuple[Dict[str, Any], bool]] = {}
+    misses = []
+    for text, cached_result in zip(unique_texts, cached_results):
+        if cached_result:
+            results[text] = (cached_result, True)
+        else:
+            misses.append(text)
+
+    per_text_ms = 0
+    if misses:
+        model_start = time.time()
+        predictions = scorer.predict(misses)
+        per_text_ms = int((time.time() - model_start) * 1000 / len(misses))
+
+        for text, prediction in zip(misses, predictions):
+            results[text] = ({
+                "text": text,
+                "sentiment": prediction["label"],
+                "confidence": round(prediction["score"], 4),
+                "processing_time_ms": per_text_ms,
+                "cached": False,
+                "model": scorer.tag
+            }, False)
+        if use_cache:
+            cache.cache_results([(text, results[text][0]) for text in misses], scorer.model_id)
+
+    records, db_rows, cache_hits = [], [], 0
+    for row_number, row_id, text in chunk:
+        if text not in results:
+            error = "Text longer than 512 characters" if isinstance(text, str) and text.strip() else "Missing or empty text"
+            records.append({"row": row_number, "id": row_id, "error": error})
+            continue
+
+        result, cached = results[text]
+        cache_hits += cached
+        records.append({
+            "row": row_number,
+            "id": row_id,
+            "sentiment": result["sentiment"],
+            "confidence": result["confidence"],
+            "cached": cached
+        })
+        db_rows.append({
+            "text": text,
+            "sentiment": result["sentiment"],
+            "confidence": result["confidence"],
+            "model": scorer.model_id,
+            "processing_time_ms": 0 if cached else per_text_ms
+        })
+
+    return records, db_rows, cache_hits
+
+
+def format_progress(done: int, total: Optional[int], started_rows: int, elapsed: float) -> str:
+    """One progress line: rows done, rows/sec for this run and ETA"""
+    rate = (done - started_rows) / elapsed if elapsed > 0 else 0.0
+    line = f"{done:,} rows"
+    if total:
+        line += f" / {total:,} ({min(done / total, 1):.1%})"
+    line += f" | {rate:,.0f} rows/sec"
+    if total and rate > 0:
+        remaining = max(total - done, 0) / rate
+        line += f" | ETA {int(remaining // 3600)}h{int(remaining % 3600 // 60):02d}m{int(remaining % 60):02d}s"
+    return line
+
+
+def score_file(
+    input_path: str,
+    output_path: str,
+    text_column: str = "text",
+    id_column: Optional[str] = None,
+    chunk_size: int = SCORE_CHUNK_SIZE,
+    workers: int = SCORE_WORKERS,
+    batch_size: int = SCORE_BATCH_SIZE,
+    load_db: bool = False,
+    use_cache: bool = True,
+    restart: bool = False
+) -> Dict[str, Any]:
+    """
+    Score every row of a file, resuming from a checkpoint if one exists
+
+    Args:
+        input_path: .csv/.tsv, .jsonl/.ndjson or .parquet file
+        output_path: .jsonl or .csv results file (appended to; an existing file
+            without a checkpoint is only overwritten with restart)
+        text_column: Column / key holding the text
+        id_column: Column / key copied to each result
+        chunk_size: Rows per chunk / checkpoint
+        workers: Inference processes (0 = in this process)
+        batch_size: Max texts per forward pass
+        load_db: Also COPY results into sentiment_analyses
+        use_cache: Read and write the Redis result cache
+        restart: Ignore an existing checkpoint and start over, overwriting the output
+
+    Returns:
+        Dict with row counts, cache hits and throughput for this run
+    """
+    fmt = detect_format(input_path)
+    checkpoint_path = f"{output_path}.checkpoint"
+    input_stat = os.stat(input_path)
+    source = {"input": os.path.abspath(input_path), "size": input_stat.st_size, "mtime": input_stat.st_mtime}
+
+    checkpoint = None if restart else load_checkpoint(checkpoint_path)
+    if checkpoint and checkpoint["source"] != source:
+        raise ValueError(f"{checkpoint_path} belongs to a different input file; rerun with --restart")
+    if checkpoint and checkpoint.get("complete"):
+        print(f"{input_path} already scored into {output_path} (use --restart to score it again)")
+        return checkpoint["summary"]
+    if not checkpoint and not restart and os.path.exists(output_path) and os.path.getsize(output_path):
+        # Without a checkpoint the writer would start at byte 0 and wipe it
+        raise ValueError(f"{output_path} already exists and has no checkpoint; rerun with --restart to overwrite it")
+    checkpoint = checkpoint or {"source": source, "rows_done": 0, "output_bytes": 0, "errors": 0, "cache_hits": 0}
+
+    if checkpoint["rows_done"]:
+        print(f"Resuming at row {checkpoint['rows_done']:,}")
+
+    db = None
+    if load_db:
+        init_db()
+        db = SessionLocal()
+
+    total = count_rows(input_path, fmt)
+    scorer = Scorer(workers, batch_size)
+    writer = ResultWriter(output_path, checkpoint["output_bytes"])
+
+    started, started_rows = time.time(), checkpoint["rows_done"]
+    last_progress = started
+    try:
+        chunk: List[Tuple[int, Any, Any]] = []
+        rows = read_rows(input_path, fmt, text_column, id_column, skip=checkpoint["rows_done"])
+
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) < chunk_size:
+                continue
+
+            checkpoint = _finish_chunk(chunk, scorer, writer, db, use_cache, checkpoint, checkpoint_path)
+            chunk = []
+            if time.time() - last_progress >= SCORE_PROGRESS_SECONDS:
+                print(format_progress(checkpoint["rows_done"], total, started_rows, time.time() - started))
+                last_progress = time.time()
+
+        if chunk:
+            checkpoint = _finish_chunk(chunk, scorer, writer, db, use_cache, checkpoint, checkpoint_path)
+    finally:
+        writer.close()
+        scorer.close()
+        if db is not None:
+            db.close()
+
+    elapsed = time.time() - started
+    summary = {
+        "rows": checkpoint["rows_done"],
+        "rows_this_run": checkpoint["rows_done"] - started_rows,
+        "errors": checkpoint["errors"],
+        "cache_hits": checkpoint["cache_hits"],
+        "elapsed_seconds": round(elapsed, 1),
+        "rows_per_second": round((checkpoint["rows_done"] - started_rows) / elapsed, 1) if elapsed > 0 else 0.0
+    }
+    save_checkpoint(checkpoint_path, {**checkpoint, "complete": True, "summary": summary})
+    print(format_progress(checkpoint["rows_done"], total, started_rows, elapsed))
+    return summary
+
+
+def _finish_chunk(chunk, scorer, writer, db, use_cache, checkpoint, checkpoint_path) -> Dict[str, Any]:
+    """Score a chunk, persist its results and advance the checkpoint"""
+    records, db_rows, cache_hits = score_chunk(chunk, scorer, use_cache)
+
+    writer.write(records)
+    output_bytes = writer.sync()
+    if db is not None:
+        copy_analyses(db, db_rows)
+
+    checkpoint = {
+        **checkpoint,
+        "rows_done": chunk[-1][0] + 1,
+        "output_bytes": output_bytes,
+        "errors": checkpoint["errors"] + len(records) - len(db_rows),
+        "cache_hits": checkpoint["cache_hits"] + cache_hits
+    }
+    save_checkpoint(checkpoint_path, checkpoint)
+    return checkpoint
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score a CSV / Parquet / JSONL file offline")
+    parser.add_argument("input", help="input file (.csv, .tsv, .jsonl, .ndjson, .parquet)")
+    parser.add_argument("output", help="results file (.jsonl or .csv); <output>.checkpoint tracks progress")
+    parser.add_argument("--text-column", default="text", help="column holding the text (default: text)")
+    parser.add_argument("--id-column", help="column copied to each result to join back on")
+    parser.add_argument("--chunk-size", type=int, default=SCORE_CHUNK_SIZE, help="rows per chunk / checkpoint")
+    parser.add_argument("--workers", type=int, default=SCORE_WORKERS, help="inference processes (0 = in this process)")
+    parser.add_argument("--batch-size", type=int, default=SCORE_BATCH_SIZE, help="max texts per forward pass")
+    parser.add_argument("--load-db", action="store_true", help="also COPY results into sentiment_analyses")
+    parser.add_argument("--no-cache", action="store_true", help="don't read or write the Redis cache")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and start over, overwriting the output")
+    args = parser.parse_args()
+
+    try:
+        summary = score_file(
+            args.input, args.output,
+            text_column=args.text_column,
+            id_column=args.id_column,
+            chunk_size=args.chunk_size,
+            workers=args.workers,
+            batch_size=args.batch_size,
+            load_db=args.load_db,
+            use_cache=not args.no_cache,
+            restart=args.restart
+        )
+    except (ValueError, ImportError) as e:
+        sys.exit(f"Error: {e}")
+
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
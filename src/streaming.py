@@ -0,0 +1,145 @@
+"""
+Line-oriented parsing for the streaming bulk endpoint
+
+The request body is read incrementally and grouped into fixed-size chunks,
+so memory stays bounded by one chunk no matter how large the upload is
+Each chunk goes through cache lookup -> batched inference -> cache writeback
+before the next one is read
+"""
+
+import json
+import os
+from typing import Any, AsyncIterable, AsyncIterator, Dict, List, Optional
+
+# Lines scored per cache MGET / batched forward pass / writeback
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", "256"))
+
+# Longest accepted input line - guards against a body with no newlines
+STREAM_MAX_LINE_BYTES = int(os.getenv("STREAM_MAX_LINE_BYTES", "65536"))
+
+# Same limit as the text field on /analyze
+STREAM_MAX_TEXT_LENGTH = 512
+
+
+class LineTooLongError(ValueError):
+    """Raised when an input line exceeds STREAM_MAX_LINE_BYTES"""
+
+
+async def iter_lines(body: AsyncIterable[bytes], max_line_bytes: int = STREAM_MAX_LINE_BYTES) -> AsyncIterator[bytes]:
+    """
+    Split a byte stream into lines without buffering the whole body
+
+    Args:
+        body: Async iterable of raw body chunks (e.g. request.stream())
+        max_line_bytes: Longest line accepted
+
+    Returns:
+        Async iterator of lines without their trailing newline (blank lines skipped)
+    """
+    buffer = b""
+    async for data in body:
+        buffer += data
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            line = line.rstrip(b"\r")
+            if line.strip():
+                yield line
+        if len(buffer) > max_line_bytes:
+            raise LineTooLongError(f"Line longer than {max_line_bytes} bytes")
+
+    if buffer.strip():
+        yield buffer.rstrip(b"\r")
+
+
+def parse_line(line: bytes, line_no: int, plain_text: bool = False) -> Dict[str, Any]:
+    """
+    Parse one input line into an item to score
+
+    NDJSON lines are either {"text": ..., "id": ...} objects or bare JSON
+    strings; with plain_text every line is the text itself
+
+    Args:
+        line: Raw line bytes
+        line_no: 1-based position in the body, echoed back in the result
+        plain_text: Treat the line as raw text instead of JSON
+
+    Returns:
+        Dict with line, id and text, or line, id and error if the line is invalid
+    """
+    item: Dict[str, Any] = {"line": line_no, "id": None}
+
+    try:
+        if plain_text:
+            text = line.decode("utf-8")
+        else:
+            value = json.loads(line)
+            if isinstance(value, dict):
+                item["id"] = value.get("id")
+                text = value.get("text")
+            else:
+                text = value
+    except (UnicodeDecodeError, ValueError) as e:
+        item["error"] = f"Invalid line: {e}"
+        return item
+
+    if not isinstance(text, str) or not text.strip():
+        item["error"] = "Missing or empty text"
+    elif len(text) > STREAM_MAX_TEXT_LENGTH:
+        item["error"] = f"Text longer than {STREAM_MAX_TEXT_LENGTH} characters"
+    else:
+        item["text"] = text
+    return item
+
+
+async def iter_chunks(items: AsyncIterable[Dict[str, Any]], size: int = STREAM_CHUNK_SIZE) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    Group parsed items into lists of at most size items
+
+    Args:
+        items: Async iterable of parsed lines
+        size: Items per chunk
+
+    Returns:
+        Async iterator of chunks
+    """
+    chunk: List[Dict[str, Any]] = []
+    async for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def encode_record(record: Dict[str, Any]) -> bytes:
+    """Serialize one output record as an NDJSON line"""
+    return json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n"
+
+
+def summary_record(lines: int, scored: int, cache_hits: int, errors: int, elapsed: float, aborted: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Build the final record of a stream
+
+    Args:
+        lines: Non-blank input lines read
+        scored: Lines with a sentiment result
+        cache_hits: Results served from the cache
+        errors: Lines rejected as invalid
+        elapsed: Seconds since the request started
+        aborted: Reason the stream stopped early, if it did
+
+    Returns:
+        Dict with a single "summary" key
+    """
+    summary = {
+        "lines": lines,
+        "scored": scored,
+        "cache_hits": cache_hits,
+        "errors": errors,
+        "elapsed_ms": int(elapsed * 1000),
+        "lines_per_second": round(lines / elapsed, 1) if elapsed > 0 else 0.0
+    }
+    if aborted:
+        summary["aborted"] = aborted
+    return {"summary": summary}
@@ -0,0 +1,280 @@
+"""
+Cache warming from historical traffic
+
+After a deploy or a cache clear every request misses until traffic refills
+Redis. The warm-up job picks the texts most likely to be requested again
+from sentiment_analyses - the most frequent in the lookback window, then the
+most recent - skips those already cached, re-scores the rest with batched
+inference and pipelines them into Redis under the normal cache keys
+
+It is rate-limited (CACHE_WARM_TEXTS_PER_SECOND) and pauses while live
+requests are queued for the model, so it only uses spare capacity. With
+several workers, a short Redis lock lets only one of them warm at a time
+
+Usage:
+    python -m src.warming --limit 20000 --strategy frequent
+"""
+
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from . import cache, metrics, registry
+from .admission import LatencyRecorder
+from .database import SentimentAnalysis, SentimentText
+from .logs import get_logger, log_event
+
+# Warm the cache in the background when the app starts
+CACHE_WARM_ON_STARTUP = os.getenv("CACHE_WARM_ON_STARTUP", "false").lower() == "true"
+
+# Warm again right after DELETE /cache/clear
+CACHE_WARM_AFTER_CLEAR = os.getenv("CACHE_WARM_AFTER_CLEAR", "false").lower() == "true"
+
+# Most distinct texts one run considers
+CACHE_WARM_LIMIT = int(os.getenv("CACHE_WARM_LIMIT", "10000"))
+
+# "frequent", "recent" or "mixed" (half each, frequent first)
+CACHE_WARM_STRATEGY = os.getenv("CACHE_WARM_STRATEGY", "mixed")
+
+# Only traffic from this far back counts
+CACHE_WARM_LOOKBACK_HOURS = float(os.getenv("CACHE_WARM_LOOKBACK_HOURS", "24"))
+
+# Texts checked / scored per batch
+CACHE_WARM_BATCH_SIZE = int(os.getenv("CACHE_WARM_BATCH_SIZE", "64"))
+
+# Upper bound on texts re-scored per second (0 = unlimited)
+CACHE_WARM_TEXTS_PER_SECOND = float(os.getenv("CACHE_WARM_TEXTS_PER_SECOND", "200"))
+
+STRATEGIES = ("frequent", "recent", "mixed")
+
+# Held by the worker that is warming (expires if it dies mid-run)
+WARM_LOCK_KEY = "sentiment:warm:lock"
+WARM_LOCK_TTL_SECONDS = 600
+
+# Delete the lock only if we still own it (it may have expired and been re-taken)
+_RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+logger = get_logger("warming")
+
+
+def select_texts(db: Session, limit: int, strategy: str = CACHE_WARM_STRATEGY, since: Optional[datetime] = None) -> List[str]:
+    """
+    Pick distinct texts worth warming, best candidates first
+
+    Args:
+        db: Open database session
+        limit: Max texts
+        strategy: "frequent" (most analyses), "recent" (latest analysis) or "mixed"
+        since: Only count analyses from this time on
+
+    Returns:
+        Distinct texts
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"strategy must be one of {', '.join(STRATEGIES)}")
+    since = since or datetime.utcnow() - timedelta(hours=CACHE_WARM_LOOKBACK_HOURS)
+
+    def ranked(rank, count: int) -> List[str]:
+        # Aggregate per text_id over the (created_at, id)-indexed window, then fetch the texts
+        ranking = (
+            select(SentimentAnalysis.text_id, rank.label("rank"))
+            .where(SentimentAnalysis.created_at >= since)
+            .group_by(SentimentAnalysis.text_id)
+            .order_by(rank.desc(), SentimentAnalysis.text_id)
+            .limit(count)
+            .subquery()
+        )
+        # The join doesn't keep the subquery's order: rank the outer query again
+        return list(db.scalars(
+            select(SentimentText.text)
+            .join(ranking, SentimentText.id == ranking.c.text_id)
+            .order_by(ranking.c.rank.desc(), ranking.c.text_id)
+        ))
+
+    frequent = func.count(SentimentAnalysis.id)
+    recent = func.max(SentimentAnalysis.created_at)
+
+    if strategy == "frequent":
+        return ranked(frequent, limit)
+    if strategy == "recent":
+        return ranked(recent, limit)
+    # Keep order, drop texts that are both frequent and recent
+    return list(dict.fromkeys(ranked(frequent, limit // 2) + ranked(recent, limit)))[:limit]
+
+
+def uncached(texts: List[str], model: str) -> List[str]:
+    """Texts with no entry in Redis for a model (EXISTS only - values aren't transferred and tier stats aren't touched)"""
+    pipe = cache.redis_client.pipeline(transaction=False)
+    for text in texts:
+        pipe.exists(cache.generate_cache_key(text, model))
+    return [text for text, exists in zip(texts, pipe.execute()) if not exists]
+
+
+class CacheWarmer:
+    """
+    Runs one warm-up at a time in a background thread and keeps its report
+
+    Usage:
+        warmer = CacheWarmer(SessionLocal, busy=lambda: batcher_queue_depth() > 0)
+        warmer.start()
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        busy: Callable[[], bool] = lambda: False,
+        batch_size: int = CACHE_WARM_BATCH_SIZE,
+        texts_per_second: float = CACHE_WARM_TEXTS_PER_SECOND,
+        latency: Optional[LatencyRecorder] = None
+    ):
+        self.session_factory = session_factory
+        self.busy = busy
+        self.batch_size = max(1, batch_size)
+        self.texts_per_second = texts_per_second
+        # Per-text inference time goes into admission control's estimate
+        self.latency = latency
+
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._report: Dict[str, Any] = {"state": "idle"}
+
+    def start(self, limit: int = CACHE_WARM_LIMIT, strategy: str = CACHE_WARM_STRATEGY, model: Optional[str] = None) -> bool:
+        """
+        Start a warm-up in the background (for the active model by default)
+
+        Returns:
+            False if one is already running in this worker
+        """
+        if strategy not in STRATEGIES:
+            raise ValueError(f"strategy must be one of {', '.join(STRATEGIES)}")
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            self._report = {"state": "starting", "limit": limit, "strategy": strategy, "model": model}
+            self._thread = threading.Thread(
+                target=self.run, args=(limit, strategy, model), name="cache-warmer", daemon=True
+            )
+            self._thread.start()
+            return True
+
+    def run(self, limit: int = CACHE_WARM_LIMIT, strategy: str = CACHE_WARM_STRATEGY, model: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Warm the cache in the calling thread
+
+        Args:
+            limit: Most distinct texts to consider
+            strategy: One of STRATEGIES
+            model: Loaded model id to score with and warm the namespace of (default: the active model)
+
+        Returns:
+            Report with texts selected / already cached / warmed and the time taken
+        """
+        started = time.perf_counter()
+        model = model or registry.active_model_id()
+        report: Dict[str, Any] = {
+            "state": "running", "limit": limit, "strategy": strategy, "model": model,
+            "started_at": datetime.utcnow().isoformat(),
+            "selected": 0, "already_cached": 0, "warmed": 0, "paused_ms": 0
+        }
+        self._report = report
+
+        token = uuid.uuid4().hex
+        try:
+            if not cache.redis_client.set(WARM_LOCK_KEY, token, nx=True, ex=WARM_LOCK_TTL_SECONDS):
+                report["state"] = "skipped"
+                report["reason"] = "another worker is warming the cache"
+                return report
+
+            db = self.session_factory()
+            try:
+                texts = select_texts(db, limit, strategy)
+            finally:
+                db.close()
+            report["selected"] = len(texts)
+
+            backend = registry.get_backend(model)
+            for start in range(0, len(texts), self.batch_size):
+                batch = uncached(texts[start:start + self.batch_size], model)
+                report["already_cached"] += min(self.batch_size, len(texts) - start) - len(batch)
+                if not batch:
+                    continue
+
+                # Yield the model to live requests
+                while self.busy():
+                    time.sleep(0.05)
+                    report["paused_ms"] += 50
+
+                inference_started = time.perf_counter()
+                predictions = backend.predict(batch, batch_size=self.batch_size)
+                if self.latency is not None:
+                    self.latency.record_inference(len(batch), time.perf_counter() - inference_started)
+                cache.cache_results([
+                    (text, {
+                        "text": text,
+                        "sentiment": prediction["label"],
+                        "confidence": round(prediction["score"], 4),
+                        "model": backend.tag
+                    })
+                    for text, prediction in zip(batch, predictions)
+                ], model)
+                report["warmed"] += len(batch)
+
+                # Rate limit: never get ahead of texts_per_second
+                if self.texts_per_second > 0:
+                    ahead = report["warmed"] / self.texts_per_second - (time.perf_counter() - started)
+                    if ahead > 0:
+                        time.sleep(ahead)
+
+            report["state"] = "finished"
+        except Exception as e:
+            report["state"] = "failed"
+            report["error"] = str(e)
+            metrics.count_error("warming")
+        finally:
+            try:
+                cache.redis_client.eval(_RELEASE_SCRIPT, 1, WARM_LOCK_KEY, token)
+            except Exception:
+                pass  # Expires on its own
+            report["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            report["finished_at"] = datetime.utcnow().isoformat()
+            log_event(
+                logger, "cache_warm", logging.WARNING if report["state"] == "failed" else logging.INFO,
+                **{k: v for k, v in report.items() if k not in ("started_at", "finished_at")}
+            )
+
+        return report
+
+    def get_report(self) -> Dict[str, Any]:
+        """Progress of the running warm-up, or the report of the last one"""
+        return dict(self._report)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Warm the Redis cache from recent traffic")
+    parser.add_argument("--limit", type=int, default=CACHE_WARM_LIMIT, help="most distinct texts to consider")
+    parser.add_argument("--strategy", choices=STRATEGIES, default=CACHE_WARM_STRATEGY)
+    parser.add_argument("--rate", type=float, default=CACHE_WARM_TEXTS_PER_SECOND, help="max texts re-scored per second")
+    args = parser.parse_args()
+
+    from .database import SessionLocal
+
+    warmer = CacheWarmer(SessionLocal, texts_per_second=args.rate)
+    print(json.dumps(warmer.run(args.limit, args.strategy), indent=2))
+
+
+if __name__ == "__main__":
+    main()
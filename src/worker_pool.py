@@ -0,0 +1,405 @@
+"""
+Multi-process inference worker pool
+
+A standalone server that owns the model and runs it in N worker processes,
+each pinned to its own slice of CPU cores with a matching torch thread count.
+API processes submit texts over a local Unix socket instead of each loading
+their own copy of the model.
+
+The model is loaded once in the server process before forking, so workers
+share the weight pages copy-on-write (from_pretrained memory-maps
+safetensors checkpoints while loading). ONNX Runtime sessions are not
+fork-safe, so with the onnx backend each worker loads its own session.
+
+Usage:
+    python -m src.worker_pool                      # start the pool server
+    INFERENCE_BACKEND=pool uvicorn src.main:app    # API processes use it
+"""
+
+import gc
+import itertools
+import multiprocessing
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing.connection import Client, Listener
+from typing import Any, Dict, List, Optional
+
+# Worker processes in the pool
+INFERENCE_POOL_WORKERS = int(os.getenv("INFERENCE_POOL_WORKERS", "2"))
+
+# Backend each worker runs ("transformers" or "onnx")
+INFERENCE_POOL_BACKEND = os.getenv("INFERENCE_POOL_BACKEND", "transformers")
+
+# Local IPC endpoint shared by the pool server and API processes; its
+# directory is kept private (0700) to the user running the pool
+INFERENCE_POOL_SOCKET = os.getenv("INFERENCE_POOL_SOCKET", "/tmp/sentiment-inference/pool.sock")
+
+# Shared secret for the socket (multiprocessing HMAC handshake). When unset, the
+# server generates a random one and writes it to <socket>.key (mode 0600)
+INFERENCE_POOL_AUTHKEY = os.getenv("INFERENCE_POOL_AUTHKEY", "").encode()
+
+# Seconds an API process waits for a pool reply before giving up
+INFERENCE_POOL_TIMEOUT = float(os.getenv("INFERENCE_POOL_TIMEOUT", "30"))
+
+
+def split_cores(workers: int, cores: Optional[List[int]] = None) -> List[List[int]]:
+    """
+    Split the available CPU cores into one contiguous slice per worker
+
+    Args:
+        workers: Number of worker processes
+        cores: Core ids to split (default: this process's CPU affinity)
+
+    Returns:
+        One list of core ids per worker (workers share cores if there are fewer cores than workers)
+    """
+    cores = sorted(cores if cores is not None else os.sched_getaffinity(0))
+    if workers >= len(cores):
+        return [[cores[i % len(cores)]] for i in range(workers)]
+
+    size, extra = divmod(len(cores), workers)
+    slices, start = [], 0
+    for i in range(workers):
+        end = start + size + (1 if i < extra else 0)
+        slices.append(cores[start:end])
+        start = end
+    return slices
+
+
+def private_socket_dir(address: str) -> str:
+    """
+    Create the socket's directory (or check an existing one) so only this user can reach it
+
+    Raises:
+        PermissionError: If the directory belongs to another user
+    """
+    directory = os.path.dirname(os.path.abspath(address))
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    if os.stat(directory).st_uid != os.getuid():
+        raise PermissionError(f"Inference pool socket directory {directory} is owned by another user")
+    os.chmod(directory, 0o700)
+    return directory
+
+
+def create_authkey(address: str) -> bytes:
+    """Generate a random authkey and write it to <address>.key, readable only by this user"""
+    authkey = secrets.token_hex(32).encode()
+    path = f"{address}.key"
+    if os.path.exists(path):
+        os.unlink(path)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(authkey)
+    return authkey
+
+
+def read_authkey(address: str) -> bytes:
+    """
+    Authkey for a pool client: INFERENCE_POOL_AUTHKEY, or the key the server wrote
+
+    Raises:
+        RuntimeError: If neither is available
+    """
+    if INFERENCE_POOL_AUTHKEY:
+        return INFERENCE_POOL_AUTHKEY
+    try:
+        with open(f"{address}.key", "rb") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        raise RuntimeError(
+            f"No inference pool authkey: set INFERENCE_POOL_AUTHKEY or start the pool server ({address}.key)"
+        ) from None
+
+
+def _worker_main(worker_id: int, cores: List[int], backend, backend_name: str, tasks, results):
+    """Worker process: pin to cores, then run tasks until a None sentinel arrives"""
+    os.sched_setaffinity(0, cores)
+
+    if backend is None:
+        from . import inference
+        inference.INFERENCE_THREADS = len(cores)
+        backend = inference.load_backend(backend_name)
+    else:
+        import torch
+        torch.set_num_threads(len(cores))
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+
+        task_id, texts, batch_size, enqueued_at = task
+        picked_at = time.monotonic()
+        try:
+            output, error = backend.predict(texts, batch_size), None
+        except Exception as e:
+            output, error = None, repr(e)
+
+        results.put((task_id, worker_id, output, error, picked_at - enqueued_at, time.monotonic() - picked_at))
+
+
+class InferencePoolServer:
+    """
+    Owns the worker processes and serves API connections on a Unix socket
+
+    Protocol (multiprocessing.connection messages):
+        request:  (request_id, "predict", texts, batch_size) | (request_id, "stats") | (request_id, "info")
+        response: (request_id, ok, payload)
+    """
+
+    def __init__(
+        self,
+        workers: int = INFERENCE_POOL_WORKERS,
+        backend_name: str = INFERENCE_POOL_BACKEND,
+        address: str = INFERENCE_POOL_SOCKET,
+        authkey: bytes = INFERENCE_POOL_AUTHKEY
+    ):
+        self.workers = workers
+        self.backend_name = backend_name
+        self.address = address
+        # Empty: serve_forever generates one and writes it for clients
+        self.authkey = authkey
+
+        self._task_ids = itertools.count()
+        self._pending: Dict[int, tuple] = {}
+        self._lock = threading.Lock()
+        self._started_at = time.monotonic()
+        self._worker_stats = [
+            {"worker": i, "cores": [], "tasks": 0, "texts": 0, "errors": 0, "busy_seconds": 0.0, "wait_seconds": 0.0}
+            for i in range(workers)
+        ]
+        self.tag = None
+
+    def start_workers(self):
+        """Load the model once, then fork the pinned worker processes"""
+        from .inference import MODEL_TAG, ONNX_QUANTIZE, export_onnx, load_backend
+
+        backend = None
+        if self.backend_name == "transformers":
+            print(f"Loading {self.backend_name} model once for {self.workers} workers...")
+            backend = load_backend(self.backend_name)
+            self.tag = backend.tag
+        else:
+            # Export up front so workers don't race to create the same file,
+            # but don't open a session here (it wouldn't survive the fork)
+            export_onnx()
+            self.tag = f"{MODEL_TAG}-{'onnx-int8' if ONNX_QUANTIZE else 'onnx'}"
+
+        # Keep the loaded objects out of the GC's generations so collections in
+        # the children don't write to (and un-share) the parent's pages
+        gc.freeze()
+
+        context = multiprocessing.get_context("fork")
+        self._tasks = context.Queue()
+        self._results = context.Queue()
+        self._processes = []
+
+        for worker_id, cores in enumerate(split_cores(self.workers)):
+            self._worker_stats[worker_id]["cores"] = cores
+            process = context.Process(
+                target=_worker_main,
+                args=(worker_id, cores, backend, self.backend_name, self._tasks, self._results),
+                name=f"inference-worker-{worker_id}",
+                daemon=True
+            )
+            process.start()
+            self._processes.append(process)
+
+        threading.Thread(target=self._collect_results, name="pool-results", daemon=True).start()
+        self._started_at = time.monotonic()
+
+    def _collect_results(self):
+        """Route worker results back to the connection that asked"""
+        while True:
+            task_id, worker_id, output, error, wait_seconds, busy_seconds = self._results.get()
+
+            with self._lock:
+                conn, send_lock, request_id, text_count = self._pending.pop(task_id)
+                stats = self._worker_stats[worker_id]
+                stats["tasks"] += 1
+                stats["texts"] += text_count
+                stats["errors"] += int(error is not None)
+                stats["busy_seconds"] += busy_seconds
+                stats["wait_seconds"] += wait_seconds
+
+            try:
+                with send_lock:
+                    conn.send((request_id, error is None, output if error is None else error))
+            except (OSError, EOFError):
+                pass  # Client went away
+
+    def _serve_connection(self, conn):
+        """Read requests from one API process until it disconnects"""
+        send_lock = threading.Lock()
+        try:
+            while True:
+                message = conn.recv()
+                request_id, kind = message[0], message[1]
+
+                if kind == "predict":
+                    texts, batch_size = message[2], message[3]
+                    task_id = next(self._task_ids)
+                    with self._lock:
+                        self._pending[task_id] = (conn, send_lock, request_id, len(texts))
+                    self._tasks.put((task_id, texts, batch_size, time.monotonic()))
+                    continue
+
+                if kind == "stats":
+                    payload = self.get_stats()
+                elif kind == "info":
+                    payload = {"tag": self.tag, "backend": self.backend_name, "workers": self.workers}
+                else:
+                    with send_lock:
+                        conn.send((request_id, False, f"Unknown request: {kind!r}"))
+                    continue
+
+                with send_lock:
+                    conn.send((request_id, True, payload))
+        except (EOFError, OSError):
+            pass
+        finally:
+            conn.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get per-worker utilization and queue wait time
+
+        Returns:
+            Dict with pool-wide queue depth and one entry per worker
+        """
+        uptime = max(time.monotonic() - self._started_at, 1e-9)
+
+        with self._lock:
+            workers = []
+            for stats in self._worker_stats:
+                workers.append({
+                    **stats,
+                    "utilization": round(stats["busy_seconds"] / uptime, 4),
+                    "avg_queue_wait_ms": round(stats["wait_seconds"] / max(stats["tasks"], 1) * 1000, 3),
+                    "alive": self._processes[stats["worker"]].is_alive()
+                })
+            in_flight = len(self._pending)
+
+        return {
+            "backend": f"pool/{self.backend_name}",
+            "model_tag": self.tag,
+            "uptime_seconds": round(uptime, 1),
+            "queue_depth": self._tasks.qsize(),
+            "in_flight": in_flight,
+            "workers": workers
+        }
+
+    def serve_forever(self):
+        """Start the workers and accept API connections until interrupted"""
+        self.start_workers()
+
+        private_socket_dir(self.address)
+        if not self.authkey:
+            self.authkey = create_authkey(self.address)
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+
+        with Listener(self.address, family="AF_UNIX", authkey=self.authkey) as listener:
+            os.chmod(self.address, 0o600)
+            print(f"Inference pool ready on {self.address} ({self.workers} workers)")
+            while True:
+                conn = listener.accept()
+                threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+
+
+class PoolClient:
+    """
+    Inference backend that forwards to the worker pool server
+
+    Thread-safe: requests from several threads are multiplexed over one
+    connection and matched to replies by request id
+    """
+
+    name = "pool"
+
+    def __init__(self, address: str = INFERENCE_POOL_SOCKET, authkey: Optional[bytes] = None):
+        self.address = address
+        self.authkey = authkey or read_authkey(address)
+
+        self._conn = None
+        self._request_ids = itertools.count()
+        self._pending: Dict[int, Future] = {}
+        self._lock = threading.Lock()
+
+        info = self._call("info")
+        self.tag = info["tag"]
+        # The pool serves the one checkpoint it was started with
+        from .inference import MODEL_TAG
+        self.model_id = MODEL_TAG
+        self.name = f"pool/{info['backend']}"
+
+    def _connect(self):
+        """Open the socket and start the reply reader (caller holds self._lock)"""
+        self._conn = Client(self.address, family="AF_UNIX", authkey=self.authkey)
+        threading.Thread(target=self._read_replies, args=(self._conn,), name="pool-client", daemon=True).start()
+
+    def _read_replies(self, conn):
+        """Resolve pending futures as replies arrive"""
+        try:
+            while True:
+                request_id, ok, payload = conn.recv()
+                future = self._pending.pop(request_id, None)
+                if future is None:
+                    continue
+                if ok:
+                    future.set_result(payload)
+                else:
+                    future.set_exception(RuntimeError(f"Inference pool error: {payload}"))
+        except (EOFError, OSError) as e:
+            with self._lock:
+                if self._conn is conn:
+                    self._conn = None
+                failed = list(self._pending.values())
+                self._pending.clear()
+            for future in failed:
+                if not future.done():
+                    future.set_exception(ConnectionError(f"Inference pool connection lost: {e}"))
+
+    def _call(self, kind: str, *args) -> Any:
+        """Send one request and wait for its reply"""
+        future: Future = Future()
+
+        with self._lock:
+            if self._conn is None:
+                self._connect()
+            request_id = next(self._request_ids)
+            self._pending[request_id] = future
+            self._conn.send((request_id, kind, *args))
+
+        try:
+            return future.result(INFERENCE_POOL_TIMEOUT)
+        finally:
+            # A timed-out call's future would otherwise stay until the server replies, if ever
+            with self._lock:
+                self._pending.pop(request_id, None)
+
+    def predict(self, texts: List[str], batch_size: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Classify texts on the worker pool
+
+        Args:
+            texts: Input texts
+            batch_size: Max texts per forward pass (default: no limit)
+
+        Returns:
+            One {"label": ..., "score": ...} dict per text, in input order
+        """
+        if not texts:
+            return []
+        return self._call("predict", texts, batch_size)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get the pool server's per-worker utilization and queue wait time"""
+        return self._call("stats")
+
+
+if __name__ == "__main__":
+    InferencePoolServer().serve_forever()
@@ -0,0 +1,219 @@
+"""
+Write-behind persistence for sentiment analysis rows
+
+Takes the Postgres round trip off the response path
+Rows are queued in memory and flushed in batched multi-row INSERTs
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from . import metrics
+from .database import save_analyses
+from .logs import get_logger, log_event
+
+# Off by default: queued rows are lost if the process is killed before a flush
+WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND_ENABLED", "false").lower() == "true"
+
+# Flush once this many rows are queued...
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "500"))
+
+# ...or once the oldest queued row has waited this long
+WRITE_BEHIND_FLUSH_MS = float(os.getenv("WRITE_BEHIND_FLUSH_MS", "200"))
+
+# Max rows held in memory
+WRITE_BEHIND_MAX_QUEUE = int(os.getenv("WRITE_BEHIND_MAX_QUEUE", "10000"))
+
+logger = get_logger("write_behind")
+
+# What to do when the queue is full:
+#   "sync" - hand the row back so the caller writes it directly (backpressure)
+#   "drop" - discard the row and count it
+WRITE_BEHIND_ON_FULL = os.getenv("WRITE_BEHIND_ON_FULL", "sync")
+
+
+class WriteBehindQueue:
+    """
+    Bounded in-memory queue drained by one background writer thread
+
+    Usage:
+        writer = WriteBehindQueue(SessionLocal)
+        writer.start()
+        if not writer.enqueue(row):
+            save_analyses(db, [row])   # queue full, write it ourselves
+        writer.stop()                  # drains remaining rows
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        batch_size: int = WRITE_BEHIND_BATCH_SIZE,
+        flush_ms: float = WRITE_BEHIND_FLUSH_MS,
+        max_queue: int = WRITE_BEHIND_MAX_QUEUE,
+        on_full: str = WRITE_BEHIND_ON_FULL
+    ):
+        self.session_factory = session_factory
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = max(0.0, flush_ms) / 1000
+        self.on_full = on_full
+
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(max(0, max_queue))
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+
+        self._enqueued = 0
+        self._written = 0
+        self._failed = 0
+        self._dropped = 0
+        self._returned = 0
+        self._flushes = 0
+        self._max_depth = 0
+        self._depth_gauge = metrics.QUEUE_DEPTH.labels("write_behind")
+
+    def start(self):
+        """Start the background writer thread (safe to call multiple times)"""
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="write-behind", daemon=True
+                )
+                self._thread.start()
+
+    def stop(self, timeout: float = 30.0):
+        """
+        Flush every queued row, then stop the writer thread
+
+        Args:
+            timeout: Seconds to wait for the drain to finish
+        """
+        with self._start_lock:
+            if self._thread is None:
+                return
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def enqueue(self, row: Dict[str, Any]) -> bool:
+        """
+        Queue a row for the next batched INSERT
+
+        Never blocks, so it is safe to call from the event loop
+
+        Args:
+            row: Dict with text, sentiment, confidence, processing_time_ms
+
+        Returns:
+            True if the queue took the row (queued, or dropped under the
+            "drop" policy); False if it was full and the caller must write it
+        """
+        self.start()
+        # Stamp now so created_at reflects the request, not the flush
+        row = {"created_at": datetime.utcnow(), **row}
+
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            with self._stats_lock:
+                if self.on_full == "drop":
+                    self._dropped += 1
+                    return True
+                self._returned += 1
+                return False
+
+        depth = self._queue.qsize()
+        self._depth_gauge.set(depth)
+        with self._stats_lock:
+            self._enqueued += 1
+            self._max_depth = max(self._max_depth, depth)
+        return True
+
+    def _run(self):
+        """Background loop: gather rows until the batch is full or the interval passes"""
+        stopping = False
+
+        while not stopping:
+            first = self._queue.get()
+            if first is None:
+                break
+
+            rows = [first]
+            deadline = time.perf_counter() + self.flush_interval
+
+            while len(rows) < self.batch_size:
+                remaining = deadline - time.perf_counter()
+                try:
+                    row = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if row is None:
+                    stopping = True
+                    break
+                rows.append(row)
+
+            self._flush(rows)
+
+        # Drain anything that raced in behind the stop sentinel
+        leftover = []
+        while True:
+            try:
+                row = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if row is not None:
+                leftover.append(row)
+        for start in range(0, len(leftover), self.batch_size):
+            self._flush(leftover[start:start + self.batch_size])
+
+    def _flush(self, rows: List[Dict[str, Any]]):
+        """Write one batch in a single multi-row INSERT"""
+        self._depth_gauge.set(self._queue.qsize())
+        db = self.session_factory()
+        try:
+            with metrics.stage("db_write"):
+                save_analyses(db, rows)
+            written, failed = len(rows), 0
+        except Exception as e:
+            db.rollback()
+            metrics.count_error("database")
+            log_event(logger, "write_behind_flush_failed", logging.ERROR, rows_lost=len(rows), error=str(e))
+            written, failed = 0, len(rows)
+        finally:
+            db.close()
+
+        with self._stats_lock:
+            self._flushes += 1
+            self._written += written
+            self._failed += failed
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get write-behind statistics
+
+        Returns:
+            Dict with queue depth, rows written/failed and backpressure counters
+        """
+        with self._stats_lock:
+            return {
+                "enabled": True,
+                "queue_depth": self._queue.qsize(),
+                "max_queue": self._queue.maxsize,
+                "max_queue_depth_seen": self._max_depth,
+                "batch_size": self.batch_size,
+                "flush_interval_ms": self.flush_interval * 1000,
+                "on_full": self.on_full,
+                "enqueued": self._enqueued,
+                "written": self._written,
+                "failed": self._failed,
+                "flushes": self._flushes,
+                # Rows handed back to the caller to write directly (backpressure)
+                "returned_when_full": self._returned,
+                "dropped_when_full": self._dropped
+            }
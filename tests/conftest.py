@@ -2,30 +2,48 @@
 Test configuration and fixtures
 
 Sets up test environment BEFORE importing app modules.
-Uses SQLite in-memory database and mocks Redis.
+Uses SQLite in-memory database and mocks Redis (sync and asyncio clients).
+The model is loaded by the app's startup warm-up, not at import.
 """
 
 import os
 import sys
+import time
 
 # Set environment variables BEFORE importing any app modules
 os.environ["DATABASE_URL"] = "sqlite:///./test.db"
 os.environ["REDIS_URL"] = "redis://localhost:6379"  # Will be mocked
 
 # Now mock Redis before importing cache module
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 
 mock_redis_client = MagicMock()
-mock_redis_client.get.return_value = None
+mock_redis_client.mget.side_effect = lambda keys: [None] * len(keys)
 mock_redis_client.setex.return_value = True
-mock_redis_client.keys.return_value = []
-mock_redis_client.delete.return_value = True
+mock_redis_client.get.return_value = None
+mock_redis_client.incr.return_value = 1
+mock_redis_client.scan_iter.side_effect = lambda **kwargs: iter([])
+mock_redis_client.unlink.return_value = 0
 mock_redis_client.dbsize.return_value = 0
 mock_redis_client.info.return_value = {"used_memory": 0, "keyspace_hits": 0, "keyspace_misses": 0}
+# Pub/sub that never delivers a message (waits out the timeout like the real one)
+mock_redis_client.pubsub.return_value.get_message.side_effect = \
+    lambda timeout=0.0: time.sleep(timeout)
+
+mock_async_redis_client = AsyncMock()
+mock_async_redis_client.get.return_value = None
+mock_async_redis_client.setex.return_value = True
+mock_async_redis_client.set.return_value = True
+# redis.asyncio pipelines queue commands synchronously and only await execute()
+mock_async_pipeline = MagicMock()
+mock_async_pipeline.execute = AsyncMock(return_value=[])
+mock_async_redis_client.pipeline = MagicMock(return_value=mock_async_pipeline)
 
 # Patch redis before any app imports
 redis_patcher = patch('redis.from_url', return_value=mock_redis_client)
 redis_patcher.start()
+async_redis_patcher = patch('redis.asyncio.from_url', return_value=mock_async_redis_client)
+async_redis_patcher.start()
 
 import pytest
 from fastapi.testclient import TestClient
@@ -34,6 +34,33 @@ def test_health_endpoint(client):
     assert response.json() == {"status": "ok"}
 
 
+def test_ready_endpoint_turns_green_after_warm_up(client):
+    """Test that /ready reports 200 once the model has warmed up"""
+    import time
+
+    deadline = time.time() + 60
+    response = client.get("/ready")
+    while response.status_code == 503 and time.time() < deadline:
+        time.sleep(0.2)
+        response = client.get("/ready")
+
+    assert response.status_code == 200
+    assert response.json() == {"status": "ready"}
+
+
+def test_startup_diagnostics(client):
+    """Test that cold-start phase timings are reported"""
+    client.post("/analyze", json={"text": "Diagnostics check"})
+
+    response = client.get("/diagnostics/startup")
+    assert response.status_code == 200
+
+    data = response.json()
+    assert data["state"] in ["loaded", "warming_up", "ready"]
+    assert data["weight_load_ms"] is not None
+    assert "first_forward_ms" in data
+
+
 # ============================================
 # Sentiment Analysis Tests
 # ============================================
@@ -256,6 +283,197 @@ def test_response_time_reasonable(client):
     assert elapsed < 30.0, f"Response took {elapsed}s, should be < 30s"
 
 
+def test_benchmark_compare_flags_regressions():
+    """Test that benchmark comparison flags metrics that got worse beyond the tolerance"""
+    from src.benchmark import compare_results, percentile
+
+    assert percentile([5, 1, 4, 2, 3], 50) == 3
+    assert percentile([5, 1, 4, 2, 3], 99) == 5
+
+    baseline = {"results": [
+        {"concurrency": 8, "hit_ratio": 0.9, "p99_ms": 20.0, "requests_per_second": 500.0, "errors": 0},
+        {"concurrency": 32, "hit_ratio": 0.9, "p99_ms": 40.0, "requests_per_second": 800.0, "errors": 0}
+    ]}
+    current = {"results": [
+        # p99 30% slower and throughput down 20%: both regressions
+        {"concurrency": 8, "hit_ratio": 0.9, "p99_ms": 26.0, "requests_per_second": 400.0, "errors": 0},
+        # Within 10% (and faster): fine
+        {"concurrency": 32, "hit_ratio": 0.9, "p99_ms": 42.0, "requests_per_second": 900.0, "errors": 0}
+    ]}
+
+    comparison = compare_results(baseline, current, tolerance=0.1)
+
+    assert comparison["compared"] == 6
+    assert {(r["case"]["concurrency"], r["metric"]) for r in comparison["regressions"]} == {
+        (8, "p99_ms"), (8, "requests_per_second")
+    }
+
+
+# ============================================
+# Inference Backend Tests
+# ============================================
+
+def test_inference_stats_report_padding_waste(client):
+    """Test that batched inference reports length buckets and padding waste"""
+    client.post("/analyze/batch", json={"texts": ["Good", "This is a much longer review " * 10]})
+
+    response = client.get("/inference/stats")
+    assert response.status_code == 200
+
+    data = response.json()
+    assert data["max_length"] <= 512
+    assert data["length_buckets"]
+    assert 0 <= data["padding_waste_ratio"] <= data["unbucketed_padding_waste_ratio"] <= 1
+
+
+def test_parity_check_reports_agreement():
+    """Test that the parity check reports label agreement and confidence deltas"""
+    from src.inference import parity_check
+
+    class FakeBackend:
+        def __init__(self, name, flip):
+            self.name = name
+            self.flip = flip
+
+        def predict(self, texts, batch_size=None):
+            return [
+                {"label": "NEGATIVE" if text in self.flip else "POSITIVE", "score": 0.9 if self.flip else 0.95}
+                for text in texts
+            ]
+
+    corpus = ["a", "b", "c", "d"]
+    report = parity_check(FakeBackend("reference", set()), FakeBackend("candidate", {"d"}), corpus)
+
+    assert report["texts"] == 4
+    assert report["label_agreement"] == 0.75
+    assert report["disagreements"] == ["d"]
+    assert abs(report["max_confidence_delta"] - 0.05) < 1e-9
+
+
+def test_worker_pool_core_slices():
+    """Test that worker pool cores are split into contiguous per-worker slices"""
+    from src.worker_pool import split_cores
+
+    assert split_cores(2, [0, 1, 2, 3]) == [[0, 1], [2, 3]]
+    assert split_cores(3, [0, 1, 2, 3, 4]) == [[0, 1], [2, 3], [4]]
+    # More workers than cores: workers share cores one each
+    assert split_cores(3, [0, 1]) == [[0], [1], [0]]
+
+
+def test_pool_client_forgets_timed_out_calls():
+    """Test that a call the pool never answers doesn't stay pending"""
+    import itertools
+    import threading
+    from concurrent.futures import TimeoutError
+    from unittest.mock import MagicMock, patch
+    from src import worker_pool
+
+    # A client connected to a pool that never replies
+    client = worker_pool.PoolClient.__new__(worker_pool.PoolClient)
+    client._conn = MagicMock()
+    client._request_ids = itertools.count()
+    client._pending = {}
+    client._lock = threading.Lock()
+
+    with patch.object(worker_pool, "INFERENCE_POOL_TIMEOUT", 0.01):
+        with pytest.raises(TimeoutError):
+            client.predict(["No reply"])
+
+    assert client._pending == {}
+
+
+def test_pool_socket_dir_and_authkey_are_private(tmp_path):
+    """Test that the pool's socket directory and generated authkey are private to its user"""
+    import os
+    import stat
+    from unittest.mock import patch
+    from src import worker_pool
+
+    address = str(tmp_path / "pool" / "pool.sock")
+    worker_pool.private_socket_dir(address)
+    assert stat.S_IMODE(os.stat(tmp_path / "pool").st_mode) == 0o700
+
+    authkey = worker_pool.create_authkey(address)
+    assert len(authkey) == 64
+    assert stat.S_IMODE(os.stat(f"{address}.key").st_mode) == 0o600
+    restarted = worker_pool.create_authkey(address)
+    assert restarted != authkey
+
+    # Clients read the key the server wrote unless INFERENCE_POOL_AUTHKEY is set
+    with patch.object(worker_pool, "INFERENCE_POOL_AUTHKEY", b""):
+        assert worker_pool.read_authkey(address) == restarted
+        with pytest.raises(RuntimeError):
+            worker_pool.read_authkey(str(tmp_path / "missing.sock"))
+
+
+# ============================================
+# Model Registry Tests
+# ============================================
+
+def test_models_endpoint_and_unknown_pin(client):
+    """Test that the default model is listed and unknown / unloaded pins are rejected"""
+    from src.inference import MODEL_TAG
+    from src.registry import parse_registry
+
+    data = client.get("/models").json()
+    assert data["active"] == MODEL_TAG
+    assert data["models"][0]["id"] == MODEL_TAG
+
+    response = client.post("/analyze", json={"text": "Pinned to nothing", "model": "no-such-model"})
+    assert response.status_code == 404
+
+    models = parse_registry("v2=org/checkpoint")
+    assert list(models) == [MODEL_TAG, "v2"]
+    assert models["v2"] == "org/checkpoint"
+    with pytest.raises(ValueError):
+        parse_registry("bad:id=org/checkpoint")
+
+
+def test_model_hot_swap_namespaces_cache_and_rows(client):
+    """Test that activating another model switches new requests to it, keeps pins working and tags rows"""
+    import time
+    from src import cache, inference, registry
+
+    model_registry = registry.model_registry
+    model_registry.models["test-v2"] = inference.MODEL_NAME
+
+    def wait_for_swap():
+        deadline = time.time() + 60
+        while client.get("/models").json()["swap"]["state"] not in ("finished", "failed", "idle"):
+            assert time.time() < deadline
+            time.sleep(0.05)
+        return client.get("/models").json()
+
+    try:
+        assert client.post("/analyze", json={"text": "Pinned early", "model": "test-v2"}).status_code == 409
+
+        assert client.post("/models/test-v2/activate", params={"warm_limit": 0}).status_code == 202
+        data = wait_for_swap()
+        assert data["swap"]["state"] == "finished"
+        assert data["active"] == "test-v2"
+
+        text = "Hot swaps should not serve the previous model's cache"
+        response = client.post("/analyze", json={"text": text}).json()
+        assert response["model"] == "test-v2"
+
+        pinned = client.post("/analyze", json={"text": text, "model": inference.MODEL_TAG}).json()
+        assert pinned["model"] == inference.MODEL_TAG
+        assert cache.generate_cache_key(text) != cache.generate_cache_key(text, inference.MODEL_TAG)
+
+        history = client.get("/history", params={"limit": 2}).json()["analyses"]
+        assert {item["model"] for item in history} == {"test-v2", inference.MODEL_TAG}
+
+        # The active model can't be unloaded
+        assert client.delete("/models/test-v2").status_code == 409
+    finally:
+        client.post("/models/" + inference.MODEL_TAG + "/activate", params={"warm_limit": 0})
+        wait_for_swap()
+        client.delete("/models/test-v2")
+        model_registry.models.pop("test-v2", None)
+
+    assert model_registry.active_id == inference.MODEL_TAG
+
+
 # ============================================
 # API Documentation Tests
 # ============================================
@@ -274,4 +492,1041 @@ def test_openapi_json_available(client):
     schema = response.json()
     assert "openapi" in schema
     assert "info" in schema
-    assert "paths" in schema
\ No newline at end of file
+    assert "paths" in schema
+
+# ============================================
+# History Tests
+# ============================================
+
+def _insert_history_rows(prefix, timestamps):
+    """
+    Insert rows under a sentiment label unique to this run so tests can filter to them
+
+    Returns:
+        The label used
+    """
+    import uuid
+    from src.database import SessionLocal, save_analyses
+
+    label = f"{prefix}_{uuid.uuid4().hex[:8]}"
+    db = SessionLocal()
+    try:
+        save_analyses(db, [
+            {"text": f"history row {i}", "sentiment": label, "confidence": 0.5,
+             "processing_time_ms": 1, "created_at": created_at}
+            for i, created_at in enumerate(timestamps)
+        ])
+    finally:
+        db.close()
+    return label
+
+
+def test_history_keyset_pagination(client):
+    """Test that following next_cursor visits every row once, newest first"""
+    from datetime import datetime, timedelta
+
+    base = datetime(2024, 1, 1)
+    # Two rows share a timestamp - the id breaks the tie
+    label = _insert_history_rows("HISTORY_PAGING", [base, base + timedelta(seconds=1), base + timedelta(seconds=1),
+                                            base + timedelta(seconds=2), base + timedelta(seconds=3)])
+
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 2, "sentiment": label}
+        if cursor:
+            params["before"] = cursor
+        data = client.get("/history", params=params).json()
+        seen.extend(data["analyses"])
+        cursor = data["next_cursor"]
+        if cursor is None:
+            break
+
+    assert len(seen) == 5
+    assert len({item["id"] for item in seen}) == 5
+    keys = [(item["created_at"], item["id"]) for item in seen]
+    assert keys == sorted(keys, reverse=True)
+    assert data["total"] == 5
+
+
+def test_history_time_range_filter(client):
+    """Test that since/until select a created_at range"""
+    from datetime import datetime
+
+    label = _insert_history_rows("HISTORY_RANGE", [datetime(2024, 2, day) for day in (1, 2, 3, 4)])
+
+    response = client.get("/history", params={
+        "sentiment": label, "since": "2024-02-02T00:00:00", "until": "2024-02-04T00:00:00"
+    })
+
+    assert response.status_code == 200
+    assert [item["created_at"][:10] for item in response.json()["analyses"]] == ["2024-02-03", "2024-02-02"]
+
+
+def test_history_rejects_bad_cursor_and_limit(client):
+    """Test that malformed cursors and oversized pages are rejected"""
+    assert client.get("/history", params={"before": "not-a-cursor"}).status_code == 400
+    assert client.get("/history", params={"limit": 0}).status_code == 422
+    assert client.get("/history", params={"limit": 10_000}).status_code == 422
+
+
+def test_history_texts_are_stored_once(client):
+    """Test that repeated texts share one sentiment_texts row"""
+    from datetime import datetime
+    from sqlalchemy import func, select
+    from src.database import SessionLocal, SentimentAnalysis, SentimentText
+
+    label = _insert_history_rows("DEDUP", [datetime(2024, 5, 1)] * 2)
+    _insert_history_rows("DEDUP", [datetime(2024, 5, 2)])  # "history row 0" again
+
+    db = SessionLocal()
+    try:
+        text_ids = db.scalars(select(SentimentAnalysis.text_id).where(SentimentAnalysis.sentiment == label)).all()
+        texts = db.scalar(select(func.count()).select_from(SentimentText).where(SentimentText.id.in_(text_ids)))
+    finally:
+        db.close()
+
+    assert len(text_ids) == 2 and texts == 2
+    history = client.get("/history", params={"sentiment": label}).json()["analyses"]
+    assert [item["text"] for item in history] == ["history row 1", "history row 0"]
+
+
+def test_text_store_migration(tmp_path, monkeypatch):
+    """Test that the migration moves inline texts into sentiment_texts"""
+    from sqlalchemy import create_engine, text
+    from sqlalchemy.orm import sessionmaker
+    from src import migrations
+
+    legacy_engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with legacy_engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE sentiment_analyses (id INTEGER PRIMARY KEY, text VARCHAR(512) NOT NULL, "
+            "sentiment VARCHAR(50) NOT NULL, confidence FLOAT NOT NULL, processing_time_ms INTEGER NOT NULL, "
+            "created_at DATETIME NOT NULL)"
+        ))
+        conn.execute(text(
+            "INSERT INTO sentiment_analyses (text, sentiment, confidence, processing_time_ms, created_at) "
+            "VALUES (:text, 'POSITIVE', 0.9, 5, '2024-01-01 00:00:00.000000')"
+        ), [{"text": t} for t in ["same text"] * 3 + ["other text"]])
+
+    monkeypatch.setattr(migrations, "engine", legacy_engine)
+    monkeypatch.setattr(migrations, "SessionLocal", sessionmaker(bind=legacy_engine))
+
+    report = migrations.migrate_text_store(batch_size=3)
+
+    assert report["rows"] == 4
+    assert report["distinct_texts"] == 2
+    assert report["duplication_ratio"] == 2.0
+    assert migrations.migrate_text_store()["status"] == "already migrated"
+    with legacy_engine.connect() as conn:
+        joined = conn.execute(text(
+            "SELECT t.text FROM sentiment_analyses a JOIN sentiment_texts t ON t.id = a.text_id ORDER BY a.id"
+        )).scalars().all()
+    assert joined == ["same text"] * 3 + ["other text"]
+
+
+# ============================================
+# Analytics Tests
+# ============================================
+
+def test_analytics_buckets_from_rollups(client):
+    """Test that persisted rows are counted in their hour buckets"""
+    from datetime import datetime
+
+    label = _insert_history_rows("ANALYTICS", [
+        datetime(2024, 3, 1, 10, 5), datetime(2024, 3, 1, 10, 40), datetime(2024, 3, 1, 12, 0)
+    ])
+
+    response = client.get("/analytics", params={
+        "since": "2024-03-01T10:00:00", "until": "2024-03-01T13:00:00",
+        "granularity": "hour", "sentiment": label
+    })
+
+    assert response.status_code == 200
+    data = response.json()
+    assert [bucket["count"] for bucket in data["buckets"]] == [2, 0, 1]
+    assert data["buckets"][0]["avg_confidence"] == 0.5
+    assert data["buckets"][1]["avg_confidence"] is None
+    assert data["totals"] == {label: {"count": 3, "avg_confidence": 0.5}}
+
+
+def test_analytics_rebuild_matches_incremental(client):
+    """Test that rebuilding rollups from the raw table gives the same answer"""
+    from datetime import datetime
+    from src.analytics import rebuild_rollups
+    from src.database import SessionLocal
+
+    label = _insert_history_rows("REBUILD", [datetime(2024, 4, 2, 8, 15), datetime(2024, 4, 2, 8, 45)])
+    params = {"since": "2024-04-02T00:00:00", "until": "2024-04-03T00:00:00", "sentiment": label}
+    before = client.get("/analytics", params=params).json()
+
+    db = SessionLocal()
+    try:
+        report = rebuild_rollups(db, since=datetime(2024, 4, 2))
+    finally:
+        db.close()
+
+    assert report["rollup_rows"]["day"] >= 1
+    assert client.get("/analytics", params=params).json() == before
+    assert before["granularity"] == "hour"
+    assert before["totals"][label]["count"] == 2
+
+
+def test_analytics_rejects_oversized_ranges(client):
+    """Test that ranges needing too many buckets are rejected"""
+    response = client.get("/analytics", params={
+        "since": "2020-01-01T00:00:00", "until": "2024-01-01T00:00:00", "granularity": "minute"
+    })
+    assert response.status_code == 400
+
+
+# ============================================
+# Batch Analysis Tests
+# ============================================
+
+def test_analyze_batch_preserves_input_order(client):
+    """Test that batch results come back in input order, duplicates included"""
+    texts = [
+        "I absolutely love this product!",
+        "This is terrible, horrible, and awful.",
+        "I absolutely love this product!"
+    ]
+    response = client.post("/analyze/batch", json={"texts": texts})
+
+    assert response.status_code == 200
+    data = response.json()
+
+    assert data["total"] == 3
+    assert [item["text"] for item in data["results"]] == texts
+    assert data["results"][0]["sentiment"] == data["results"][2]["sentiment"]
+    for item in data["results"]:
+        assert item["sentiment"] in ["POSITIVE", "NEGATIVE"]
+        assert 0 <= item["confidence"] <= 1
+        assert "cached" in item
+
+
+def test_analyze_batch_validation(client):
+    """Test that empty batches and invalid items are rejected"""
+    assert client.post("/analyze/batch", json={"texts": []}).status_code == 422
+    assert client.post("/analyze/batch", json={"texts": [""]}).status_code == 422
+    assert client.post("/analyze/batch", json={"texts": ["a" * 513]}).status_code == 422
+
+
+
+# ============================================
+# Long Text Tests
+# ============================================
+
+def test_analyze_long_text_windows_and_chunk_cache(client):
+    """Test that long documents are split into overlapping windows and windows are reused"""
+    from src import long_text
+
+    document = " ".join(f"Sentence {i} says the product is really quite good." for i in range(300))
+    payload = {"text": document, "aggregation": "length_weighted", "return_chunks": True}
+
+    response = client.post("/analyze/long", json=payload)
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["chunks"] > 1
+    assert data["sentiment"] in ["POSITIVE", "NEGATIVE"]
+    chunks = data["chunk_results"]
+    assert len(chunks) == data["chunks"]
+    assert chunks[0]["start_token"] == 0 and chunks[-1]["end_token"] == data["tokens"]
+    # Consecutive windows overlap
+    assert chunks[1]["start_token"] == chunks[0]["end_token"] - long_text.LONG_TEXT_OVERLAP_TOKENS
+
+    again = client.post("/analyze/long", json={**payload, "return_chunks": False}).json()
+    assert again["cached"] is True
+    assert again["cached_chunks"] == data["chunks"]
+    assert "chunk_results" not in again
+    assert again["sentiment"] == data["sentiment"]
+
+
+def test_analyze_long_text_rejects_too_many_windows(client):
+    """Test that a document needing more than LONG_TEXT_MAX_WINDOWS windows gets 413"""
+    from unittest.mock import patch
+    from src import long_text
+
+    document = " ".join(f"Sentence {i} says the product is really quite good." for i in range(300))
+
+    with patch.object(long_text, "LONG_TEXT_MAX_WINDOWS", 1):
+        response = client.post("/analyze/long", json={"text": document})
+
+    assert response.status_code == 413
+    assert "limit is 1" in response.json()["detail"]
+
+
+def test_long_text_aggregations():
+    """Test mean, length-weighted and max aggregation of window probabilities"""
+    import numpy as np
+    from src.long_text import aggregate
+
+    probabilities = np.array([[0.9, 0.1], [0.4, 0.6], [0.2, 0.8]])
+    lengths = [510, 510, 10]
+
+    assert np.allclose(aggregate(probabilities, lengths, "mean"), [0.5, 0.5])
+    assert aggregate(probabilities, lengths, "length_weighted")[0] > 0.6
+    assert np.allclose(aggregate(probabilities, lengths, "max"), [0.9, 0.1])
+    # No content tokens at all: weighting falls back to the plain mean
+    assert np.allclose(aggregate(probabilities, [0, 0, 0], "length_weighted"), [0.5, 0.5])
+
+
+def test_analyze_long_whitespace_only_text(client):
+    """Test that a document without tokens is scored instead of failing length-weighted aggregation"""
+    response = client.post("/analyze/long", json={"text": "   \n\t ", "aggregation": "length_weighted"})
+
+    assert response.status_code == 200
+    assert response.json()["tokens"] == 0
+
+
+# ============================================
+# Streaming Tests
+# ============================================
+
+def test_analyze_stream_ndjson(client):
+    """Test that each NDJSON line gets a result with its id, then a summary"""
+    import json
+
+    body = "\n".join([
+        '{"id": "a", "text": "I love this!"}',
+        '{"id": "b", "text": ""}',
+        '"Bare JSON string line"',
+        "not json",
+        '{"id": 7, "text": "I love this!"}'
+    ]) + "\n"
+    response = client.post(
+        "/analyze/stream", content=body, headers={"Content-Type": "application/x-ndjson"}
+    )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+
+    records = [json.loads(line) for line in response.text.splitlines()]
+    results, summary = records[:-1], records[-1]["summary"]
+
+    assert [r["line"] for r in results] == [1, 2, 3, 4, 5]
+    assert [r["id"] for r in results] == ["a", "b", None, None, 7]
+    assert "error" in results[1] and "error" in results[3]
+    assert results[0]["sentiment"] == results[4]["sentiment"]
+    assert results[0]["sentiment"] in ["POSITIVE", "NEGATIVE"]
+
+    assert summary["lines"] == 5
+    assert summary["scored"] == 3
+    assert summary["errors"] == 2
+    assert "lines_per_second" in summary
+
+
+def test_analyze_stream_plain_text(client):
+    """Test that text/plain bodies are scored one line per text"""
+    import json
+
+    response = client.post(
+        "/analyze/stream",
+        content="First line\r\n\nSecond line",
+        headers={"Content-Type": "text/plain"}
+    )
+
+    records = [json.loads(line) for line in response.text.splitlines()]
+    assert [r["line"] for r in records[:-1]] == [1, 2]
+    assert records[-1]["summary"]["scored"] == 2
+
+
+def test_iter_lines_splits_across_chunks():
+    """Test that lines split across body chunks are reassembled"""
+    import asyncio
+    from src.streaming import iter_lines
+
+    async def body():
+        for data in [b"ab", b"c\nde", b"f\n\n", b"gh"]:
+            yield data
+
+    async def collect():
+        return [line async for line in iter_lines(body())]
+
+    assert asyncio.run(collect()) == [b"abc", b"def", b"gh"]
+
+
+# ============================================
+# Offline Scoring Tests
+# ============================================
+
+def test_score_file_resumes_from_checkpoint(tmp_path):
+    """Test that a rerun after a kill truncates partial output and resumes"""
+    import json
+    from src.score_file import score_file
+
+    input_path = tmp_path / "in.jsonl"
+    output_path = tmp_path / "out.jsonl"
+    input_path.write_text("".join(
+        json.dumps({"id": f"r{i}", "text": "" if i == 3 else f"Offline row {i}"}) + "\n" for i in range(5)
+    ))
+
+    summary = score_file(str(input_path), str(output_path), id_column="id", chunk_size=2, workers=0, use_cache=False)
+    assert summary["rows"] == 5
+    assert summary["errors"] == 1
+    complete_output = output_path.read_text()
+
+    # Simulate a job killed after its first chunk, mid-way through writing the second
+    first_chunk = "".join(complete_output.splitlines(keepends=True)[:2])
+    checkpoint_path = tmp_path / "out.jsonl.checkpoint"
+    checkpoint = json.loads(checkpoint_path.read_text())
+    checkpoint.update({"rows_done": 2, "output_bytes": len(first_chunk.encode()), "errors": 0})
+    del checkpoint["complete"], checkpoint["summary"]
+    checkpoint_path.write_text(json.dumps(checkpoint))
+    output_path.write_text(first_chunk + '{"row": 2, "id": "r2", "sent')
+
+    summary = score_file(str(input_path), str(output_path), id_column="id", chunk_size=2, workers=0, use_cache=False)
+    assert summary["rows_this_run"] == 3
+    assert output_path.read_text() == complete_output
+
+
+def test_score_file_reports_non_object_jsonl_rows(tmp_path):
+    """Test that JSONL lines that aren't objects become error rows instead of stopping the job"""
+    import json
+    from src.score_file import score_file
+
+    input_path = tmp_path / "in.jsonl"
+    output_path = tmp_path / "out.jsonl"
+    input_path.write_text('{"text": "Offline object row"}\n"bare string"\n42\n["a", "list"]\n')
+
+    summary = score_file(str(input_path), str(output_path), chunk_size=2, workers=0, use_cache=False)
+    assert summary["rows"] == 4
+    assert summary["errors"] == 3
+
+    records = [json.loads(line) for line in output_path.read_text().splitlines()]
+    assert "sentiment" in records[0]
+    assert [record["row"] for record in records if "error" in record] == [1, 2, 3]
+
+
+def test_score_file_reports_malformed_jsonl_and_keeps_existing_output(tmp_path):
+    """Test that undecodable JSONL lines become error rows and an unrelated output isn't overwritten"""
+    import json
+    from src.score_file import score_file
+
+    input_path = tmp_path / "in.jsonl"
+    output_path = tmp_path / "out.jsonl"
+    input_path.write_text('{"text": "Offline object row"}\n{"text": "cut off\n')
+    output_path.write_text("results of another job\n")
+
+    with pytest.raises(ValueError, match="--restart"):
+        score_file(str(input_path), str(output_path), workers=0, use_cache=False)
+    assert output_path.read_text() == "results of another job\n"
+
+    summary = score_file(str(input_path), str(output_path), workers=0, use_cache=False, restart=True)
+    assert summary["rows"] == 2
+    assert summary["errors"] == 1
+    records = [json.loads(line) for line in output_path.read_text().splitlines()]
+    assert [record["row"] for record in records if "error" in record] == [1]
+
+
+def test_score_file_reads_upper_case_tsv(tmp_path):
+    """Test that the tab dialect is picked regardless of the extension's case"""
+    from src.score_file import read_rows
+
+    input_path = tmp_path / "IN.TSV"
+    input_path.write_text("id\ttext\nr0\tTabs, not commas\n")
+
+    assert list(read_rows(str(input_path), "csv", "text", "id")) == [(0, "r0", "Tabs, not commas")]
+
+
+# ============================================
+# Cache Tests
+# ============================================
+
+def test_cache_stats_report_tiers(client):
+    """Test that cache stats include per-tier hit/miss counters"""
+    response = client.get("/cache/stats")
+
+    assert response.status_code == 200
+    tiers = response.json()["tiers"]
+    for field in ["l1_hits", "l1_misses", "redis_hits", "redis_misses", "l1_entries"]:
+        assert field in tiers, f"Missing field: {field}"
+
+
+def test_clear_cache_endpoint(client):
+    """Test that clearing the cache succeeds without scanning keys"""
+    response = client.delete("/cache/clear")
+
+    assert response.status_code == 200
+    assert response.json() == {"message": "Cache cleared successfully"}
+
+
+def test_stale_keys_detected_by_generation():
+    """Test which keys the background sweep removes after a clear"""
+    from src.cache import _is_stale_key
+
+    assert _is_stale_key("sentiment:1:abc123", generation=2)
+    assert _is_stale_key("sentiment:1:count:29000000", generation=2)
+    assert _is_stale_key("sentiment:0123456789abcdef", generation=2)  # pre-generation key
+    assert not _is_stale_key("sentiment:2:abc123", generation=2)
+    assert not _is_stale_key("sentiment:generation", generation=2)
+    assert not _is_stale_key("sentiment:invalidate", generation=2)
+
+
+def test_compact_cache_value_round_trip():
+    """Test the compact cache format and the JSON fallback for labels without a byte id"""
+    import json
+    from src.cache import encode_result, decode_result
+
+    encoded = encode_result({
+        "text": "I love this product!",
+        "sentiment": "POSITIVE",
+        "confidence": 0.9998,
+        "processing_time_ms": 85,
+        "cached": False,
+        "model": "distilbert-sst2"
+    })
+    assert len(encoded) == 7 + len("distilbert-sst2")
+
+    decoded = decode_result(encoded, "I love this product!")
+    assert decoded["text"] == "I love this product!"
+    assert decoded["sentiment"] == "POSITIVE"
+    assert decoded["confidence"] == 0.9998
+    assert decoded["model"] == "distilbert-sst2"
+
+    fallback = encode_result({"text": "meh", "sentiment": "NEUTRAL", "confidence": 0.6, "model": "three-way"})
+    assert json.loads(fallback)["sentiment"] == "NEUTRAL"
+    assert decode_result(fallback, "meh")["sentiment"] == "NEUTRAL"
+
+
+def test_local_cache_lru_and_ttl():
+    """Test that the L1 cache evicts least recently used and expired entries"""
+    from src.cache import LocalCache
+
+    local = LocalCache(max_entries=2, ttl_seconds=60)
+    local.set("a", {"sentiment": "POSITIVE"})
+    local.set("b", {"sentiment": "NEGATIVE"})
+    local.get("a")                      # "b" is now least recently used
+    local.set("c", {"sentiment": "POSITIVE"})
+
+    assert local.get("b") is None
+    assert local.get("a") == {"sentiment": "POSITIVE"}
+    assert local.evictions == 1
+
+    # Returned dicts are copies
+    local.get("a")["cached"] = True
+    assert "cached" not in local.get("a")
+
+    expired = LocalCache(max_entries=2, ttl_seconds=0)
+    expired.set("a", {"sentiment": "POSITIVE"})
+    assert expired.get("a") is None
+
+
+def test_normalize_text_folds_case_and_punctuation():
+    """Test that normalization folds case/punctuation/whitespace but keeps symbols"""
+    from src.near_duplicates import normalize_text
+
+    assert normalize_text("I love this product!") == normalize_text("i love   this product !!")
+    assert normalize_text("Great 😍") != normalize_text("Great 😡")
+    assert normalize_text("Costs $5") == "costs $5"
+
+
+def test_normalization_keeps_emoticons_and_skips_short_texts():
+    """Test that emoticons keep their own normalized keys and short texts skip the second-chance tiers"""
+    from src import near_duplicates
+    from src.near_duplicates import normalize_text, normalized_cache_key
+
+    assert normalized_cache_key(normalize_text(":)")) != normalized_cache_key(normalize_text(":("))
+    assert normalize_text("good :))") == normalize_text("Good :)") != normalize_text("good :(")
+    assert normalize_text("Fine.") != normalize_text("Fine?!")
+
+    near_duplicates.remember_many([("good :)", {"sentiment": "POSITIVE", "confidence": 0.99})])
+    assert near_duplicates.lookup_many(["Good :)", "..."]) == [(None, None), (None, None)]
+
+
+def test_near_duplicate_lookup_reuses_similar_result():
+    """Test that a near-identical text reuses a remembered result and unrelated texts miss"""
+    from src import near_duplicates
+
+    original = "The delivery was quick and the staff were lovely, would order from them again"
+    near_duplicates.remember_many([(original, {
+        "text": original, "sentiment": "POSITIVE", "confidence": 0.98, "model": "test"
+    })])
+
+    [(result, match), (missed, no_match)] = near_duplicates.lookup_many([
+        "The delivery was quick and the staff were lovely - would order from them again!!",
+        "Completely unrelated text about a broken washing machine"
+    ])
+
+    assert match in ("normalized", "near_duplicate")
+    assert result["sentiment"] == "POSITIVE"
+    assert result["text"].startswith("The delivery")
+    assert missed is None and no_match is None
+
+    near_duplicates.record_verification(match, "POSITIVE", "NEGATIVE")
+    stats = near_duplicates.get_stats()
+    assert stats["inference_saved"] >= 1
+    assert stats["disagreements"] >= 1
+
+
+def test_cache_warm_endpoint_reports_status(client):
+    """Test that a warm-up can be started and its report polled"""
+    import time
+
+    response = client.post("/cache/warm", params={"limit": 10, "strategy": "recent"})
+    assert response.status_code in (202, 409)
+
+    deadline = time.time() + 30
+    while client.get("/cache/warm").json()["state"] in ("starting", "running"):
+        assert time.time() < deadline
+        time.sleep(0.05)
+
+    report = client.get("/cache/warm").json()
+    for field in ["selected", "already_cached", "warmed", "elapsed_ms"]:
+        assert field in report, f"Missing field: {field}"
+
+    assert client.post("/cache/warm", params={"strategy": "random"}).status_code == 422
+
+
+def test_cache_warmer_scores_only_uncached_texts(client):
+    """Test that warming re-scores texts missing from Redis and skips cached ones"""
+    from unittest.mock import patch
+    import fakeredis
+    from src import cache, warming
+    from src.database import SessionLocal
+
+    texts = ["Warm me: the soup was excellent", "Warm me: the service was painfully slow"]
+    client.post("/analyze/batch", json={"texts": texts})
+
+    with patch.object(cache, "redis_client", fakeredis.FakeRedis()):
+        cache.cache_result(texts[0], {"text": texts[0], "sentiment": "POSITIVE", "confidence": 0.99, "model": "test"})
+
+        warmer = warming.CacheWarmer(SessionLocal, texts_per_second=0)
+        report = warmer.run(limit=1000, strategy="recent")
+
+        assert report["state"] == "finished"
+        assert report["selected"] >= 2
+        assert report["warmed"] == report["selected"] - report["already_cached"]
+        assert cache.redis_client.exists(cache.generate_cache_key(texts[1]))
+
+        # Everything is cached now
+        again = warmer.run(limit=1000, strategy="recent")
+        assert again["warmed"] == 0
+        assert again["already_cached"] == again["selected"]
+
+
+def test_warm_selection_keeps_the_top_ranked_texts(tmp_path):
+    """Test that each strategy keeps its best-ranked texts when there are more than limit"""
+    from datetime import datetime, timedelta
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from src.database import Base, save_analyses
+    from src.warming import select_texts
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'warm.db'}")
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+
+    start = datetime.utcnow() - timedelta(hours=1)
+    # Analyses per text, oldest text first: "rare" is analyzed last
+    counts = {"frequent": 4, "common": 3, "middling": 2, "rare": 1}
+    minute = 0
+    for text, count in counts.items():
+        for _ in range(count):
+            minute += 1
+            save_analyses(db, [{
+                "text": text, "sentiment": "POSITIVE", "confidence": 0.9,
+                "processing_time_ms": 1, "created_at": start + timedelta(minutes=minute)
+            }])
+
+    try:
+        assert select_texts(db, 2, "frequent") == ["frequent", "common"]
+        assert select_texts(db, 2, "recent") == ["rare", "middling"]
+        # Half the limit from frequency, the rest from recency
+        assert select_texts(db, 2, "mixed") == ["frequent", "rare"]
+    finally:
+        db.close()
+        engine.dispose()
+
+
+# ============================================
+# Request Coalescing Tests
+# ============================================
+
+def test_coalescing_stats_available(client):
+    """Test that coalescing statistics are exposed"""
+    response = client.get("/coalescing/stats")
+
+    assert response.status_code == 200
+    data = response.json()
+    assert "coalesced_local" in data
+    assert "in_flight" in data
+
+
+def test_single_flight_shares_concurrent_calls():
+    """Test that concurrent calls with the same key run the work once"""
+    import asyncio
+    from src.coalescing import SingleFlight
+
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"sentiment": "POSITIVE"}
+
+    async def run():
+        flight = SingleFlight()
+        return await asyncio.gather(*[flight.do("same-key", work) for _ in range(5)])
+
+    results = asyncio.run(run())
+
+    assert len(calls) == 1
+    assert all(result == {"sentiment": "POSITIVE"} for result, _ in results)
+    assert sum(shared for _, shared in results) == 4
+
+
+def test_single_flight_follower_retries_after_leader_is_shed():
+    """Test that a follower runs its own attempt when the leader failed on its own limits"""
+    import asyncio
+    from src.admission import OverloadedError
+    from src.coalescing import SingleFlight
+
+    async def shed_leader():
+        await asyncio.sleep(0.05)
+        raise OverloadedError("Overloaded: batch priority", 1)
+
+    async def follower():
+        return {"sentiment": "POSITIVE"}
+
+    async def run():
+        flight = SingleFlight()
+        return await asyncio.gather(
+            flight.do("same-key", shed_leader, retry_on=(OverloadedError,)),
+            flight.do("same-key", follower, retry_on=(OverloadedError,)),
+            return_exceptions=True
+        )
+
+    leader, follower_result = asyncio.run(run())
+
+    assert isinstance(leader, OverloadedError)
+    assert follower_result == ({"sentiment": "POSITIVE"}, False)
+
+
+def test_wait_for_result_stops_at_the_caller_deadline():
+    """Test that polling for another worker's result gives up at the request deadline"""
+    import asyncio
+    import time
+    from unittest.mock import AsyncMock, patch
+    from src import cache, coalescing
+
+    with patch.object(cache, "get_cached_result_async", AsyncMock(return_value=None)):
+        started = time.perf_counter()
+        result = asyncio.run(coalescing.wait_for_result("Nobody answers", deadline=time.perf_counter() + 0.05))
+
+    assert result is None
+    assert time.perf_counter() - started < coalescing.COALESCE_LOCK_TTL_MS / 1000 / 2
+
+
+# ============================================
+# Micro-batching Tests
+# ============================================
+
+def test_batching_stats_available(client):
+    """Test that batching statistics are exposed"""
+    client.post("/analyze", json={"text": "Batching stats check"})
+
+    response = client.get("/batching/stats")
+    assert response.status_code == 200
+
+    data = response.json()
+    assert data["batches"] >= 1
+    assert "queue_depth" in data
+    assert "batch_size_histogram" in data
+    assert set(data["flush_reasons"]) == {"full", "deadline"}
+
+
+def test_batcher_resolves_each_text_with_own_result():
+    """Test that concurrently queued texts each get their own result"""
+    from src.batching import MicroBatcher
+
+    def fake_model(texts):
+        return [{"label": "POSITIVE", "score": len(t)} for t in texts]
+
+    batcher = MicroBatcher(fake_model, max_size=4, max_wait_ms=50)
+    futures = [batcher.submit("x" * n) for n in range(1, 9)]
+    results = [f.result(timeout=5) for f in futures]
+    batcher.stop()
+
+    assert [r["score"] for r in results] == list(range(1, 9))
+    assert batcher.get_stats()["flush_reasons"]["full"] >= 1
+
+
+def test_batcher_fails_every_text_when_results_are_short():
+    """Test that a model returning too few results fails the batch instead of hanging"""
+    from src.batching import MicroBatcher
+
+    def short_model(texts):
+        return [{"label": "POSITIVE", "score": 1.0}]
+
+    batcher = MicroBatcher(short_model, max_size=4, max_wait_ms=50)
+    futures = [batcher.submit(f"text {n}") for n in range(3)]
+    for future in futures:
+        with pytest.raises(RuntimeError):
+            future.result(timeout=5)
+    batcher.stop()
+
+    assert batcher.get_stats()["errors"] >= 1
+
+
+# ============================================
+# Admission Control Tests
+# ============================================
+
+def test_batcher_drops_texts_past_their_deadline():
+    """Test that a text whose deadline passed while queued never reaches the model"""
+    import time
+    from src.batching import DeadlineExceededError, MicroBatcher
+
+    seen = []
+
+    def fake_model(texts):
+        seen.extend(texts)
+        return [{"label": "POSITIVE", "score": 1.0} for _ in texts]
+
+    batcher = MicroBatcher(fake_model, max_size=4, max_wait_ms=20)
+    expired = batcher.submit("too late", deadline=time.perf_counter() - 1)
+    live = batcher.submit("in time", deadline=time.perf_counter() + 60)
+
+    with pytest.raises(DeadlineExceededError):
+        expired.result(timeout=5)
+    assert live.result(timeout=5)["label"] == "POSITIVE"
+    batcher.stop()
+
+    assert seen == ["in time"]
+    assert batcher.get_stats()["expired"] == 1
+
+
+def test_overload_sheds_batch_first_and_degrades_to_stored_result(client):
+    """Test 503 + Retry-After under overload, and the stored answer for a text seen before"""
+    from src.admission import LatencyRecorder
+    from src.database import SessionLocal, save_analyses
+    from src.main import admission_controller
+    from src.registry import active_model_id
+
+    def recorder(per_text):
+        latency = LatencyRecorder()
+        latency.record_inference(1, per_text)
+        return latency
+
+    # Analyzed earlier but no longer cached (the second text only by another model)
+    seen_text = "Admission control degraded answer"
+    other_model_text = "Admission control answer from another model"
+    db = SessionLocal()
+    try:
+        save_analyses(db, [
+            {"text": seen_text, "sentiment": "NEGATIVE", "confidence": 0.8, "model": active_model_id(), "processing_time_ms": 5},
+            {"text": other_model_text, "sentiment": "POSITIVE", "confidence": 0.9, "model": "other-model", "processing_time_ms": 5}
+        ])
+    finally:
+        db.close()
+
+    latency, enabled = admission_controller.latency, admission_controller.enabled
+    admission_controller.enabled = True
+    # One text in flight at 0.75s per text: above the batch share of a 1s target, below the full target
+    admission_controller.latency = recorder(0.75)
+    admission_controller.admit(1, "interactive")
+    try:
+        response = client.post("/analyze/batch", json={"texts": ["Shed batch text"]})
+        assert response.status_code == 503
+        assert int(response.headers["Retry-After"]) >= 1
+
+        response = client.post("/analyze", json={"text": "Admitted interactive text"})
+        assert response.status_code == 200
+        assert response.json()["degraded"] is False
+
+        # Past the interactive target too
+        admission_controller.latency = recorder(5.0)
+        response = client.post("/analyze", json={"text": "Never analyzed before, shed"})
+        assert response.status_code == 503
+        assert int(response.headers["Retry-After"]) >= 5
+
+        response = client.post("/analyze", json={"text": seen_text})
+        assert response.status_code == 200
+        assert response.json()["degraded"] is True
+        assert response.json()["sentiment"] == "NEGATIVE"
+        assert response.json()["model"] == active_model_id()
+
+        response = client.post("/analyze", json={"text": other_model_text})
+        assert response.status_code == 503
+
+        # A deadline the predicted wait already exceeds is refused even when admission is off
+        admission_controller.enabled = False
+        response = client.post("/analyze", json={"text": "Short deadline text", "deadline_ms": 100})
+        assert response.status_code == 503
+    finally:
+        admission_controller.release(1)
+        admission_controller.latency, admission_controller.enabled = latency, enabled
+
+    stats = client.get("/admission/stats").json()
+    assert stats["in_flight"] == 0
+    assert stats["decisions"]["batch"]["shed"] >= 1
+    assert stats["decisions"]["interactive"]["degraded"] >= 1
+
+
+def test_long_text_windows_go_through_admission(client):
+    """Test that /analyze/long is shed under overload and counts its windows in flight"""
+    from src.admission import LatencyRecorder
+    from src.main import admission_controller
+
+    document = " ".join(f"Sentence {i} says admission covers long documents." for i in range(200))
+    latency, enabled = admission_controller.latency, admission_controller.enabled
+    admission_controller.latency = LatencyRecorder()
+    try:
+        response = client.post("/analyze/long", json={"text": document})
+        assert response.status_code == 200
+        assert admission_controller.latency.recent()[1] > 0
+        assert admission_controller.get_stats()["in_flight"] == 0
+
+        # 5s per text with one text in flight: far past the target
+        admission_controller.enabled = True
+        admission_controller.latency = LatencyRecorder()
+        admission_controller.latency.record_inference(1, 5.0)
+        admission_controller.admit(1, "interactive")
+        try:
+            response = client.post("/analyze/long", json={"text": document + " A new ending.", "priority": "batch"})
+            assert response.status_code == 503
+            assert int(response.headers["Retry-After"]) >= 1
+        finally:
+            admission_controller.release(1)
+    finally:
+        admission_controller.latency, admission_controller.enabled = latency, enabled
+
+
+def test_batch_scoring_feeds_the_latency_estimate(client):
+    """Test that inference outside the micro-batcher counts toward the predicted wait"""
+    from src.admission import LatencyRecorder
+    from src.main import admission_controller
+
+    latency = admission_controller.latency
+    admission_controller.latency = LatencyRecorder()
+    try:
+        response = client.post("/analyze/batch", json={"texts": ["Latency feed one", "Latency feed two"]})
+        assert response.status_code == 200
+        assert admission_controller.latency.recent()[1] > 0
+
+        # Batch-only traffic now predicts a wait once texts are in flight
+        admission_controller.admit(3, "batch")
+        try:
+            assert admission_controller.get_stats()["predicted_wait_ms"] > 0
+        finally:
+            admission_controller.release(3)
+    finally:
+        admission_controller.latency = latency
+
+
+# ============================================
+# Write-behind Persistence Tests
+# ============================================
+
+def test_persistence_stats_available(client):
+    """Test that persistence statistics are exposed"""
+    response = client.get("/persistence/stats")
+
+    assert response.status_code == 200
+    assert "enabled" in response.json()
+
+
+def test_write_behind_drains_on_stop():
+    """Test that queued rows are flushed in batches and drained on shutdown"""
+    from src.database import SessionLocal, SentimentAnalysis
+    from src.write_behind import WriteBehindQueue
+
+    writer = WriteBehindQueue(SessionLocal, batch_size=2, flush_ms=1000)
+    for i in range(5):
+        assert writer.enqueue({
+            "text": f"write-behind row {i}",
+            "sentiment": "POSITIVE",
+            "confidence": 0.9,
+            "processing_time_ms": 1
+        })
+    writer.stop()
+
+    stats = writer.get_stats()
+    assert stats["written"] == 5
+    assert stats["queue_depth"] == 0
+
+    db = SessionLocal()
+    try:
+        count = db.query(SentimentAnalysis)\
+            .filter(SentimentAnalysis.text.like("write-behind row %"))\
+            .count()
+    finally:
+        db.close()
+    assert count >= 5
+
+
+# ============================================
+# Connection Pool Tests
+# ============================================
+
+def test_database_stats_report_pool_usage(client):
+    """Test that pool checkouts and saturation are exposed per engine"""
+    client.get("/history?limit=1")
+
+    response = client.get("/database/stats")
+
+    assert response.status_code == 200
+    data = response.json()
+    for engine_stats in (data["sync"], data["async"]):
+        assert "saturation" in engine_stats
+        assert "wait_histogram" in engine_stats
+    assert data["sync"]["checkouts"] >= 1
+    assert data["sync"]["checked_out"] == 0
+
+
+def test_bulk_writes_use_psycopg_pipeline_mode():
+    """Test that bulk writes enter pipeline mode on drivers that have it and run as is elsewhere"""
+    from unittest.mock import MagicMock
+    from src.database import SessionLocal, _pipeline
+
+    db = MagicMock()
+    driver_connection = db.connection.return_value.connection.driver_connection
+    with _pipeline(db):
+        driver_connection.pipeline.return_value.__enter__.assert_called_once()
+    driver_connection.pipeline.return_value.__exit__.assert_called_once()
+
+    # sqlite3 has no pipeline mode
+    with SessionLocal() as db, _pipeline(db):
+        pass
+
+
+# ============================================
+# Metrics & Logging Tests
+# ============================================
+
+def test_metrics_endpoint_reports_stages(client):
+    """Test that /metrics exposes per-stage histograms and request counters"""
+    client.post("/analyze", json={"text": "Metrics should time every stage of this request"})
+
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    for stage in ("validation", "cache_get", "serialization"):
+        assert f'sentiment_stage_seconds_count{{stage="{stage}"}}' in body
+    assert 'sentiment_requests_total{route="/analyze",status="200"}' in body
+    assert "sentiment_cache_lookups_total" in body
+    assert "sentiment_in_flight_requests" in body
+
+
+def test_log_sampled_respects_rate():
+    """Test that sampled events are dropped at rate 0 and all kept at rate 1"""
+    import logging
+    from src.logs import get_logger, log_sampled
+
+    logger = get_logger("test")
+    records = []
+    handler = logging.Handler()
+    handler.emit = records.append
+    logger.addHandler(handler)
+    try:
+        for _ in range(20):
+            log_sampled(logger, "never", rate=0)
+            log_sampled(logger, "always", rate=1, text_length=5)
+    finally:
+        logger.removeHandler(handler)
+
+    assert [record.getMessage() for record in records] == ["always"] * 20
+    assert records[0].fields == {"sample_rate": 1, "text_length": 5}